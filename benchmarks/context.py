@@ -0,0 +1,70 @@
+"""
+Cost of creating a context and accessing it's attributes per update
+(similar to what routers and "with_storage" do).
+
+Run from the root of the repository:
+
+    python3 -m benchmarks.context
+"""
+
+import time
+
+from kutana import Context, Kutana, Message, RecipientKind
+from kutana.backends.debug import Debug
+
+UPDATES_COUNT = 200_000
+ROUNDS_COUNT = 5
+
+
+def handle(app, update, backend):
+    context = Context(app, update, backend)
+
+    # Router
+    context.prefix = "/"
+    context.command = "echo"
+    context.body = "hello"
+    context.match = None
+
+    # Plugin-defined attribute
+    context.counter = 1
+
+    # Handler (with storage)
+    for _ in range(2):
+        context.sender_unique_id
+        context.recipient_unique_id
+
+    return context.body, context.command, context.counter, context.update
+
+
+def main():
+    app = Kutana()
+    backend = Debug([], identity="debug")
+
+    update = Message(
+        sender_id=1,
+        recipient_id=2,
+        recipient_kind=RecipientKind.PRIVATE_CHAT,
+        text="/echo hello",
+        attachments=[],
+        date=0,
+        raw=None,
+    )
+
+    best = None
+
+    for _ in range(ROUNDS_COUNT):
+        started_at = time.perf_counter()
+
+        for _ in range(UPDATES_COUNT):
+            handle(app, update, backend)
+
+        elapsed = (time.perf_counter() - started_at) / UPDATES_COUNT
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    print(f"context {best * 1_000_000_000:>10.1f} ns/update")
+
+
+if __name__ == "__main__":
+    main()
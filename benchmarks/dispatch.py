@@ -0,0 +1,64 @@
+"""
+Throughput of the application's update dispatching modes.
+
+Run from the root of the repository:
+
+    python3 -m benchmarks.dispatch
+"""
+
+import asyncio
+import logging
+import time
+
+from kutana.backends.debug import Debug
+from kutana.plugin import Plugin
+
+UPDATES_COUNT = 20_000
+
+CONFIGS = [
+    {"dispatch_mode": "concurrent"},
+    {"dispatch_mode": "ordered"},
+    {"dispatch_mode": "pool", "pool_batch_size": 1},
+    {"dispatch_mode": "pool", "pool_batch_size": 16},
+]
+
+
+def make_plugin():
+    plugin = Plugin("benchmark")
+
+    @plugin.on_commands(["ping"])
+    async def _(msg, ctx):
+        await ctx.reply("pong")
+
+    return plugin
+
+
+async def measure(config):
+    updates = [("/ping", 1, index % 1000, []) for index in range(UPDATES_COUNT)]
+
+    started_at = time.perf_counter()
+    _, backend = await Debug.handle_updates([make_plugin()], updates, config=config)
+    elapsed = time.perf_counter() - started_at
+
+    assert len(backend.messages) == UPDATES_COUNT
+
+    return UPDATES_COUNT / elapsed
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for config in CONFIGS:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        try:
+            updates_per_second = loop.run_until_complete(measure(config))
+        finally:
+            loop.close()
+
+        print(f"{str(config):<50} {updates_per_second:>10.0f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
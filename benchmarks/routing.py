@@ -0,0 +1,112 @@
+"""
+Per-update overhead of routing with 1k registered handlers and with
+500 "on_match" handlers (every handler skips the update, so every
+applicable handler is visited). The "cached" case uses routing cache.
+
+Run from the root of the repository:
+
+    python3 -m benchmarks.routing
+"""
+
+import asyncio
+import time
+
+from kutana import SKIPPED, Context, Kutana, Message, Plugin, RecipientKind
+from kutana.backends.debug import Debug
+
+UPDATES_COUNT = 2_000
+ROUNDS_COUNT = 5
+
+
+def make_plugin(index):
+    plugin = Plugin(f"plugin-{index}")
+
+    async def handler(upd, ctx):
+        return SKIPPED
+
+    plugin.on_commands([f"command{index}"], priority=index % 3)(handler)
+    plugin.on_match([rf"^match{index}$"])(handler)
+    plugin.on_messages()(handler)
+    plugin.on_updates(priority=index % 2)(handler)
+    plugin.vk.on_payloads([{"command": f"command{index}"}])(handler)
+
+    return plugin
+
+
+def make_match_plugin(index):
+    plugin = Plugin(f"match-plugin-{index}")
+
+    @plugin.on_match([rf"^(?:hey|hi) there{index}$", rf"^bye{index}\b"])
+    async def _(upd, ctx):
+        return SKIPPED
+
+    return plugin
+
+
+def make_app(make_plugin, plugins_count, config=None):
+    app = Kutana()
+    app.config.update(config or {})
+
+    for index in range(plugins_count):
+        app.add_plugin(make_plugin(index))
+
+    app._prepare_routers()
+
+    return app
+
+
+async def measure(app, update):
+    context = Context(app, update, Debug([], identity="vk"))
+
+    best = None
+
+    for _ in range(ROUNDS_COUNT):
+        started_at = time.perf_counter()
+
+        for _ in range(UPDATES_COUNT):
+            await app._root_router.handle(update, context)
+
+        elapsed = (time.perf_counter() - started_at) / UPDATES_COUNT
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def make_message(text):
+    return Message(
+        sender_id=1,
+        recipient_id=1,
+        recipient_kind=RecipientKind.PRIVATE_CHAT,
+        text=text,
+        attachments=[],
+        date=0,
+        raw={"object": {"message": {}}},
+    )
+
+
+def main():
+    app = make_app(make_plugin, 200)
+    cached_app = make_app(make_plugin, 200, {"routing_cache_size": 1024})
+    match_app = make_app(make_match_plugin, 500)
+
+    cases = [
+        ("message", app, make_message("/unknown")),
+        ("raw update", app, {"type": "group_join", "object": {}}),
+        ("cached", cached_app, make_message("/unknown")),
+        ("on_match", match_app, make_message("bye250 and see you")),
+    ]
+
+    loop = asyncio.new_event_loop()
+
+    try:
+        for name, app, update in cases:
+            elapsed = loop.run_until_complete(measure(app, update))
+            print(f"{name:<12} {elapsed * 1_000_000:>10.1f} us/update")
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Time of registering plugins in the application and compiling routers
+for every backend's identity, type of update and kind of recipient
+depending on amount of plugins (every plugin has a few handlers of
+different kinds). Time of compiling routers again after handler was
+registered on the started application is measured too.
+
+Run from the root of the repository:
+
+    python3 -m benchmarks.startup
+"""
+
+import time
+
+from kutana import Kutana, Message, Plugin, RecipientKind
+
+PLUGINS_COUNTS = [10, 100, 300, 1000]
+
+IDENTITIES = ["vk", "tg"]
+
+
+def make_plugin(index):
+    plugin = Plugin(f"plugin-{index}")
+
+    async def handler(msg, ctx):
+        pass
+
+    plugin.on_commands([f"command{index}", f"alias{index}"])(handler)
+    plugin.on_match([rf"^match{index}$"], priority=index % 3)(handler)
+    plugin.on_attachments(["image"])(handler)
+    plugin.vk.on_payloads([{"command": f"command{index}"}])(handler)
+
+    return plugin
+
+
+def compile_plans(app):
+    # Plans are compiled lazily, so they are requested like for updates
+    for identity in IDENTITIES:
+        for recipient_kind in RecipientKind:
+            app._root_router.get_handlers(identity, Message, recipient_kind)
+
+        app._root_router.get_handlers(identity, dict)
+
+
+def measure(plugins_count):
+    plugins = [make_plugin(index) for index in range(plugins_count)]
+
+    started_at = time.perf_counter()
+
+    app = Kutana()
+
+    for plugin in plugins:
+        app.add_plugin(plugin)
+
+    app._prepare_routers()
+    compile_plans(app)
+
+    startup_time = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+
+    async def late_handler(msg, ctx):
+        pass
+
+    plugins[0].on_commands(["late"])(late_handler)
+    compile_plans(app)
+
+    return startup_time, time.perf_counter() - started_at
+
+
+def main():
+    for plugins_count in PLUGINS_COUNTS:
+        startup_time, recompilation_time = measure(plugins_count)
+
+        print(
+            f"{plugins_count:>5} plugins"
+            f" startup {startup_time * 1000:>10.1f} ms"
+            f" recompilation {recompilation_time * 1000:>10.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # Expose public API
 from .backend import Backend
 from .context import Context
-from .exceptions import RequestException
+from .exceptions import HandlerTimeoutException, RequestException
 from .handler import PROCESSED, SKIPPED
 from .helpers import get_path
 from .kutana import Kutana
@@ -31,6 +31,7 @@ __all__ = [
     "Backend",
     "Context",
     "get_path",
+    "HandlerTimeoutException",
     "Kutana",
     "MemoryStorage",
     "Message",
@@ -47,6 +47,13 @@ def get_parser():
         action="store_true",
         help="set logging level to debug",
     )
+    parser_run.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="amount of processes that handle updates (updates for the same recipient are always handled by the same process)",
+    )
 
     return parser
 
@@ -155,7 +162,10 @@ def run_project(args):  # noqa:C901
             raise ValueError(f'Unknown plugin config kind: "{plugin_config}"')
 
     # Run the application
-    app.run()
+    if args.workers > 1:
+        app.run_with_workers(args.workers)
+    else:
+        app.run()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,78 @@
+import time
+from contextlib import contextmanager
+
+from .tracing import get_current_span
+from .update import Message
+
+
 class Backend:
+    # Application's metrics (set by application if metrics are enabled)
+    metrics = None
+
+    # Coalescer of identical requests (set by backend if it's enabled)
+    coalescer = None
+
+    @contextmanager
+    def _observe_request(self, method):
+        """
+        Record duration of the request to application's metrics (if
+        enabled) and it's span to the active trace (if there is one).
+        Yields span of the request or None.
+        """
+
+        parent = get_current_span()
+        started_at = time.perf_counter()
+
+        try:
+            if parent is None:
+                yield None
+            else:
+                with parent.trace.span(
+                    "request", backend=self.get_identity(), method=method
+                ) as span:
+                    yield span
+        finally:
+            if self.metrics is not None:
+                self.metrics.request_duration.observe(
+                    time.perf_counter() - started_at, self.get_identity(), method
+                )
+
     def get_identity(self):
         raise NotImplementedError
 
     async def on_start(self, app):
         pass
 
+    def split_rate_limits(self, parts):
+        """
+        Called before start in every process when application is running
+        with multiple workers. Backend should divide it's rate limits by
+        "parts" (amount of workers and the process acquiring updates), so
+        processes together don't exceed limits of the API.
+        """
+
+        pass
+
+    async def on_worker_start(self, app, workers_count):
+        """
+        Called instead of "on_start" in processes that handle updates
+        when application is running with multiple workers. Backend
+        should prepare everything that is required for handling updates
+        and performing requests (but not for acquiring updates). Rate
+        limits are already divided (see "split_rate_limits").
+        """
+
+        raise NotImplementedError
+
+    async def on_drain(self, app):
+        """
+        Called when application is shutting down, after handlers finished
+        their work (or didn't in time). Backend should perform requests
+        that are still waiting in it's queues.
+        """
+
+        pass
+
     async def on_shutdown(self, app):
         pass
 
@@ -14,6 +82,22 @@ class Backend:
     async def acquire_updates(self, queue):
         raise NotImplementedError
 
+    def dump_update(self, update):
+        """
+        Return picklable representation of the update that can be
+        passed to other process and restored with "load_update".
+        """
+
+        if isinstance(update, Message):
+            return update.raw
+
+        return update
+
+    def load_update(self, data):
+        """Restore update from the value returned by "dump_update"."""
+
+        raise NotImplementedError
+
     async def send_message(self, recipient_id, text=None, attachments=None, **kwargs):
         raise NotImplementedError
 
@@ -22,7 +22,7 @@ class Debug(Backend):
         return self._identity
 
     @classmethod
-    async def handle_updates(cls, plugins, updates, identity=None):
+    async def handle_updates(cls, plugins, updates, identity=None, config=None):
         # create backend
         backend = cls(updates, identity=identity)
 
@@ -31,7 +31,7 @@ class Debug(Backend):
 
         def _update_processed():
             backend._update_processed += 1
-            if backend._update_processed >= len(backend.updates):
+            if backend._update_processed >= len(updates):
                 future.cancel()
 
         @stopper_plugin.on_completion()
@@ -45,6 +45,8 @@ class Debug(Backend):
         # create application, fill it with plugins and backends
         app = Kutana()
 
+        app.config.update(config or {})
+
         app.add_backend(backend)
 
         app.add_plugin(stopper_plugin)
@@ -76,6 +78,15 @@ class Debug(Backend):
             raw=raw,
         )
 
+    async def on_worker_start(self, app, workers_count):
+        pass
+
+    def dump_update(self, update):
+        return update
+
+    def load_update(self, data):
+        return data
+
     async def acquire_updates(self, queue):
         while self.updates:
             await queue.put((self.updates.pop(0), self))
@@ -5,8 +5,10 @@ import logging
 from functools import partial
 
 from ..backend import Backend
+from ..coalescing import RequestsCoalescer
 from ..exceptions import RequestException
 from ..helpers import create_httpx_async_client, pick_by
+from ..tracing import get_current_span
 from ..update import Attachment, AttachmentKind, Message, RecipientKind
 
 SUPPORTED_ATTACHMENT_KINDS = {
@@ -39,6 +41,8 @@ class Telegram(Backend):
         token,
         messages_per_second=29,
         api_url="https://api.telegram.org",
+        coalesced_methods=None,
+        coalescing_ttl=0.0,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -46,6 +50,9 @@ class Telegram(Backend):
         if not token:
             raise ValueError("No token provided for backend")
 
+        if coalesced_methods:
+            self.coalescer = RequestsCoalescer(coalesced_methods, coalescing_ttl)
+
         self.client = create_httpx_async_client()
 
         self.username = None
@@ -80,6 +87,15 @@ class Telegram(Backend):
 
         self.api_messages_lock = asyncio.Lock()
 
+    def split_rate_limits(self, parts):
+        self.api_messages_pause *= parts
+
+    async def on_worker_start(self, app, workers_count):
+        await self.on_start(app)
+
+    def load_update(self, data):
+        return self._make_update(data)
+
     def _is_file_like_value(self, value):
         if isinstance(value, (io.IOBase, bytes)):
             return True
@@ -94,6 +110,25 @@ class Telegram(Backend):
         return False
 
     async def request(self, method, kwargs):
+        """
+        Perform request to telegram's API. Identical requests for methods
+        from "coalesced_methods" share results (see
+        :class:`kutana.coalescing.RequestsCoalescer`).
+        """
+
+        if self.coalescer is not None:
+            return await self.coalescer.call(method, kwargs, self._request)
+
+        return await self._request(method, kwargs)
+
+    async def _request(self, method, kwargs):
+        if self.metrics is None and get_current_span() is None:
+            return await self._perform_request(method, kwargs)
+
+        with self._observe_request(method):
+            return await self._perform_request(method, kwargs)
+
+    async def _perform_request(self, method, kwargs):
         data = {}
         files = {}
 
@@ -300,5 +335,10 @@ class Telegram(Backend):
 
         return results
 
+    async def on_drain(self, app):
+        # Wait for messages that are waiting to be sent
+        async with self.api_messages_lock:
+            pass
+
     async def on_shutdown(self, app):
         await self.client.aclose()
@@ -1,9 +1,11 @@
 from .callback import VkontakteCallback
 from .extensions import VkontaktePluginExtension
 from .longpoll import VkontakteLongpoll
+from .requests_queue import RequestPriority
 
 __all__ = [
     "VkontakteCallback",
     "VkontaktePluginExtension",
     "VkontakteLongpoll",
+    "RequestPriority",
 ]
@@ -2,15 +2,28 @@ import asyncio
 import json
 import logging
 import re
+import time
+from collections import deque
 from functools import partial
 from itertools import zip_longest
 from random import random
+from typing import Optional
 
 from kutana.helpers import create_httpx_async_client
 
 from ...backend import Backend
+from ...coalescing import RequestsCoalescer
 from ...exceptions import RequestException
+from ...tracing import get_current_span
 from ...update import Attachment, AttachmentKind, Message, RecipientKind
+from .loader import BatchLoader
+from .requests_queue import RequestPriority, RequestsQueue
+from .tokens import (
+    RATE_LIMIT_REACHED_ERROR_CODE,
+    TOKEN_ERROR_CODES,
+    NoTokensException,
+    TokensPool,
+)
 
 DEFAULT_RECEIVABLE_EVENTS = {
     "message_new": 1,
@@ -59,6 +72,33 @@ DEFAULT_RECEIVABLE_EVENTS = {
     "donut_money_withdraw_error": 0,
 }
 
+# Maximum amount of calls in one "execute" request
+EXECUTE_CALLS_LIMIT = 25
+
+# Maximum rate of requests with user's token allowed by vk
+USER_TOKEN_REQUESTS_PER_SECOND = 3
+
+# Priorities of requests that are used if priority is not specified
+DEFAULT_REQUESTS_PRIORITIES = {
+    "messages.sendMessageEventAnswer": RequestPriority.HIGH,
+}
+
+
+# Keys of items' lists for methods that return them in dict
+DEFAULT_LOADERS_ITEMS_KEYS = {
+    "groups.getById": "groups",
+}
+
+
+def _get_error_code(response):
+    if isinstance(response, dict) and isinstance(response.get("error"), dict):
+        return response["error"].get("error_code")
+
+    if isinstance(response, dict):
+        return response.get("error_code")
+
+    return None
+
 
 class Vkontakte(Backend):
     def __init__(
@@ -67,22 +107,47 @@ class Vkontakte(Backend):
         requests_per_second=19,
         api_version="5.199",
         api_url="https://api.vk.com",
+        requests_retries=3,
+        user_tokens=None,
+        user_methods=(),
+        user_requests_per_second=USER_TOKEN_REQUESTS_PER_SECOND,
+        coalesced_methods=None,
+        coalescing_ttl=0.0,
     ):
-        if not token:
+        tokens = [token] if isinstance(token, str) else list(token or ())
+
+        if not tokens or not all(tokens):
             raise ValueError("No token provided for backend")
 
-        self.api_token = token
+        if user_methods and not user_tokens:
+            raise ValueError("No user tokens provided for user methods")
+
+        self.api_tokens = tokens
+        self.api_user_tokens = list(user_tokens or ())
         self.api_version = api_version
-        self.api_request_pause = 1 / requests_per_second
+        self.requests_per_second = requests_per_second
+        self.requests_retries = requests_retries
+        self.user_methods = set(user_methods)
+        self.user_requests_per_second = user_requests_per_second
+
+        if coalesced_methods:
+            self.coalescer = RequestsCoalescer(coalesced_methods, coalescing_ttl)
 
         self.client = create_httpx_async_client()
 
         self.group: dict
-        self.requests_queue: asyncio.Queue
+        self.requests_queue: RequestsQueue
         self.requests_queue_handler: asyncio.Task
+        self.tokens_pool: TokensPool
+        self.user_tokens_pool: Optional[TokensPool] = None
+        self.requests_chunks_handlers: set = set()
+        self.requests_spans: dict = {}
+        self.requests_attempts: dict = {}
+        self.requests_priorities = dict(DEFAULT_REQUESTS_PRIORITIES)
+        self.loaders: dict = {}
 
         self.api_request_url = (
-            api_url + f"/method/{{}}?access_token={token}&v={api_version}"
+            api_url + f"/method/{{}}?access_token={{}}&v={api_version}"
         )
 
     def get_identity(self):
@@ -227,6 +292,19 @@ class Vkontakte(Backend):
         data = await self._direct_request("groups.getById", {"fields": "screen_name"})
         self.group = data["groups"][0]
 
+    def _start_requests_queue_handler(self):
+        self.requests_queue = RequestsQueue()
+        self.tokens_pool = TokensPool(self.api_tokens, self.requests_per_second)
+
+        if self.api_user_tokens:
+            self.user_tokens_pool = TokensPool(
+                self.api_user_tokens, self.user_requests_per_second
+            )
+
+        self.requests_queue_handler = asyncio.ensure_future(
+            self._handle_requests_queue()
+        )
+
     async def on_start(self, app):
         await self._update_group_data()
 
@@ -236,15 +314,41 @@ class Vkontakte(Backend):
             self.group["id"],
         )
 
-        self.requests_queue = asyncio.Queue()
+        self._start_requests_queue_handler()
 
-        self.requests_queue_handler = asyncio.ensure_future(
-            self._handle_requests_queue()
-        )
+    def split_rate_limits(self, parts):
+        self.requests_per_second /= parts
+        self.user_requests_per_second /= parts
+
+    async def on_worker_start(self, app, workers_count):
+        await self._update_group_data()
+
+        self._start_requests_queue_handler()
+
+    def load_update(self, data):
+        return self._make_update(data)
+
+    @property
+    def api_token(self):
+        """
+        Token for requests that are not sent through the pool (e.g. for
+        longpoll). It's the first token that is not disabled by the pool.
+        """
+
+        tokens_pool = getattr(self, "tokens_pool", None)
+
+        if tokens_pool is not None:
+            for token in tokens_pool.tokens:
+                if not token.disabled:
+                    return token.value
 
-    async def _direct_request(self, method, kwargs):
+        return self.api_tokens[0]
+
+    async def _direct_request(self, method, kwargs, token=None):
+        # Token is never put into kwargs, because they are stored in
+        # exceptions that can reach handlers and logs
         response = await self.client.post(
-            self.api_request_url.format(method),
+            self.api_request_url.format(method, token or self.api_token),
             data={k: v for k, v in kwargs.items() if v is not None},
         )
 
@@ -264,24 +368,223 @@ class Vkontakte(Backend):
 
         return data["response"]
 
+    def _get_requests_chunk(self):
+        requests_chunk = []
+
+        while self.requests_queue and len(requests_chunk) < EXECUTE_CALLS_LIMIT:
+            requests_chunk.append(self.requests_queue.popleft())
+
+            # Retried requests are not observed again
+            if (
+                self.metrics is not None
+                and self.requests_queue.last_priority is not None
+            ):
+                self.metrics.request_queue_wait.observe(
+                    self.requests_queue.last_wait_time,
+                    self.get_identity(),
+                    self.requests_queue.last_priority.name.lower(),
+                )
+
+        return requests_chunk
+
+    def _pop_requests_spans(self, chunk):
+        if self.requests_spans:
+            return [self.requests_spans.pop(future, None) for _, _, future in chunk]
+
+        return [None] * len(chunk)
+
+    def _start_requests_chunk_handler(self, requests_chunk, token):
+        task = asyncio.ensure_future(self._handle_requests_chunk(requests_chunk, token))
+
+        self.requests_chunks_handlers.add(task)
+        task.add_done_callback(self.requests_chunks_handlers.discard)
+
+    async def _send_requests_chunk(self):
+        # Requests are sent as soon as rate limit of any token allows, and
+        # the ones that arrive while waiting are sent in the same chunk
+        try:
+            token = await self.tokens_pool.acquire("execute")
+        except NoTokensException as exception:
+            requests_chunk = self._get_requests_chunk()
+            self._handle_failed_requests_chunk(
+                requests_chunk,
+                self._pop_requests_spans(requests_chunk),
+                exception,
+                None,
+            )
+            return
+
+        requests_chunk = self._get_requests_chunk()
+
+        if token.paused_methods:
+            requests_chunk = self._skip_paused_requests(requests_chunk, token)
+
+        if requests_chunk:
+            self._start_requests_chunk_handler(requests_chunk, token)
+
+    def _skip_paused_requests(self, chunk, token):
+        """
+        Return requests from chunk that can be sent with the token. Other
+        requests are returned back to the queue if there are tokens they
+        can be sent with, and failed otherwise.
+        """
+
+        requests_chunk = []
+        postponed = []
+        failed = []
+
+        for request in chunk:
+            method = request[0]
+
+            if not token.is_method_paused(method):
+                requests_chunk.append(request)
+            elif self.tokens_pool.has_tokens_for(method):
+                postponed.append(request)
+            else:
+                failed.append(request)
+
+        if failed:
+            self._handle_failed_requests_chunk(
+                failed,
+                self._pop_requests_spans(failed),
+                NoTokensException("Every token is paused for the method"),
+                None,
+            )
+
+        self.requests_queue.extend_first(postponed)
+
+        return requests_chunk
+
     async def _handle_requests_queue(self):
         while True:
-            await asyncio.sleep(self.api_request_pause)
+            await self.requests_queue.wait_not_empty()
+            await self._send_requests_chunk()
 
-            requests_chunk = []
+    @staticmethod
+    def _record_requests_chunk_spans(spans, sent_at, chunk_size):
+        finished_at = time.perf_counter()
+
+        for span in spans:
+            if span is None:
+                continue
+
+            # Time spent in the queue waiting for the "execute" call
+            span.trace.add_span("batch_wait", span.start_time, sent_at, parent=span)
+            span.trace.add_span(
+                "execute", sent_at, finished_at, parent=span, chunk_size=chunk_size
+            )
+
+    def _can_retry_request(self, future):
+        attempts = self.requests_attempts.get(future, 0) + 1
+
+        if attempts > self.requests_retries:
+            return False
+
+        self.requests_attempts[future] = attempts
 
-            for _ in range(25):
-                try:
-                    requests_chunk.append(self.requests_queue.get_nowait())
-                except asyncio.QueueEmpty:
-                    break
+        return True
+
+    def _retry_requests(self, requests, spans):
+        """Return requests back to be sent before others."""
+
+        for request, span in zip(requests, spans):
+            if span is not None:
+                self.requests_spans[request[2]] = span
+
+        self.requests_queue.extend_first(requests)
+
+    def _resolve_request(self, future, result=None, exception=None):
+        if self.requests_attempts:
+            self.requests_attempts.pop(future, None)
+
+        if future.done():
+            return
+
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
 
-            if not requests_chunk:
+    def _handle_failed_requests_chunk(self, chunk, spans, exception, token):
+        response = getattr(exception, "response", None)
+
+        to_retry = []
+        to_retry_spans = []
+
+        # Requests that failed because of token can be sent with another one
+        token_failed = token is not None and self.tokens_pool.report_error(
+            token, _get_error_code(response), "execute"
+        )
+
+        for request, span in zip(chunk, spans):
+            method, kwargs, future = request
+
+            if token_failed and self._can_retry_request(future):
+                to_retry.append(request)
+                to_retry_spans.append(span)
                 continue
 
-            asyncio.ensure_future(self._handle_requests_chunk(requests_chunk))
+            self._resolve_request(
+                future,
+                exception=RequestException(
+                    self, method, kwargs, response, exception=exception
+                ),
+            )
+
+        self._retry_requests(to_retry, to_retry_spans)
+
+    def _handle_requests_chunk_results(self, chunk, spans, response, errors, token):
+        errors_by_method = {}
+
+        for error in errors:
+            errors_by_method.setdefault(error.get("method"), deque()).append(error)
+
+        to_retry = []
+        to_retry_spans = []
+        token_errors = set()
+
+        for result, request, span in zip_longest(response, chunk, spans):
+            if request is None:
+                break
+
+            method, kwargs, future = request
+
+            # Failed calls have "false" (or "null") as result, and errors
+            # are matched with them by method in order of calls
+            if (result is False or result is None) and errors_by_method.get(method):
+                error = errors_by_method[method].popleft()
+            else:
+                error = None
+
+            if result is not None and error is None:
+                self._resolve_request(future, result)
+                continue
 
-    async def _handle_requests_chunk(self, chunk):
+            error_code = _get_error_code(error)
+
+            if error_code in TOKEN_ERROR_CODES:
+                # Rate limits are reached for methods separately
+                if error_code == RATE_LIMIT_REACHED_ERROR_CODE:
+                    token_errors.add((error_code, method))
+                else:
+                    token_errors.add((error_code, None))
+
+                if self._can_retry_request(future):
+                    to_retry.append(request)
+                    to_retry_spans.append(span)
+                    continue
+
+            self._resolve_request(
+                future,
+                exception=RequestException(self, method, kwargs, error or result),
+            )
+
+        for error_code, method in token_errors:
+            self.tokens_pool.report_error(token, error_code, method)
+
+        self._retry_requests(to_retry, to_retry_spans)
+
+    async def _handle_requests_chunk(self, chunk, token):
         code = "return ["
 
         for method, kwargs, _ in chunk:
@@ -292,29 +595,143 @@ class Vkontakte(Backend):
 
         code += "];"
 
-        response = await self._direct_request("execute", {"code": code})
+        spans = self._pop_requests_spans(chunk)
 
-        for result, (method, kwargs, future) in zip_longest(response, chunk):
-            if future.done():
-                continue
+        sent_at = time.perf_counter()
 
-            if result is not None:
-                future.set_result(result)
-                continue
+        try:
+            response = await self._direct_request(
+                "execute", {"code": code}, token.value
+            )
+            errors = ()
+        except RequestException as exception:
+            data = exception.response
+
+            # Some of the calls failed, but others have results
+            if not (
+                isinstance(data, dict)
+                and isinstance(data.get("response"), list)
+                and data.get("execute_errors")
+            ):
+                self._handle_failed_requests_chunk(chunk, spans, exception, token)
+                return
+
+            response = data["response"]
+            errors = data["execute_errors"]
+        except asyncio.CancelledError:
+            raise
+        except Exception as exception:
+            self._handle_failed_requests_chunk(chunk, spans, exception, token)
+            return
+        finally:
+            self._record_requests_chunk_spans(spans, sent_at, len(chunk))
 
-            future.set_exception(
-                RequestException(
-                    self,
-                    method,
-                    kwargs,
-                    result,
-                ),
+        self._handle_requests_chunk_results(chunk, spans, response, errors, token)
+
+    async def _user_request(self, method, kwargs):
+        attempts = 0
+
+        while True:
+            try:
+                token = await self.user_tokens_pool.acquire(method)
+            except NoTokensException as exception:
+                raise RequestException(self, method, kwargs, None, exception=exception)
+
+            try:
+                return await self._direct_request(method, kwargs, token.value)
+            except RequestException as exception:
+                token_failed = self.user_tokens_pool.report_error(
+                    token, _get_error_code(exception.response), method
+                )
+
+                attempts += 1
+
+                if not token_failed or attempts > self.requests_retries:
+                    raise RequestException(
+                        self,
+                        method,
+                        kwargs,
+                        exception.response,
+                        exception=exception.exception,
+                    )
+
+    async def request(self, method, kwargs, priority=None):
+        """
+        Perform request to vk's API in one of the next "execute" calls.
+        Requests with higher priority (see :class:`RequestPriority`) are
+        sent first. If priority is not specified, it's taken from the
+        "requests_priorities" by method (normal by default).
+
+        Methods from "user_methods" are sent separately with one of the
+        user tokens (priority is ignored for them). Identical requests for
+        methods from "coalesced_methods" share results (see
+        :class:`kutana.coalescing.RequestsCoalescer`).
+        """
+
+        if method in self.user_methods:
+            priority = None
+        elif priority is None:
+            priority = self.requests_priorities.get(method, RequestPriority.NORMAL)
+        else:
+            priority = RequestPriority(priority)
+
+        if self.coalescer is not None:
+            # Requests with different priorities are not coalesced, so
+            # request with higher priority never waits for lower one
+            return await self.coalescer.call(
+                method,
+                kwargs,
+                partial(self._request, priority=priority),
+                group=priority,
             )
 
-    async def request(self, method, kwargs):
+        return await self._request(method, kwargs, priority)
+
+    async def _request(self, method, kwargs, priority):
+        if method in self.user_methods:
+            if self.metrics is None and get_current_span() is None:
+                return await self._user_request(method, kwargs)
+
+            with self._observe_request(method):
+                return await self._user_request(method, kwargs)
+
         future = asyncio.Future()
-        await self.requests_queue.put((method, kwargs, future))
-        return await future
+
+        if self.metrics is None and get_current_span() is None:
+            self.requests_queue.append((method, kwargs, future), priority)
+            return await future
+
+        with self._observe_request(method) as span:
+            if span is not None:
+                self.requests_spans[future] = span
+
+            self.requests_queue.append((method, kwargs, future), priority)
+            return await future
+
+    def loader(self, method, field, kwargs=None, items_key=None) -> BatchLoader:
+        """
+        Return loader that requests entities (e.g. users for "users.get"
+        with "user_ids" as field) by ids collected from concurrent calls
+        with one request (see :class:`BatchLoader`). Loaders are shared
+        for the same method, field and other arguments.
+
+        .. code-block:: python
+
+            user = await backend.loader("users.get", "user_ids").load(user_id)
+        """
+
+        items_key = items_key or DEFAULT_LOADERS_ITEMS_KEYS.get(method)
+
+        key = (method, field, json.dumps(kwargs or {}, sort_keys=True), items_key)
+
+        loader = self.loaders.get(key)
+
+        if loader is None:
+            loader = self.loaders[key] = BatchLoader(
+                self.request, method, field, kwargs, items_key=items_key
+            )
+
+        return loader
 
     async def upload_attachment(self, attachment, peer_id):
         if attachment.kind == AttachmentKind.IMAGE:
@@ -388,6 +805,20 @@ class Vkontakte(Backend):
             },
         )
 
+    async def on_drain(self, app):
+        self.requests_queue_handler.cancel()
+
+        while True:
+            if self.requests_queue:
+                await self._send_requests_chunk()
+                continue
+
+            if not self.requests_chunks_handlers:
+                break
+
+            # Chunks can return requests to be retried
+            await asyncio.wait(self.requests_chunks_handlers)
+
     async def on_shutdown(self, app):
         self.requests_queue_handler.cancel()
         await self.client.aclose()
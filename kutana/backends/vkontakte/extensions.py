@@ -1,18 +1,18 @@
 import json
 
-from ...helpers import pick, uniq_by
+from ...handler import wrap_handler
 from ...router import MapRouter
 from ...update import Message
 
 
 class VkontakteChatActionRouter(MapRouter):
+    update_types = (Message,)
+    backends = {"vk"}
+
     def extract_keys(self, context):
         if not isinstance(context.update, Message):
             return ()
 
-        if context.backend.get_identity() != "vk":
-            return ()
-
         chat_action = context.update.raw["object"]["message"].get("action")
         if not chat_action:
             return ()
@@ -23,29 +23,40 @@ class VkontakteChatActionRouter(MapRouter):
 
 
 class VkontaktePayloadRouter(MapRouter):
-    def __init__(self, priority=0):
-        super().__init__(priority)
-        self._possible_key_shapes = set()
+    update_types = (Message,)
+    backends = {"vk"}
 
-    def _update_possible_key_shapes(self, key):
-        if not isinstance(key, dict):
-            return
+    def __init__(self, priority=0, **kwargs):
+        super().__init__(priority, **kwargs)
+        # Tree of sorted (field, value) pairs of payloads that are dicts
+        self._payloads_index = {}
 
-        self._possible_key_shapes = uniq_by(
-            [
-                *self._possible_key_shapes,
-                tuple(sorted(key.keys())),
-            ]
-        )
+    def _index_payload(self, key):
+        node = self._payloads_index
+        for item in key:
+            node = node.setdefault(item, {})
+        node[None] = key
 
     def add_handler(self, key, handler):
-        self._update_possible_key_shapes(key)
-        return super().add_handler(self._to_hashable(key), handler)
+        hashable_key = self._to_hashable(key)
+
+        if isinstance(key, dict):
+            self._index_payload(hashable_key)
+
+        return super().add_handler(hashable_key, handler)
+
+    @staticmethod
+    def _merge_indexes(target, source):
+        for item, node in source.items():
+            if item is None:
+                target[None] = node
+            else:
+                VkontaktePayloadRouter._merge_indexes(target.setdefault(item, {}), node)
 
     @staticmethod
     def _merge_routers(target, source):
         super()._merge_routers(target, source)
-        target._possible_key_shapes.update(source._possible_key_shapes)
+        target._merge_indexes(target._payloads_index, source._payloads_index)
 
     def _to_hashable(self, value):
         if isinstance(value, dict):
@@ -56,13 +67,37 @@ class VkontaktePayloadRouter(MapRouter):
 
         return value
 
+    def _get_payload_keys(self, payload):
+        """
+        Return keys of handlers for payload. If payload is a dict, keys
+        of all registered payloads which fields are present in it with
+        the same values are returned (excessive fields are ignored),
+        more specific ones first.
+        """
+
+        if not isinstance(payload, dict):
+            return (self._to_hashable(payload),)
+
+        items = self._to_hashable(payload)
+        keys = []
+
+        def _walk(node, start):
+            if None in node:
+                keys.append(node[None])
+
+            for index in range(start, len(items)):
+                child = node.get(items[index])
+                if child is not None:
+                    _walk(child, index + 1)
+
+        _walk(self._payloads_index, 0)
+
+        return sorted(keys, key=len, reverse=True)
+
     def extract_keys(self, context):
         if not isinstance(context.update, Message):
             return ()
 
-        if context.backend.get_identity() != "vk":
-            return ()
-
         raw_payload = context.update.raw["object"]["message"].get("payload")
         if not raw_payload:
             return ()
@@ -74,23 +109,16 @@ class VkontaktePayloadRouter(MapRouter):
 
         context.payload = payload
 
-        if isinstance(payload, dict):
-            return (
-                self._to_hashable(pick(payload, possible_key_shape))
-                for possible_key_shape in self._possible_key_shapes
-            )
-        else:
-            return (self._to_hashable(payload),)
+        return self._get_payload_keys(payload)
 
 
 class VkontakteCallbackRouter(VkontaktePayloadRouter):
+    update_types = (dict,)
+
     def extract_keys(self, context):
         if isinstance(context.update, Message):
             return ()
 
-        if context.backend.get_identity() != "vk":
-            return ()
-
         if context.update["type"] != "message_event":
             return ()
 
@@ -112,13 +140,7 @@ class VkontakteCallbackRouter(VkontaktePayloadRouter):
 
         context.send_message_event_answer = _send_message_event_answer
 
-        if isinstance(payload, dict):
-            return (
-                self._to_hashable(pick(payload, possible_key_shape))
-                for possible_key_shape in self._possible_key_shapes
-            )
-        else:
-            return (self._to_hashable(payload),)
+        return self._get_payload_keys(payload)
 
 
 class VkontaktePluginExtension:
@@ -129,6 +151,9 @@ class VkontaktePluginExtension:
         self,
         kinds,
         priority=0,
+        timeout=None,
+        backends=None,
+        recipient_kinds=None,
     ):
         """
         Return decorator for registering handler that will be called if
@@ -139,15 +164,20 @@ class VkontaktePluginExtension:
         - "action" - chat action object.
 
         See :class:`kutana.plugin.Plugin.on_commands` for details
-        about 'priority' and return values.
+        about 'priority', 'timeout', filters and return values.
         """
 
         def decorator(coro):
-            chat_action_router = VkontakteChatActionRouter(priority=priority)
+            chat_action_router = VkontakteChatActionRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            handler = wrap_handler(coro, timeout, self._plugin.name)
             for kind in kinds:
-                chat_action_router.add_handler(kind, coro)
+                chat_action_router.add_handler(kind, handler)
 
-            self._plugin._routers.append(chat_action_router)
+            self._plugin._add_router(chat_action_router)
 
             return coro
 
@@ -157,6 +187,9 @@ class VkontaktePluginExtension:
         self,
         payloads,
         priority=0,
+        timeout=None,
+        backends=None,
+        recipient_kinds=None,
     ):
         """
         Return decorator for registering handler that will be called if
@@ -169,15 +202,20 @@ class VkontaktePluginExtension:
         - "payload" - chat action object.
 
         See :class:`kutana.plugin.Plugin.on_commands` for details
-        about 'priority' and return values.
+        about 'priority', 'timeout', filters and return values.
         """
 
         def decorator(coro):
-            payload_router = VkontaktePayloadRouter(priority=priority)
+            payload_router = VkontaktePayloadRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            handler = wrap_handler(coro, timeout, self._plugin.name)
             for payload in payloads:
-                payload_router.add_handler(payload, coro)
+                payload_router.add_handler(payload, handler)
 
-            self._plugin._routers.append(payload_router)
+            self._plugin._add_router(payload_router)
 
             return coro
 
@@ -187,6 +225,9 @@ class VkontaktePluginExtension:
         self,
         payloads,
         priority=0,
+        timeout=None,
+        backends=None,
+        recipient_kinds=None,
     ):
         """
         Return decorator for registering handler that will be called if
@@ -200,15 +241,20 @@ class VkontaktePluginExtension:
         - "send_message_event_answer" - helper method for "messages.sendMessageEventAnswer".
 
         See :class:`kutana.plugin.Plugin.on_commands` for details
-        about 'priority' and return values.
+        about 'priority', 'timeout', filters and return values.
         """
 
         def decorator(coro):
-            callback_router = VkontakteCallbackRouter(priority=priority)
+            callback_router = VkontakteCallbackRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            handler = wrap_handler(coro, timeout, self._plugin.name)
             for payload in payloads:
-                callback_router.add_handler(payload, coro)
+                callback_router.add_handler(payload, handler)
 
-            self._plugin._routers.append(callback_router)
+            self._plugin._add_router(callback_router)
 
             return coro
 
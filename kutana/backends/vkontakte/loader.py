@@ -0,0 +1,109 @@
+import asyncio
+from typing import Dict, Optional
+
+# Maximum amount of ids in one call of methods like "users.get"
+LOADER_BATCH_SIZE_LIMIT = 1000
+
+
+class BatchLoader:
+    """
+    Collects ids of entities requested with :meth:`load` during "delay"
+    seconds and requests them with one call of the method (ids are
+    passed as comma separated list in "field" argument). Results are
+    matched with ids by "id_key" of the returned items, and callers
+    receive None for ids missing from response.
+
+    Ids requested multiple times during the same window share one
+    result, and batch is sent at once when it reaches "max_batch_size".
+
+    :param request: coroutine function that performs request
+    :param method: method returning list of entities
+    :param field: name of the argument with ids
+    :param kwargs: other arguments for the method
+    :param items_key: key of the items' list if method returns dict
+    :param id_key: key of the id in the returned items
+    :param max_batch_size: maximum amount of ids in one call
+    :param delay: time (in seconds) ids are collected for
+    """
+
+    def __init__(
+        self,
+        request,
+        method: str,
+        field: str,
+        kwargs: Optional[dict] = None,
+        items_key: Optional[str] = None,
+        id_key: str = "id",
+        max_batch_size: int = LOADER_BATCH_SIZE_LIMIT,
+        delay: float = 0.01,
+    ):
+        self.request = request
+        self.method = method
+        self.field = field
+        self.kwargs = kwargs or {}
+        self.items_key = items_key
+        self.id_key = id_key
+        self.max_batch_size = max_batch_size
+        self.delay = delay
+
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def load(self, entity_id):
+        """Return entity with provided id (or None if it's not found)."""
+
+        key = str(entity_id)
+        future = self._pending.get(key)
+
+        if future is None:
+            future = self._pending[key] = asyncio.get_event_loop().create_future()
+
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = asyncio.get_event_loop().call_later(
+                    self.delay, self._dispatch
+                )
+
+        # Cancelled caller should not cancel loading for the other ones
+        return await asyncio.shield(future)
+
+    async def load_many(self, entities_ids):
+        """Return list of entities for provided ids (in their order)."""
+        return await asyncio.gather(*map(self.load, entities_ids))
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, {}
+
+        task = asyncio.ensure_future(self._load_batch(batch))
+
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, batch):
+        try:
+            response = await self.request(
+                self.method, {**self.kwargs, self.field: ",".join(batch)}
+            )
+
+            items = response[self.items_key] if self.items_key else response
+
+            results = {str(item[self.id_key]): item for item in items}
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as exception:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exception)
+            return
+
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Dict, Optional
+
+
+class RequestPriority(IntEnum):
+    """
+    Priority of the request to vk's API. Requests with higher priority
+    are sent before requests with lower priority.
+    """
+
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+
+class RequestsQueue:
+    """
+    Queue of requests that returns requests with higher priority first
+    (and requests with the same priority in order they were put).
+    Requests returned for retrying are returned before any others.
+    """
+
+    def __init__(self):
+        self.lanes: Dict[RequestPriority, deque] = {
+            priority: deque() for priority in sorted(RequestPriority, reverse=True)
+        }
+        self.retries: deque = deque()
+
+        self.last_priority: Optional[RequestPriority] = None
+        self.last_wait_time: Optional[float] = None
+
+        self._size = 0
+        self._not_empty = asyncio.Event()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, item, priority=RequestPriority.NORMAL):
+        self.lanes[RequestPriority(priority)].append((time.monotonic(), item))
+        self._size += 1
+        self._not_empty.set()
+
+    def extend_first(self, items):
+        """Put items (in their order) before the ones already in queue."""
+
+        if not items:
+            return
+
+        self.retries.extendleft(reversed(items))
+        self._size += len(items)
+        self._not_empty.set()
+
+    def popleft(self):
+        """
+        Remove and return the next item. Priority of the item and time
+        it waited in the queue are stored in "last_priority" and
+        "last_wait_time" (both are None for retried items).
+        """
+
+        if self.retries:
+            item = self.retries.popleft()
+            self.last_priority = None
+            self.last_wait_time = None
+        else:
+            for priority, lane in self.lanes.items():
+                if lane:
+                    put_at, item = lane.popleft()
+                    self.last_priority = priority
+                    self.last_wait_time = time.monotonic() - put_at
+                    break
+            else:
+                raise IndexError("pop from an empty queue")
+
+        self._size -= 1
+
+        if not self._size:
+            self._not_empty.clear()
+
+        return item
+
+    async def wait_not_empty(self):
+        """Wait until there are items in the queue (without taking them)."""
+
+        await self._not_empty.wait()
+
+    def depths(self) -> Dict[RequestPriority, int]:
+        """Return amounts of waiting requests for every priority."""
+        return {priority: len(lane) for priority, lane in self.lanes.items()}
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from ...limiter import RateLimiter
+
+# Error codes for failed authorization of user, group or application
+AUTH_ERROR_CODES = {5, 27, 28}
+
+# Error code for "Too many requests per second"
+TOO_MANY_REQUESTS_ERROR_CODE = 6
+
+# Error code for "Rate limit reached" (daily quota of method is exhausted)
+RATE_LIMIT_REACHED_ERROR_CODE = 29
+
+# Error codes that are caused by token and not by request itself
+TOKEN_ERROR_CODES = AUTH_ERROR_CODES | {
+    TOO_MANY_REQUESTS_ERROR_CODE,
+    RATE_LIMIT_REACHED_ERROR_CODE,
+}
+
+
+class NoTokensException(Exception):
+    """Raised when every token in the pool is removed from rotation."""
+
+
+class ApiToken:
+    """
+    Token for vk's API with it's own rate limit and health statistics.
+
+    :param value: token itself
+    :param requests_per_second: maximum rate of requests with this token
+    """
+
+    def __init__(self, value: str, requests_per_second: float):
+        self.value = value
+        self.limiter = RateLimiter(requests_per_second)
+
+        # Token failed authorization and won't be used anymore
+        self.disabled = False
+
+        # Token is not used until this moment (see time.monotonic)
+        self.paused_until = 0.0
+
+        # Token is not used for the method until the moment
+        self.paused_methods: Dict[str, float] = {}
+
+        self.requests_count = 0
+        self.errors_count = 0
+        self.last_error_code: Optional[int] = None
+
+    @property
+    def active(self):
+        return not self.disabled and self.paused_until <= time.monotonic()
+
+    def is_method_paused(self, method: Optional[str]) -> bool:
+        return (
+            method is not None
+            and self.paused_methods.get(method, 0.0) > time.monotonic()
+        )
+
+    def is_available(self, method: Optional[str] = None) -> bool:
+        """Return True if token can be used for the method right now."""
+        return self.active and not self.is_method_paused(method)
+
+    def __repr__(self):
+        return f"<ApiToken ...{self.value[-4:]}>"
+
+
+class TokensPool:
+    """
+    Pool of tokens for vk's API. Every token has independent rate limit,
+    and requests are spread across tokens in round-robin order (skipping
+    tokens that have no budget left at the moment).
+
+    Tokens are removed from rotation after errors caused by them (see
+    :meth:`report_error`): forever after failed authorization, and until
+    their rate limiter allows the next request after "Too many requests"
+    errors. Rate limits of methods are separate, so after reaching one
+    token is only paused for "pause" seconds for that method.
+
+    :param tokens: list of tokens
+    :param requests_per_second: maximum rate of requests for every token
+    :param pause: time (in seconds) method is paused for with the token
+        after reaching it's rate limit
+    """
+
+    def __init__(self, tokens: List[str], requests_per_second: float, pause=3600.0):
+        if not tokens or not all(tokens):
+            raise ValueError("No token provided for backend")
+
+        self.tokens = [ApiToken(token, requests_per_second) for token in tokens]
+        self.pause = pause
+
+        self._next_index = 0
+
+    @property
+    def active_tokens(self) -> List[ApiToken]:
+        return [token for token in self.tokens if token.active]
+
+    def has_tokens_for(self, method: Optional[str] = None) -> bool:
+        """
+        Return True if there are tokens that can be used for the method
+        now or after they are resumed.
+        """
+
+        return any(
+            not token.disabled and not token.is_method_paused(method)
+            for token in self.tokens
+        )
+
+    def try_acquire(self, method: Optional[str] = None) -> Optional[ApiToken]:
+        """
+        Return the next available token that can be used for the method
+        right now (and count it's usage) or None if there is no such token.
+        """
+
+        for offset in range(len(self.tokens)):
+            index = (self._next_index + offset) % len(self.tokens)
+            token = self.tokens[index]
+
+            if token.is_available(method) and token.limiter.try_acquire():
+                self._next_index = index + 1
+                token.requests_count += 1
+                return token
+
+        return None
+
+    async def acquire(self, method: Optional[str] = None) -> ApiToken:
+        """
+        Wait until one of the tokens can be used for the method, count
+        it's usage and return it. Raises :class:`NoTokensException` if
+        every token is disabled or paused for the method.
+        """
+
+        while True:
+            token = self.try_acquire(method)
+
+            if token is not None:
+                return token
+
+            tokens = [token for token in self.tokens if token.is_available(method)]
+
+            if tokens:
+                await asyncio.sleep(min(token.limiter.get_delay() for token in tokens))
+                continue
+
+            paused_tokens = [
+                token
+                for token in self.tokens
+                if not token.disabled and not token.is_method_paused(method)
+            ]
+
+            if not paused_tokens:
+                raise NoTokensException("Every token is removed from rotation")
+
+            await asyncio.sleep(
+                min(token.paused_until for token in paused_tokens) - time.monotonic()
+            )
+
+    def report_error(
+        self, token: ApiToken, error_code, method: Optional[str] = None
+    ) -> bool:
+        """
+        Update token's health after request of the method with it failed
+        with provided error's code. Returns True if error was caused by
+        token (and request can be retried with another one).
+        """
+
+        token.errors_count += 1
+        token.last_error_code = error_code
+
+        if error_code in AUTH_ERROR_CODES:
+            if not token.disabled:
+                token.disabled = True
+                logging.error("Token %r is removed (error %s)", token, error_code)
+            return True
+
+        if error_code == RATE_LIMIT_REACHED_ERROR_CODE:
+            if method is None:
+                token.paused_until = time.monotonic() + self.pause
+                logging.warning("Token %r is paused for %ss", token, self.pause)
+            else:
+                token.paused_methods[method] = time.monotonic() + self.pause
+                logging.warning(
+                    'Method "%s" is paused for token %r for %ss',
+                    method,
+                    token,
+                    self.pause,
+                )
+            return True
+
+        if error_code == TOO_MANY_REQUESTS_ERROR_CODE:
+            token.limiter.decrease()
+            return True
+
+        return False
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable
+
+
+class RequestsCoalescer:
+    """
+    Shares results of identical (same method and arguments) requests for
+    the listed methods. Requests performed while the identical one is in
+    flight wait for it's result instead of being sent again. If "ttl" is
+    greater than zero, successful results are also cached for "ttl"
+    seconds after request is finished.
+
+    Requests can be split into groups with "group" argument of
+    :meth:`call` (e.g. by priority), and only requests from the same
+    group are coalesced.
+
+    Only idempotent methods should be listed, and results returned to
+    callers are shared between them, so they should not be modified.
+    Amounts of requests served without sending them are stored in
+    "counts" by source ("in_flight" or "cache").
+
+    :param methods: methods which requests can be coalesced
+    :param ttl: time (in seconds) results are cached for
+    :param maxsize: maximum amount of cached results
+    """
+
+    def __init__(self, methods: Iterable[str], ttl: float = 0.0, maxsize: int = 1024):
+        self.methods = set(methods)
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+        self.counts: Counter = Counter()
+
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        self._results: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _make_key(method, kwargs, group):
+        try:
+            return (
+                method,
+                group,
+                json.dumps(kwargs, sort_keys=True, separators=(",", ":")),
+            )
+        except (TypeError, ValueError):
+            # Arguments with files and other unserializable values
+            return None
+
+    def _get_cached(self, key):
+        cached = self._results.get(key)
+
+        if cached is None:
+            return None
+
+        if cached[0] < time.monotonic():
+            del self._results[key]
+            return None
+
+        return cached
+
+    def _finish(self, key, task):
+        self._in_flight.pop(key, None)
+
+        if self.ttl <= 0 or task.cancelled() or task.exception() is not None:
+            return
+
+        self._results[key] = (time.monotonic() + self.ttl, task.result())
+        self._results.move_to_end(key)
+
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    async def call(self, method, kwargs, perform, group=None):
+        """
+        Return result of the request performed with the coroutine
+        function "perform(method, kwargs)" or the shared result of the
+        identical request from the same group.
+        """
+
+        if method not in self.methods:
+            return await perform(method, kwargs)
+
+        key = self._make_key(method, kwargs, group)
+
+        if key is None:
+            return await perform(method, kwargs)
+
+        if self._results:
+            cached = self._get_cached(key)
+
+            if cached is not None:
+                self.counts["cache"] += 1
+                return cached[1]
+
+        task = self._in_flight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(perform(method, kwargs))
+            task.add_done_callback(lambda task: self._finish(key, task))
+
+            self._in_flight[key] = task
+        else:
+            self.counts["in_flight"] += 1
+
+        # Cancelled caller should not cancel request for the other ones
+        return await asyncio.shield(task)
@@ -1,22 +1,63 @@
-from typing import Union
+from typing import TYPE_CHECKING, Optional, Union
 
 from .helpers import chunks
 from .update import Message
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .tracing import Trace
+
 
 class Context:
+    """
+    Context of the update's handling. Attributes that are set by kutana
+    and it's routers are stored in slots, any other attributes (e.g.
+    defined by plugins) are stored in the instance's dict.
+    """
+
+    __slots__ = (
+        "app",
+        "update",
+        "backend",
+        "routing_decisions",
+        "trace",
+        "prefix",
+        "command",
+        "body",
+        "match",
+        "payload",
+        "sender_id",
+        "recipient_id",
+        "storage",
+        "sender",
+        "recipient",
+        "_sender_unique_id",
+        "_recipient_unique_id",
+        "__dict__",
+    )
+
     def __init__(self, app, update, backend):
         self.app = app
         self.update: Union[Message, dict] = update
         self.backend = backend
 
+        # Decisions of routers for this message (if routing cache is enabled)
+        self.routing_decisions: Optional[dict] = None
+
+        # Trace of the update's handling (if update is traced)
+        self.trace: Optional["Trace"] = None
+
+        # Unique ids with their sources: (backend, id, unique id)
+        self._sender_unique_id: Optional[tuple] = None
+        self._recipient_unique_id: Optional[tuple] = None
+
     def __getattr__(self, name):
         """Defined for typing"""
         return super().__getattribute__(name)
 
-    def __setattr__(self, name, value):
-        """Defined for typing"""
-        return super().__setattr__(name, value)
+    if TYPE_CHECKING:  # pragma: no cover
+
+        def __setattr__(self, name, value):
+            """Defined for typing"""
 
     @property
     def sender_unique_id(self):
@@ -27,7 +68,17 @@ class Context:
         else:
             raise ValueError("Can't form an unique sender id")
 
-        return f"{self.backend.get_identity()}:s:{sender_id}"
+        # Unique id is formed again only if it's sources were changed
+        cached = self._sender_unique_id
+
+        if cached is not None and cached[0] is self.backend and cached[1] == sender_id:
+            return cached[2]
+
+        unique_id = f"{self.backend.get_identity()}:s:{sender_id}"
+
+        self._sender_unique_id = (self.backend, sender_id, unique_id)
+
+        return unique_id
 
     @property
     def recipient_unique_id(self):
@@ -38,7 +89,21 @@ class Context:
         else:
             raise ValueError("Can't form an unique recipient id")
 
-        return f"{self.backend.get_identity()}:r:{recipient_id}"
+        # Unique id is formed again only if it's sources were changed
+        cached = self._recipient_unique_id
+
+        if (
+            cached is not None
+            and cached[0] is self.backend
+            and cached[1] == recipient_id
+        ):
+            return cached[2]
+
+        unique_id = f"{self.backend.get_identity()}:r:{recipient_id}"
+
+        self._recipient_unique_id = (self.backend, recipient_id, unique_id)
+
+        return unique_id
 
     @property
     def request(self):
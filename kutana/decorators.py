@@ -10,7 +10,8 @@ from .update import Message, RecipientKind
 def expect_recipient_kind(expected_recipient_kind: RecipientKind):
     """
     Return decorators that skips all messages with "recipient_kind"
-    different from specified one.
+    different from specified one. Consider using "recipient_kinds"
+    argument of plugin's decorators instead.
     """
 
     def decorator(func):
@@ -28,7 +29,8 @@ def expect_recipient_kind(expected_recipient_kind: RecipientKind):
 def expect_backend(expected_identity: str):
     """
     Return decorators that skips all updates acquired from
-    backends with identity different from specified one.
+    backends with identity different from specified one. Consider
+    using "backends" argument of plugin's decorators instead.
     """
 
     def decorator(func):
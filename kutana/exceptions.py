@@ -5,3 +5,11 @@ class RequestException(Exception):
         self.kwargs = kwargs
         self.response = response
         self.exception = exception
+
+
+class HandlerTimeoutException(Exception):
+    def __init__(self, handler, timeout, stack):
+        super().__init__(f'Handler "{handler.__qualname__}" timed out after {timeout}s')
+        self.handler = handler
+        self.timeout = timeout
+        self.stack = stack
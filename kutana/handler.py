@@ -1,3 +1,15 @@
+import asyncio
+import functools
+import inspect
+import io
+import logging
+import time
+from weakref import WeakKeyDictionary
+
+from .exceptions import HandlerTimeoutException
+from .tracing import start_span
+
+
 class HandledResultSymbol:
     def __init__(self, name: str):
         self.name = name
@@ -8,3 +20,122 @@ class HandledResultSymbol:
 
 PROCESSED = HandledResultSymbol("PROCESSED")
 SKIPPED = HandledResultSymbol("SKIPPED")
+
+# Names of plugins and handlers by handlers' code objects
+_handlers_by_code: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def get_handler_info(code):
+    """
+    Return pair of plugin's and handler's names for code object of the
+    handler wrapped with :func:`wrap_handler` or None.
+    """
+
+    return _handlers_by_code.get(code)
+
+
+def get_handler_name(coro):
+    """
+    Return name of the handler for logs, metrics and traces. Handlers
+    are often defined as "_", so line of their definition is added to
+    such names (e.g. "_:42").
+    """
+
+    # Decorators' wrappers share code, so only the original function is used
+    original = inspect.unwrap(coro)
+
+    if getattr(original, "__name__", None) == "_" and hasattr(original, "__code__"):
+        return f"{coro.__qualname__}:{original.__code__.co_firstlineno}"
+
+    return coro.__qualname__
+
+
+def wrap_handler(coro, timeout=None, plugin_name=None):
+    """
+    Return handler that cancels provided handler if it works longer
+    than "timeout" seconds (or application's "handler_timeout" if
+    "timeout" is None) and raises :class:`HandlerTimeoutException`
+    (stack of the handler at the moment of cancellation is logged).
+    Returned handler also records it's duration and exceptions if
+    application collects metrics (see :class:`kutana.metrics.KutanaMetrics`)
+    and it's span if update is traced (see :class:`kutana.tracing.Tracer`).
+    """
+
+    handler_name = get_handler_name(coro)
+
+    original = inspect.unwrap(coro)
+
+    if hasattr(original, "__code__"):
+        _handlers_by_code[original.__code__] = (plugin_name or "", handler_name)
+
+    async def call_with_timeout(update, context, handler_timeout):
+        task = asyncio.ensure_future(coro(update, context))
+
+        try:
+            done, _ = await asyncio.wait((task,), timeout=handler_timeout)
+
+            if done:
+                return task.result()
+
+            stack = io.StringIO()
+            task.print_stack(file=stack)
+        finally:
+            if not task.done():
+                task.cancel()
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        logging.error(
+            'Handler "%s" timed out after %ss\n%s',
+            handler_name,
+            handler_timeout,
+            stack.getvalue(),
+        )
+
+        raise HandlerTimeoutException(coro, handler_timeout, stack.getvalue())
+
+    async def call(update, context, handler_timeout):
+        if not handler_timeout:
+            return await coro(update, context)
+
+        return await call_with_timeout(update, context, handler_timeout)
+
+    async def call_with_metrics(update, context, handler_timeout):
+        metrics = context.app.metrics
+
+        if metrics is None:
+            return await call(update, context, handler_timeout)
+
+        started_at = time.perf_counter()
+
+        try:
+            return await call(update, context, handler_timeout)
+        except Exception:
+            metrics.handler_exceptions.inc(plugin_name, handler_name)
+            raise
+        finally:
+            metrics.handler_duration.observe(
+                time.perf_counter() - started_at, plugin_name, handler_name
+            )
+
+    @functools.wraps(coro)
+    async def wrapper(update, context):
+        app = context.app
+
+        handler_timeout = app.config["handler_timeout"] if timeout is None else timeout
+
+        if app.metrics is None and context.trace is None:
+            if not handler_timeout:
+                return await coro(update, context)
+
+            return await call_with_timeout(update, context, handler_timeout)
+
+        with start_span(
+            context.trace, "handler", plugin=plugin_name, handler=handler_name
+        ):
+            return await call_with_metrics(update, context, handler_timeout)
+
+    return wrapper
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import List
+
+
+class DeferredHooksExecutor:
+    """
+    Runs hooks in the background with fixed amount of workers, so they
+    don't delay handling of updates. Hooks are put into the bounded queue
+    and when it's full, either the new hook's call ("drop_new") or the
+    oldest one in the queue ("drop_oldest") is dropped. Amount of dropped
+    calls is stored in "dropped_count".
+
+    :param workers_count: amount of workers that call hooks
+    :param maxsize: maximum amount of calls waiting in the queue
+    :param overflow: what to drop when the queue is full
+    """
+
+    def __init__(self, workers_count=4, maxsize=1024, overflow="drop_oldest"):
+        if workers_count < 1:
+            raise ValueError(f"Bad amount of workers for hooks: {workers_count}")
+
+        if overflow not in ("drop_new", "drop_oldest"):
+            raise ValueError(f'Unknown overflow policy for hooks: "{overflow}"')
+
+        self.workers_count = workers_count
+        self.overflow = overflow
+        self.dropped_count = 0
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._workers: List[asyncio.Future] = []
+
+    @property
+    def depth(self):
+        """Amount of calls waiting in the queue."""
+        return self._queue.qsize()
+
+    def start(self):
+        for _ in range(self.workers_count - len(self._workers)):
+            self._workers.append(asyncio.ensure_future(self._work()))
+
+    def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+
+        self._workers = []
+
+    def submit(self, event, hook, *args, **kwargs):
+        """Put call of the hook into the queue (without waiting)."""
+
+        if self._queue.full():
+            self.dropped_count += 1
+
+            if self.overflow == "drop_new":
+                logging.debug('Dropped call of hook for event "%s"', event)
+                return
+
+            dropped_event, _, _, _ = self._queue.get_nowait()
+            self._queue.task_done()
+            logging.debug('Dropped call of hook for event "%s"', dropped_event)
+
+        self._queue.put_nowait((event, hook, args, kwargs))
+
+    async def join(self):
+        """Wait until all the calls in the queue are done."""
+        await self._queue.join()
+
+    async def _work(self):
+        while True:
+            event, hook, args, kwargs = await self._queue.get()
+
+            try:
+                await hook(*args, **kwargs)
+            except Exception:
+                logging.exception('Error while handling event "%s"', event)
+            finally:
+                self._queue.task_done()
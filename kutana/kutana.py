@@ -1,14 +1,27 @@
 import asyncio
 import logging
-from itertools import groupby
-from typing import Callable, Dict, List
+import multiprocessing
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import count
+from typing import Callable, Dict, List, Optional, Set
 
 from .backend import Backend
 from .context import Context
+from .hooks import DeferredHooksExecutor
+from .lanes import UpdatesLane, UpdatesQueue, get_update_kind
+from .limiter import ConcurrencyLimiter
+from .metrics import KutanaMetrics
+from .monitor import LoopMonitor
+from .overflow import make_overflow_policy
 from .plugin import Plugin
-from .router import ListRouter, Router
+from .router import CompiledRouter, RoutingCache
 from .storage import Storage
 from .storages import MemoryStorage
+from .tracing import Tracer, make_trace_exporter, start_span
+from .update import Message
 
 # Find proper methods for different python versions
 if hasattr(asyncio.Task, "all_tasks"):
@@ -22,6 +35,46 @@ else:
     _current_task = asyncio.current_task
 
 
+def _get_dispatch_key(context: Context):
+    """
+    Return key that identifies conversation the update belongs to or
+    None if update can't be attributed to any conversation.
+    """
+
+    if isinstance(context.update, Message):
+        return _get_update_key(context.update, context.backend)
+
+    for attribute in ("recipient_id", "sender_id"):
+        value = getattr(context, attribute, None)
+        if value is not None:
+            return (context.backend, value)
+
+    return None
+
+
+def _get_update_key(update, backend):
+    """
+    Return key that identifies conversation the update belongs to before
+    context is created (only messages can be attributed at this point).
+    Messages without recipient and sender are not attributed at all.
+    """
+
+    if not isinstance(update, Message):
+        return None
+
+    for value in (update.recipient_id, update.sender_id):
+        if value is not None:
+            return (backend, value)
+
+    return None
+
+
+def _get_wait_time(queue):
+    """Return time that the last update taken from queue waited in it."""
+
+    return getattr(queue, "last_wait_time", None)
+
+
 class Kutana:
     """
     Main class for kutana application
@@ -30,8 +83,96 @@ class Kutana:
 
     - '.prefixes' - prefixes for commands (default is [".", "/"])
     - '.ignore_initial_spaces' - ignore spaces after prefix (default is True)
+    - '.dispatch_mode' - how updates are passed to handlers:
+        - "concurrent" - every update is handled in it's own task (default)
+        - "ordered" - updates for the same recipient (or sender, if update
+          has no recipient) are handled one after another in order they
+          were received, while different recipients are still handled
+          concurrently
+        - "pool" - updates are handled by fixed amount of long-living
+          consumers (equal to maximum concurrency limit)
+    - '.pool_batch_size' - maximum amount of updates that one consumer
+      takes from queue at once in "pool" mode (default is 1)
+    - '.concurrency_limit_min' and '.concurrency_limit_max' - bounds for
+      amount of concurrently handled updates (default for both is
+      "concurrent_handlers_count"). If bounds differ, the limit is adjusted
+      automatically based on handlers' latency and event loop's lag
+      (see :class:`kutana.limiter.ConcurrencyLimiter`)
+    - '.update_lanes' - list of lanes for queue of acquired updates (by
+      default the queue is plain FIFO). Every lane is a dict with "name",
+      "weight", and optional lists of "kinds" of updates and "backends"
+      identities it accepts. Updates that are not accepted by any lane
+      are put into the last one. Plugins can choose lanes for updates by
+      themselves (see :meth:`kutana.plugin.Plugin.classify_updates`).
+      In "ordered" mode messages for the same recipient are put into the
+      lane of the already queued ones, so they are not reordered.
+      Example: [{"name": "urgent", "weight": 4, "kinds": ["message",
+      "message_event"]}, {"name": "other", "weight": 1}]
+    - '.overflow_policy' - what to do with acquired updates when queue is
+      full (by default backends wait for the free space). Dict with "kind"
+      and options for the policy (see :mod:`kutana.overflow`):
+        - {"kind": "drop_oldest"}
+        - {"kind": "drop_kinds", "kinds": ["message_edit"]}
+        - {"kind": "reply_busy", "text": "Busy!"}
+        - {"kind": "spill", "path": "spilled-updates.bin"} (workers use
+          their own files with index added to the path)
+    - '.handler_timeout' - default timeout (in seconds) for handlers, after
+      which they are cancelled (default is None, no timeout). Can be
+      overridden for handler with "timeout" argument of plugin's decorators
+    - '.drain_timeout' - time (in seconds) that application waits for
+      handlers to finish and backends to flush their requests when
+      shutting down, before cancelling everything (default is 10). New
+      updates are not acquired while draining, but already acquired ones
+      (including spilled) are handled. Updates that were not handled in
+      time are logged and counted in "unhandled_counts" by their kinds
+    - '.routing_cache_size' - amount of messages' texts for which decisions
+      of commands and "on_match" routers are cached (default is None, no
+      cache). Cache is useful when the same texts are received often (e.g.
+      commands without arguments or buttons' labels). See
+      :attr:`Kutana.routing_cache` for it's statistics.
+    - '.concurrent_hooks' - call "completion" and "exception" hooks (that
+      are not deferred) concurrently instead of one after another (default
+      is False)
+    - '.deferred_hooks_workers', '.deferred_hooks_queue_size' and
+      '.deferred_hooks_overflow' - amount of background workers for
+      deferred hooks (default is 4), maximum amount of calls waiting for
+      them (default is 1024) and what to drop when there are too many
+      calls: "drop_oldest" (default) or "drop_new" (see
+      :class:`kutana.hooks.DeferredHooksExecutor` and
+      :attr:`Kutana.hooks_executor` for it's statistics)
+    - '.metrics_enabled' - collect metrics (see :attr:`Kutana.metrics`) of
+      updates, handlers, requests and internal queues (default is False)
+    - '.metrics_host' and '.metrics_port' - address for serving metrics
+      in Prometheus text format at "/metrics" (default host is "127.0.0.1",
+      metrics are not served if port is not specified). Metrics are served
+      only when application is running in single process
+    - '.tracing_exporter' - exporter for traces of updates' handling (by
+      default updates are not traced). Trace contains spans for stages
+      of handling: waiting in the queue, setting up of context, routing,
+      handlers, storages' "get" and backends' requests (including time
+      spent waiting for the vk's "execute" call). Exporter is an instance
+      of :class:`kutana.tracing.TraceExporter` or dict with "kind" and
+      options for the exporter (see :mod:`kutana.tracing`):
+        - {"kind": "log"}
+        - {"kind": "jsonl", "path": "traces.jsonl"} (workers use their own
+          files with index added to the path)
+        - {"kind": "otlp", "url": "http://127.0.0.1:4318/v1/traces"}
+    - '.tracing_sample_rate' - share of updates that are traced, from 0
+      to 1 (default is 1)
+    - '.loop_monitor_enabled' - measure event loop's lag and detect calls
+      that block it (default is False). See :class:`kutana.monitor.LoopMonitor`
+      and :attr:`Kutana.loop_monitor` for collected data
+    - '.loop_monitor_interval' - time (in seconds) between measurements of
+      event loop's lag (default is 0.1)
+    - '.loop_blocking_threshold' - time (in seconds) after which event loop
+      is treated as blocked, and stack of the blocking call is logged with
+      the plugin's handler it was called from (default is 0.5)
 
     :ivar ~.config: Application's configuration
+    :ivar ~.metrics: Application's metrics (:class:`kutana.metrics.KutanaMetrics`)
+        if they are enabled, None otherwise (available after start)
+    :ivar ~.tracer: Application's tracer (:class:`kutana.tracing.Tracer`) if
+        tracing is enabled, None otherwise (available after start)
     """
 
     def __init__(
@@ -41,7 +182,7 @@ class Kutana:
         self._plugins: List[Plugin] = []
         self._backends: List[Backend] = []
         self._storages: Dict[str, Storage] = {"default": MemoryStorage()}
-        self._root_router: Router
+        self._root_router: Optional[CompiledRouter] = None
 
         self._hooks: Dict[str, List[Callable]] = {
             "start": [],
@@ -49,38 +190,97 @@ class Kutana:
             "completion": [],
             "shutdown": [],
         }
+        self._deferred_hooks: Dict[str, List[Callable]] = {
+            "exception": [],
+            "completion": [],
+        }
+        self._hooks_executor: Optional[DeferredHooksExecutor] = None
+        self._loop_monitor: Optional[LoopMonitor] = None
 
         self._concurrent_handlers_count = concurrent_handlers_count
-        self._semaphore = asyncio.Semaphore(value=concurrent_handlers_count)
+        self._worker_index: Optional[int] = None
+        self._limiter: ConcurrencyLimiter
+        self._updates_queue: asyncio.Queue
+        self._lanes: Dict = {}
+        self._acquiring_tasks: List[asyncio.Future] = []
+        self._processing_tasks: Set[asyncio.Future] = set()
+        self._handling_tasks: Set[asyncio.Future] = set()
 
         self.config = {
             "prefixes": ("/",),
             "mention_prefixes": ("", ","),
+            "dispatch_mode": "concurrent",
+            "pool_batch_size": 1,
+            "concurrency_limit_min": None,
+            "concurrency_limit_max": None,
+            "update_lanes": None,
+            "overflow_policy": None,
+            "handler_timeout": None,
+            "drain_timeout": 10,
+            "routing_cache_size": None,
+            "concurrent_hooks": False,
+            "deferred_hooks_workers": 4,
+            "deferred_hooks_queue_size": 1024,
+            "deferred_hooks_overflow": "drop_oldest",
+            "metrics_enabled": False,
+            "metrics_host": "127.0.0.1",
+            "metrics_port": None,
+            "tracing_exporter": None,
+            "tracing_sample_rate": 1.0,
+            "loop_monitor_enabled": False,
+            "loop_monitor_interval": 0.1,
+            "loop_blocking_threshold": 0.5,
         }
 
+        self.metrics: Optional[KutanaMetrics] = None
+
+        # Kinds of acquired updates that were not handled before shutdown
+        self.unhandled_counts: Counter = Counter()
+        self.tracer: Optional[Tracer] = None
+
+    def _update_routers(self):
+        """
+        Compile routers again if they were already prepared (e.g. plugin
+        registered new handlers after application was started).
+        """
+
+        if self._root_router is not None:
+            self._prepare_routers()
+
     def _prepare_routers(self):
         source_routers = []
 
         for plugin in self._plugins:
             source_routers.extend(plugin._routers)
 
-        sorted_source_routers = sorted(
-            source_routers, reverse=True, key=lambda router: router.priority
-        )
+        if self.config["routing_cache_size"]:
+            routing_cache = RoutingCache(self.config["routing_cache_size"])
+        else:
+            routing_cache = None
 
-        root_router = ListRouter()
+        self._root_router = CompiledRouter(source_routers, routing_cache)
 
-        for _, outer_group in groupby(
-            sorted_source_routers, key=lambda router: router.priority
-        ):
-            for cls, inner_group in groupby(outer_group, key=type):
-                if issubclass(cls, Router):
-                    root_router.add_handler(cls.merge(inner_group))
+    async def _handle_event(self, event: str, *args, **kwargs):
+        for handler in self._deferred_hooks.get(event, ()):
+            self._hooks_executor.submit(event, handler, *args, **kwargs)
 
-        self._root_router = root_router
+        handlers = self._hooks[event]
 
-    async def _handle_event(self, event: str, *args, **kwargs):
-        for handler in self._hooks[event]:
+        if self.config["concurrent_hooks"] and len(handlers) > 1:
+            results = await asyncio.gather(
+                *(handler(*args, **kwargs) for handler in handlers),
+                return_exceptions=True,
+            )
+
+            for result in results:
+                if isinstance(result, Exception):
+                    logging.error(
+                        'Error while handling event "%s"', event, exc_info=result
+                    )
+
+            return
+
+        for handler in handlers:
             try:
                 await handler(*args, **kwargs)
             except Exception:
@@ -97,15 +297,17 @@ class Kutana:
         return self._storages
 
     def add_plugin(self, plugin: Plugin):
-        """Add plugin to the application."""
+        """Add plugin to the application (only before it's started)."""
         if plugin in self._plugins:
             raise RuntimeError("Plugin already added")
 
+        # Hooks and classifiers of plugins are collected only once
+        if self._root_router is not None:
+            raise RuntimeError("Plugins can't be added to the started application")
+
         plugin.app = self
         self._plugins.append(plugin)
 
-        self._prepare_routers()
-
     @property
     def plugins(self):
         return self._plugins
@@ -121,15 +323,99 @@ class Kutana:
     def backends(self):
         return self._backends
 
-    async def _run_wrapper(self):
+    @property
+    def updates_queue(self):
+        """Queue of acquired updates (available after start)."""
+        return self._updates_queue
+
+    @property
+    def limiter(self):
+        """Limiter of concurrently handled updates (available after start)."""
+        return self._limiter
+
+    @property
+    def hooks_executor(self) -> Optional[DeferredHooksExecutor]:
+        """Executor of deferred hooks (available after start if needed)."""
+        return self._hooks_executor
+
+    @property
+    def loop_monitor(self) -> Optional[LoopMonitor]:
+        """Monitor of event loop (available after start if enabled)."""
+        return self._loop_monitor
+
+    @property
+    def routing_cache(self) -> Optional[RoutingCache]:
+        """Cache for routing decisions (available after start if enabled)."""
+        return self._root_router.routing_cache
+
+    async def _run_wrapper(self, coroutine=None):
         try:
-            return await self._run()
+            return await (coroutine or self._run())
         except KeyboardInterrupt:
             pass
         except Exception:
             logging.exception("Error while running application:")
 
-    async def _run(self):
+    def _get_updates_processor(self):
+        dispatch_mode = self.config["dispatch_mode"]
+
+        if dispatch_mode == "concurrent":
+            return partial(self._process_updates, dispatch=self._dispatch_concurrently)
+
+        if dispatch_mode == "ordered":
+            return partial(self._process_updates, dispatch=self._dispatch_in_order)
+
+        if dispatch_mode == "pool":
+            return self._process_updates_with_pool
+
+        raise ValueError(f'Unknown dispatch mode: "{dispatch_mode}"')
+
+    def _dispatch_concurrently(self, context: Context):
+        started_at = time.monotonic()
+
+        task = asyncio.ensure_future(self._handle_update(context))
+        task.add_done_callback(
+            lambda _: self._limiter.release(time.monotonic() - started_at)
+        )
+
+        self._handling_tasks.add(task)
+        task.add_done_callback(self._handling_tasks.discard)
+
+    def _dispatch_in_order(self, context: Context):
+        key = _get_dispatch_key(context)
+
+        if key is None:
+            return self._dispatch_concurrently(context)
+
+        lane = self._lanes.get(key)
+
+        if lane is not None:
+            lane.append(context)
+            return
+
+        lane = self._lanes[key] = deque([context])
+
+        task = asyncio.ensure_future(self._handle_lane(key, lane))
+
+        self._handling_tasks.add(task)
+        task.add_done_callback(self._handling_tasks.discard)
+
+    async def _handle_lane(self, key, lane: deque):
+        try:
+            while lane:
+                started_at = time.monotonic()
+
+                try:
+                    await self._handle_update(lane.popleft())
+                finally:
+                    self._limiter.release(time.monotonic() - started_at)
+        finally:
+            del self._lanes[key]
+
+    async def _init(self):
+        logging.debug("Preparing routers")
+        self._prepare_routers()
+
         logging.debug("Initiating storages")
 
         for storage in self._storages.values():
@@ -140,45 +426,500 @@ class Kutana:
             for event, handler in plugin._hooks:
                 self._hooks[event].append(handler)
 
+            for event, handler in plugin._deferred_hooks:
+                self._deferred_hooks[event].append(handler)
+
+        if any(self._deferred_hooks.values()):
+            self._hooks_executor = DeferredHooksExecutor(
+                workers_count=self.config["deferred_hooks_workers"],
+                maxsize=self.config["deferred_hooks_queue_size"],
+                overflow=self.config["deferred_hooks_overflow"],
+            )
+            self._hooks_executor.start()
+
+        max_limit = (
+            self.config["concurrency_limit_max"] or self._concurrent_handlers_count
+        )
+        min_limit = self.config["concurrency_limit_min"] or max_limit
+
+        self._limiter = ConcurrencyLimiter(min_limit, max_limit)
+        self._limiter.start()
+
+        if self.config["metrics_enabled"]:
+            self._init_metrics()
+
+        if self.config["tracing_exporter"]:
+            exporter_config = self.config["tracing_exporter"]
+
+            # Processes should never share the file for traces
+            if isinstance(exporter_config, dict) and exporter_config.get("path"):
+                exporter_config = {
+                    **exporter_config,
+                    "path": self._get_process_path(exporter_config["path"]),
+                }
+
+            self.tracer = Tracer(
+                make_trace_exporter(exporter_config),
+                self.config["tracing_sample_rate"],
+            )
+            self.tracer.start()
+
+    def _init_metrics(self):
+        self.metrics = KutanaMetrics()
+
+        for backend in self._backends:
+            backend.metrics = self.metrics
+
+        def _get_queue():
+            return getattr(self, "_updates_queue", None)
+
+        def _get_lanes_values(attribute):
+            queue = _get_queue()
+
+            if not isinstance(queue, UpdatesQueue):
+                return {}
+
+            return {
+                (name,): getattr(lane, attribute) for name, lane in queue.lanes.items()
+            }
+
+        def _get_received_counts():
+            queue = _get_queue()
+
+            if not isinstance(queue, UpdatesQueue):
+                return {}
+
+            return {
+                (identity,): amount
+                for identity, amount in queue.received_counts.items()
+            }
+
+        self.metrics.updates.callback = _get_received_counts
+
+        def _get_overflow_counts():
+            overflow = getattr(_get_queue(), "overflow", None)
+
+            if overflow is None:
+                return {}
+
+            return dict(overflow.counts)
+
+        def _get_hooks_executor_value(attribute):
+            if self._hooks_executor is None:
+                return 0
+
+            return getattr(self._hooks_executor, attribute)
+
+        def _get_loop_lag_percentiles():
+            if self._loop_monitor is None:
+                return {}
+
+            return {
+                (str(quantile),): lag
+                for quantile, lag in self._loop_monitor.get_percentiles().items()
+            }
+
+        def _get_blocked_counts():
+            if self._loop_monitor is None:
+                return {}
+
+            return dict(self._loop_monitor.blocked_counts)
+
+        def _get_coalesced_counts():
+            counts = {}
+
+            for backend in self._backends:
+                if backend.coalescer is None:
+                    continue
+
+                for source, amount in backend.coalescer.counts.items():
+                    key = (backend.get_identity(), source)
+                    counts[key] = counts.get(key, 0) + amount
+
+            return counts
+
+        def _get_routing_cache_value(attribute):
+            if self.routing_cache is None:
+                return 0
+
+            return getattr(self.routing_cache, attribute)
+
+        self.metrics.gauge(
+            "kutana_queue_depth",
+            "Updates waiting in the queue.",
+            callback=lambda: _get_queue().qsize() if _get_queue() else 0,
+        )
+        self.metrics.gauge(
+            "kutana_lane_depth",
+            "Updates waiting in the queue's lane.",
+            ("lane",),
+            callback=lambda: _get_lanes_values("depth"),
+        )
+        self.metrics.gauge(
+            "kutana_lane_wait_seconds_average",
+            "Average time updates waited in the queue's lane.",
+            ("lane",),
+            callback=lambda: _get_lanes_values("wait_time_average"),
+        )
+        self.metrics.gauge(
+            "kutana_lane_wait_seconds_max",
+            "Maximum time updates waited in the queue's lane.",
+            ("lane",),
+            callback=lambda: _get_lanes_values("wait_time_max"),
+        )
+        self.metrics.counter(
+            "kutana_overflow_updates_total",
+            "Updates affected by the queue's overflow policy.",
+            ("action", "kind"),
+            callback=_get_overflow_counts,
+        )
+        self.metrics.gauge(
+            "kutana_concurrency_in_flight",
+            "Updates that are handled right now.",
+            callback=lambda: self._limiter.in_flight,
+        )
+        self.metrics.gauge(
+            "kutana_concurrency_limit",
+            "Limit for amount of concurrently handled updates.",
+            callback=lambda: self._limiter.limit,
+        )
+        self.metrics.gauge(
+            "kutana_deferred_hooks_depth",
+            "Calls of deferred hooks waiting in the queue.",
+            callback=lambda: _get_hooks_executor_value("depth"),
+        )
+        self.metrics.counter(
+            "kutana_deferred_hooks_dropped_total",
+            "Calls of deferred hooks dropped because queue was full.",
+            callback=lambda: _get_hooks_executor_value("dropped_count"),
+        )
+        self.metrics.counter(
+            "kutana_requests_coalesced_total",
+            "Requests that were served by identical ones instead of sending.",
+            ("backend", "source"),
+            callback=_get_coalesced_counts,
+        )
+        self.metrics.counter(
+            "kutana_routing_cache_hits_total",
+            "Messages which texts were found in the routing cache.",
+            callback=lambda: _get_routing_cache_value("hits"),
+        )
+        self.metrics.counter(
+            "kutana_routing_cache_misses_total",
+            "Messages which texts were not found in the routing cache.",
+            callback=lambda: _get_routing_cache_value("misses"),
+        )
+        self.metrics.gauge(
+            "kutana_loop_lag_seconds",
+            "Percentiles of event loop's lag.",
+            ("quantile",),
+            callback=_get_loop_lag_percentiles,
+        )
+        self.metrics.counter(
+            "kutana_loop_blocked_total",
+            "Calls that blocked event loop longer than threshold.",
+            ("plugin", "handler"),
+            callback=_get_blocked_counts,
+        )
+
+    def _start_loop_monitor(self):
+        if not self.config["loop_monitor_enabled"]:
+            return
+
+        logging.debug("Starting event loop monitor")
+
+        self._loop_monitor = LoopMonitor(
+            interval=self.config["loop_monitor_interval"],
+            blocking_threshold=self.config["loop_blocking_threshold"],
+        )
+        self._loop_monitor.start()
+
+    def _get_process_path(self, path):
+        """
+        Return path of the file that is used only by the current process
+        (workers add their index to the path).
+        """
+
+        if self._worker_index is None:
+            return path
+
+        return f"{path}.worker{self._worker_index}"
+
+    def _make_updates_queue(self, maxsize):
+        # Only queue with lanes tracks received updates and time they waited
+        if (
+            not self.config["update_lanes"]
+            and not self.config["overflow_policy"]
+            and self.tracer is None
+            and self.metrics is None
+        ):
+            self._updates_queue = asyncio.Queue(maxsize=maxsize)
+            return self._updates_queue
+
+        lanes = [UpdatesLane(**lane) for lane in self.config["update_lanes"] or ()]
+
+        overflow_config = self.config["overflow_policy"]
+
+        # Processes should never share the file for spilled updates
+        if overflow_config and overflow_config.get("path"):
+            overflow_config = {
+                **overflow_config,
+                "path": self._get_process_path(overflow_config["path"]),
+            }
+
+        classifiers = []
+        for plugin in self._plugins:
+            classifiers.extend(plugin._classifiers)
+
+        self._updates_queue = UpdatesQueue(
+            lanes or [UpdatesLane("default")],
+            classifiers,
+            maxsize=maxsize,
+            overflow=make_overflow_policy(overflow_config, self._backends),
+            get_key=(
+                _get_update_key if self.config["dispatch_mode"] == "ordered" else None
+            ),
+        )
+        return self._updates_queue
+
+    async def _run(self):
+        process_updates = self._get_updates_processor()
+
+        await self._init()
+
+        self._start_loop_monitor()
+
         logging.debug("Creating queue for acquired updates")
-        queue = asyncio.Queue(maxsize=self._concurrent_handlers_count)
+        queue = self._make_updates_queue(self._limiter.max_limit)
 
         logging.debug("Preparing backends and starting background updates acquiring")
         for backend in self._backends:
             await backend.on_start(self)
-            asyncio.ensure_future(backend.acquire_updates(queue))
+            self._acquiring_tasks.append(
+                asyncio.ensure_future(backend.acquire_updates(queue))
+            )
+
+        if self.metrics is not None and self.config["metrics_port"]:
+            logging.debug("Starting metrics server")
+            await self.metrics.start_server(
+                self.config["metrics_host"], self.config["metrics_port"]
+            )
 
         logging.debug("Handling start event")
         await self._handle_event("start")
 
-        logging.debug("Running processing loop")
+        await process_updates(queue)
+
+    async def _run_worker(self, connection, workers_count):
+        process_updates = self._get_updates_processor()
+
+        await self._init()
+
+        self._start_loop_monitor()
+
+        logging.debug("Creating queue for received updates")
+        queue = self._make_updates_queue(self._limiter.max_limit)
+
+        logging.debug("Preparing backends and starting background updates receiving")
+        for backend in self._backends:
+            # Acquirer can perform requests too (e.g. for overflow policies)
+            backend.split_rate_limits(workers_count + 1)
+            await backend.on_worker_start(self, workers_count)
+
+        self._acquiring_tasks.append(
+            asyncio.ensure_future(self._receive_updates(connection, queue))
+        )
+
+        logging.debug("Handling start event")
+        await self._handle_event("start")
+
+        await process_updates(queue)
+
+    async def _receive_updates(self, connection, queue: asyncio.Queue):
+        loop = asyncio.get_event_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+
         try:
             while True:
-                await self._semaphore.acquire()
+                try:
+                    backend_index, data = await loop.run_in_executor(
+                        executor, connection.recv
+                    )
+                except EOFError:
+                    logging.info("Updates acquirer is gone, stopping worker")
+                    self.stop()
+                    return
+
+                backend = self._backends[backend_index]
 
+                await queue.put((backend.load_update(data), backend))
+        finally:
+            executor.shutdown(wait=False)
+
+    async def _run_acquirer(self, connections):
+        logging.debug("Creating queue for acquired updates")
+        queue = self._make_updates_queue(self._concurrent_handlers_count)
+
+        logging.debug("Preparing backends and starting background updates acquiring")
+        for backend in self._backends:
+            backend.split_rate_limits(len(connections) + 1)
+            await backend.on_start(self)
+            self._acquiring_tasks.append(
+                asyncio.ensure_future(backend.acquire_updates(queue))
+            )
+
+        loop = asyncio.get_event_loop()
+        counter = count()
+
+        # One thread per connection keeps updates for every worker in order
+        executors = [ThreadPoolExecutor(max_workers=1) for _ in connections]
+
+        logging.debug("Running distributing loop")
+        try:
+            while True:
                 update, backend = await queue.get()
                 context = Context(self, update, backend)
                 await backend.setup_context(context)
 
-                task = asyncio.ensure_future(self._handle_update(context))
-                task.add_done_callback(lambda _: self._semaphore.release())
+                key = _get_dispatch_key(context)
+
+                if key is None:
+                    index = next(counter) % len(connections)
+                else:
+                    index = hash(key) % len(connections)
+
+                await loop.run_in_executor(
+                    executors[index],
+                    connections[index].send,
+                    (self._backends.index(backend), backend.dump_update(update)),
+                )
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=False)
+
+    async def _process_updates(self, queue: asyncio.Queue, dispatch):
+        logging.debug("Running processing loop")
+
+        self._processing_tasks.add(_current_task())
+
+        try:
+            while True:
+                await self._limiter.acquire()
+
+                try:
+                    update, backend = await queue.get()
+                    context = await self._make_context(
+                        update, backend, _get_wait_time(queue)
+                    )
+                except BaseException:
+                    self._limiter.release()
+                    raise
+
+                dispatch(context)
         except asyncio.CancelledError:
             raise
         except Exception:
             self.stop()
             raise
 
+    async def _process_updates_with_pool(self, queue: asyncio.Queue):
+        logging.debug("Running %d consumers of updates", self._limiter.max_limit)
+
+        consumers = [
+            asyncio.ensure_future(
+                self._consume_updates(queue, self.config["pool_batch_size"])
+            )
+            for _ in range(self._limiter.max_limit)
+        ]
+
+        self._processing_tasks.update(consumers)
+
+        try:
+            await asyncio.gather(*consumers)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stop()
+            raise
+
+    async def _consume_updates(self, queue: asyncio.Queue, batch_size: int):
+        batch = []
+        task = _current_task()
+
+        while True:
+            batch.append((*await queue.get(), _get_wait_time(queue)))
+
+            while len(batch) < batch_size:
+                try:
+                    batch.append((*queue.get_nowait(), _get_wait_time(queue)))
+                except asyncio.QueueEmpty:
+                    break
+
+            # Consumer is not interrupted by draining while it's handling
+            self._handling_tasks.add(task)
+
+            try:
+                for update, backend, wait_time in batch:
+                    context = await self._make_context(update, backend, wait_time)
+
+                    await self._limiter.acquire()
+                    started_at = time.monotonic()
+
+                    try:
+                        await self._handle_update(context)
+                    finally:
+                        self._limiter.release(time.monotonic() - started_at)
+            finally:
+                self._handling_tasks.discard(task)
+
+            batch.clear()
+
+    async def _make_context(self, update, backend, wait_time=None):
+        """
+        Return context for the update (with started trace if update is
+        sampled). "wait_time" is time that update waited in the queue.
+        """
+
+        context = Context(self, update, backend)
+
+        if self.tracer is not None:
+            now = time.perf_counter()
+
+            context.trace = self.tracer.start_trace(
+                now - (wait_time or 0),
+                backend=backend.get_identity(),
+                kind=get_update_kind(update),
+            )
+
+            if context.trace is not None and wait_time is not None:
+                context.trace.add_span("queue", now - wait_time, now)
+
+        with start_span(context.trace, "setup_context"):
+            await backend.setup_context(context)
+
+        return context
+
     async def _handle_update(self, context: Context):
         logging.debug("Processing update %s", context.update)
 
+        trace = context.trace
+
         try:
-            await self._root_router.handle(context.update, context)
-            await self._handle_event("completion", context)
+            with start_span(trace, "routing"):
+                await self._root_router.handle(context.update, context)
+
+            with start_span(trace, "hooks", event="completion"):
+                await self._handle_event("completion", context)
         except asyncio.CancelledError:
             raise
         except Exception as exc:
             logging.exception("Exception while handling the update")
-            await self._handle_event("exception", context, exc)
+
+            with start_span(trace, "hooks", event="exception"):
+                await self._handle_event("exception", context, exc)
+        finally:
+            if trace is not None:
+                self.tracer.finish_trace(trace)
 
     async def _shutdown_wrapper(self):
         try:
@@ -186,9 +927,108 @@ class Kutana:
         except Exception:
             logging.exception("Error while shutting down application:")
 
+    def _get_queued_updates_count(self):
+        """Return amount of acquired updates that are not dispatched yet."""
+
+        queue = getattr(self, "_updates_queue", None)
+
+        if queue is None:
+            return 0
+
+        overflow = getattr(queue, "overflow", None)
+
+        return queue.qsize() + getattr(overflow, "pending", 0)
+
+    def _drop_queued_updates(self):
+        """Take updates left in the queue and count them as unhandled."""
+
+        queue = getattr(self, "_updates_queue", None)
+
+        if queue is None:
+            return
+
+        amount = 0
+
+        # Spilled updates are returned into the queue when it's not full
+        while not queue.empty():
+            update, _ = queue.get_nowait()
+            self.unhandled_counts[get_update_kind(update)] += 1
+            amount += 1
+
+        if amount:
+            logging.warning("%d acquired update(s) were not handled", amount)
+
+    async def _drain(self):
+        timeout = self.config["drain_timeout"]
+
+        if not timeout:
+            return
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        current_task = _current_task()
+
+        logging.debug("Stopping acquiring of updates")
+        for task in self._acquiring_tasks:
+            if task is not current_task:
+                task.cancel()
+
+        # Updates that were already acquired are still dispatched
+        logging.info(
+            "Waiting for %d queued update(s) and %d handler(s) to finish...",
+            self._get_queued_updates_count(),
+            len(self._handling_tasks - {current_task}),
+        )
+
+        while loop.time() < deadline:
+            handling_tasks = self._handling_tasks - {current_task}
+
+            if handling_tasks:
+                await asyncio.wait(
+                    handling_tasks,
+                    timeout=min(0.1, max(0, deadline - loop.time())),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            elif self._get_queued_updates_count():
+                # Processing loops take updates from the queue
+                await asyncio.sleep(0.001)
+            else:
+                break
+
+        logging.debug("Stopping processing of updates")
+        for task in self._processing_tasks:
+            if task is not current_task and task not in self._handling_tasks:
+                task.cancel()
+
+        not_finished = self._handling_tasks - {current_task}
+
+        if not_finished:
+            logging.warning("%d handler(s) didn't finish in time", len(not_finished))
+
+        if self._hooks_executor is not None:
+            logging.debug("Waiting for deferred hooks")
+            await asyncio.wait(
+                [asyncio.ensure_future(self._hooks_executor.join())],
+                timeout=max(0, deadline - loop.time()),
+            )
+
+        logging.debug("Flushing backends")
+        flushing_tasks = [
+            asyncio.ensure_future(backend.on_drain(self)) for backend in self._backends
+        ]
+
+        if flushing_tasks:
+            await asyncio.wait(flushing_tasks, timeout=max(0, deadline - loop.time()))
+
     async def _shutdown(self):
         logging.info("Gracecfully shutting application down...")
 
+        # Wait for handlers and backends to finish their work
+        await self._drain()
+
+        if self._loop_monitor is not None:
+            self._loop_monitor.stop()
+
         # Cancel everything
         tasks = []
 
@@ -199,6 +1039,8 @@ class Kutana:
 
         await asyncio.gather(*tasks, return_exceptions=True)
 
+        self._drop_queued_updates()
+
         # Clean up
         tasks = []
 
@@ -207,17 +1049,24 @@ class Kutana:
 
         tasks.append(self._handle_event("shutdown"))
 
+        if self.metrics is not None:
+            tasks.append(self.metrics.stop_server())
+
+        if self.tracer is not None:
+            tasks.append(self.tracer.stop())
+
         await asyncio.gather(*tasks, return_exceptions=True)
 
+        overflow = getattr(getattr(self, "_updates_queue", None), "overflow", None)
+        if overflow is not None:
+            overflow.close()
+
         # Stop loop
         asyncio.get_event_loop().stop()
 
-    def run(self):
-        """Run the application."""
-        logging.info("Starting application...")
-
+    def _run_forever(self, coroutine):
         try:
-            asyncio.ensure_future(self._run_wrapper())
+            asyncio.ensure_future(self._run_wrapper(coroutine))
             asyncio.get_event_loop().run_forever()
         except KeyboardInterrupt:
             asyncio.ensure_future(self._shutdown_wrapper())
@@ -226,6 +1075,78 @@ class Kutana:
             asyncio.get_event_loop().close()
             logging.info("Stopped application")
 
+    def run(self):
+        """Run the application."""
+        logging.info("Starting application...")
+
+        self._run_forever(self._run())
+
+    def _run_worker_process(
+        self, connection, foreign_connections, workers_count, worker_index
+    ):
+        self._worker_index = worker_index
+
+        # Close other ends of the pipes, so acquirer's exit can be detected
+        for foreign_connection in foreign_connections:
+            foreign_connection.close()
+
+        # Never reuse event loop inherited from the parent process
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+        self._run_forever(self._run_worker(connection, workers_count))
+
+    def run_with_workers(self, workers_count):
+        """
+        Run the application using multiple processes. Current process
+        acquires updates from backends and passes them to one of the
+        "workers_count" processes that handle them. Updates for the
+        same recipient are always passed to the same process.
+
+        Workers are started with "fork", so this method is not
+        available on platforms without it. Every worker has it's own
+        copy of plugins and storages, so you should use storages that
+        can be shared between processes (e.g. sqlite or mongodb).
+        Backends share their rate limits between workers and the
+        acquiring process.
+        """
+
+        if workers_count < 2:
+            return self.run()
+
+        logging.info("Starting application with %d workers...", workers_count)
+
+        mp_context = multiprocessing.get_context("fork")
+
+        receivers, senders = zip(
+            *(mp_context.Pipe(duplex=False) for _ in range(workers_count))
+        )
+
+        processes = []
+
+        for worker_index, receiver in enumerate(receivers):
+            process = mp_context.Process(
+                target=self._run_worker_process,
+                args=(receiver, senders, workers_count, worker_index),
+                daemon=False,
+            )
+            process.start()
+            processes.append(process)
+
+        for receiver in receivers:
+            receiver.close()
+
+        try:
+            self._run_forever(self._run_acquirer(senders))
+        finally:
+            for sender in senders:
+                sender.close()
+
+            for process in processes:
+                process.join(timeout=30)
+
+                if process.is_alive():
+                    process.terminate()
+
     def stop(self):
         """Stop the application."""
         return asyncio.ensure_future(self._shutdown_wrapper())
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from itertools import chain
+from typing import Callable, Dict, List, Optional
+
+from .update import Message
+
+
+def get_update_kind(update):
+    """
+    Return kind of the update: "message" for messages, value of the
+    "type" field for raw updates that have it (e.g. vk) or the name
+    of the first field that is not "update_id" (e.g. tg).
+    """
+
+    if isinstance(update, Message):
+        return "message"
+
+    if isinstance(update, dict):
+        if isinstance(update.get("type"), str):
+            return update["type"]
+
+        for key in update:
+            if key != "update_id":
+                return key
+
+    return None
+
+
+class UpdatesLane:
+    """
+    Lane of the :class:`UpdatesQueue` with it's own statistics.
+
+    :param name: name of the lane
+    :param weight: share of dequeued updates that this lane gets when
+        other lanes are not empty
+    :param kinds: kinds of updates that are put into this lane (see
+        :func:`get_update_kind`), any kind if not specified
+    :param backends: identities of backends which updates are put
+        into this lane, any backend if not specified
+    """
+
+    def __init__(
+        self,
+        name: str,
+        weight: int = 1,
+        kinds: Optional[List[str]] = None,
+        backends: Optional[List[str]] = None,
+    ):
+        if weight < 1:
+            raise ValueError(f'Bad weight for lane "{name}": {weight}')
+
+        self.name = name
+        self.weight = weight
+        self.kinds = set(kinds) if kinds else None
+        self.backends = set(backends) if backends else None
+
+        self.items: deque = deque()
+        self.current_weight = 0
+
+        self.dequeued_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @property
+    def depth(self):
+        return len(self.items)
+
+    @property
+    def wait_time_average(self):
+        if not self.dequeued_count:
+            return 0.0
+        return self.wait_time_total / self.dequeued_count
+
+    def accepts(self, kind, identity):
+        return (self.kinds is None or kind in self.kinds) and (
+            self.backends is None or identity in self.backends
+        )
+
+
+class _UpdatesLanes:
+    """Storage for :class:`UpdatesQueue` with weighted-fair dequeuing."""
+
+    def __init__(
+        self,
+        lanes: List[UpdatesLane],
+        classifiers: List[Callable],
+        get_key: Optional[Callable] = None,
+    ):
+        self.lanes = lanes
+        self.classifiers = classifiers
+        self.get_key = get_key
+
+        self._lanes_by_name = {lane.name: lane for lane in lanes}
+        self._size = 0
+
+        # Lanes (and amounts of items in them) for keys with queued items
+        self._keys_lanes: Dict = {}
+
+        self.last_wait_time: Optional[float] = None
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return chain.from_iterable(
+            (item for _, _, item in lane.items) for lane in self.lanes
+        )
+
+    def _classify(self, update, backend):
+        for classifier in self.classifiers:
+            # Broken classifier should never stop acquiring of updates
+            try:
+                name = classifier(update, backend)
+            except Exception:
+                logging.exception("Error while classifying update %s", update)
+                continue
+
+            lane = self._lanes_by_name.get(name)
+            if lane is not None:
+                return lane
+
+        kind = get_update_kind(update)
+        identity = backend.get_identity()
+
+        for lane in self.lanes:
+            if lane.accepts(kind, identity):
+                return lane
+
+        return self.lanes[-1]
+
+    def _release_key(self, key):
+        if key is None:
+            return
+
+        key_lane = self._keys_lanes[key]
+        key_lane[1] -= 1
+
+        if not key_lane[1]:
+            del self._keys_lanes[key]
+
+    def append(self, item):
+        key = self.get_key(*item) if self.get_key is not None else None
+
+        # Items with the same key are kept in one lane to keep their order
+        key_lane = self._keys_lanes.get(key) if key is not None else None
+
+        if key_lane is not None:
+            lane = key_lane[0]
+            key_lane[1] += 1
+        else:
+            lane = self._classify(*item)
+
+            if key is not None:
+                self._keys_lanes[key] = [lane, 1]
+
+        lane.items.append((time.monotonic(), key, item))
+        self._size += 1
+
+    def remove_oldest(self, predicate=None):
+        oldest_lane = None
+        oldest_index = None
+        oldest_put_at = None
+
+        for lane in self.lanes:
+            for index, (put_at, _, item) in enumerate(lane.items):
+                if predicate is None or predicate(item):
+                    if oldest_put_at is None or put_at < oldest_put_at:
+                        oldest_lane, oldest_index, oldest_put_at = lane, index, put_at
+                    break
+
+        if oldest_lane is None:
+            return None
+
+        _, key, item = oldest_lane.items[oldest_index]
+        del oldest_lane.items[oldest_index]
+        self._size -= 1
+        self._release_key(key)
+
+        return item
+
+    def popleft(self):
+        # Smooth weighted round-robin between non-empty lanes
+        total_weight = 0
+        chosen_lane = None
+
+        for lane in self.lanes:
+            if not lane.items:
+                continue
+
+            lane.current_weight += lane.weight
+            total_weight += lane.weight
+
+            if chosen_lane is None or lane.current_weight > chosen_lane.current_weight:
+                chosen_lane = lane
+
+        if chosen_lane is None:
+            raise IndexError("pop from an empty lanes")
+
+        chosen_lane.current_weight -= total_weight
+
+        put_at, key, item = chosen_lane.items.popleft()
+        self._size -= 1
+        self._release_key(key)
+
+        wait_time = time.monotonic() - put_at
+        chosen_lane.dequeued_count += 1
+        chosen_lane.wait_time_total += wait_time
+        chosen_lane.wait_time_max = max(chosen_lane.wait_time_max, wait_time)
+        self.last_wait_time = wait_time
+
+        return item
+
+
+class UpdatesQueue:
+    """
+    Queue for pairs of (update, backend) that splits updates into
+    lanes and dequeues them using weighted-fair order. Queue has the
+    same interface as :class:`asyncio.Queue` (except for tracking of
+    unfinished tasks).
+
+    Update is put into the lane which name is returned by the first
+    classifier that returned known name, or into the first lane that
+    accepts update (see :class:`UpdatesLane`), or into the last lane.
+    If "get_key" is provided, updates with the same key (e.g. from the
+    same conversation) are put into the lane of the queued update with
+    this key, so they are dequeued in order they were put.
+
+    If overflow policy is provided, it's used for handling updates
+    when queue is full (see :class:`kutana.overflow.OverflowPolicy`).
+    Amounts of updates put into the queue (including ones handled by
+    overflow policy) are stored in "received_counts" by backends'
+    identities.
+
+    :param lanes: list of lanes
+    :param classifiers: functions that accept update and backend and
+        return name of the lane or None
+    :param maxsize: maximum size of the queue (in total)
+    :param overflow: policy for handling updates when queue is full
+    :param get_key: function that accepts update and backend and
+        returns hashable key or None
+    """
+
+    def __init__(
+        self,
+        lanes: List[UpdatesLane],
+        classifiers: Optional[List[Callable]] = None,
+        maxsize: int = 0,
+        overflow=None,
+        get_key: Optional[Callable] = None,
+    ):
+        if not lanes:
+            raise ValueError("No lanes provided for the queue")
+
+        self._lanes_storage = _UpdatesLanes(lanes, classifiers or [], get_key)
+
+        self.maxsize = maxsize
+        self.overflow = overflow
+
+        self.received_counts: Counter = Counter()
+
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def _update_events(self):
+        if self._lanes_storage:
+            self._not_empty.set()
+        else:
+            self._not_empty.clear()
+
+        if self.full():
+            self._not_full.clear()
+        else:
+            self._not_full.set()
+
+    def qsize(self):
+        return len(self._lanes_storage)
+
+    def empty(self):
+        return not self._lanes_storage
+
+    def full(self):
+        return 0 < self.maxsize <= len(self._lanes_storage)
+
+    async def put(self, item):
+        self.received_counts[item[1].get_identity()] += 1
+
+        if self.overflow is not None and self.overflow.should_handle(self):
+            if self.overflow.handle(self, item):
+                return
+
+        while self.full():
+            await self._not_full.wait()
+
+        self._lanes_storage.append(item)
+        self._update_events()
+
+    def put_nowait(self, item):
+        """
+        Put item into the queue without counting it and without checking
+        overflow policy. Raises :class:`asyncio.QueueFull` if queue is full.
+        """
+
+        if self.full():
+            raise asyncio.QueueFull
+
+        self._lanes_storage.append(item)
+        self._update_events()
+
+    async def get(self):
+        while self.empty():
+            await self._not_empty.wait()
+
+        return self.get_nowait()
+
+    def get_nowait(self):
+        if self.empty():
+            raise asyncio.QueueEmpty
+
+        item = self._lanes_storage.popleft()
+        self._update_events()
+
+        if self.overflow is not None:
+            self.overflow.after_get(self)
+
+        return item
+
+    def remove_oldest(self, predicate=None):
+        """
+        Remove and return the oldest item in the queue (that satisfies
+        predicate if provided) or return None if there is no such item.
+        """
+
+        item = self._lanes_storage.remove_oldest(predicate)
+
+        if item is not None:
+            self._update_events()
+
+        return item
+
+    @property
+    def last_wait_time(self) -> Optional[float]:
+        """Time (in seconds) that the last dequeued update waited."""
+        return self._lanes_storage.last_wait_time
+
+    @property
+    def lanes(self) -> Dict[str, UpdatesLane]:
+        return {lane.name: lane for lane in self._lanes_storage.lanes}
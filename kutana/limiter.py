@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+
+class ConcurrencyLimiter:
+    """
+    Limits amount of concurrently handled updates.
+
+    If "min_limit" is equal to "max_limit", limiter works like a plain
+    semaphore. Otherwise limit is adjusted using AIMD: it's decreased
+    multiplicatively when handlers' latency grows compared to the
+    observed baseline or when event loop lags, and it's increased
+    additively while limit is fully utilized and everything is fine.
+
+    :param min_limit: lowest possible limit
+    :param max_limit: highest possible limit (and initial one)
+    :param latency_tolerance: latency is treated as grown when it's this
+        many times larger than the baseline
+    :param lag_threshold: event loop is treated as lagging when it's lag
+        (in seconds) is larger than this value
+    :param backoff_ratio: limit is multiplied by this value on decrease
+    """
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float = 2.0,
+        lag_threshold: float = 0.1,
+        backoff_ratio: float = 0.9,
+    ):
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError(f"Bad limits for limiter: {min_limit}, {max_limit}")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.lag_threshold = lag_threshold
+        self.backoff_ratio = backoff_ratio
+
+        self.in_flight = 0
+        self.lag = 0.0
+
+        self._limit = float(max_limit)
+        self._baseline_latency: Optional[float] = None
+        self._decreased_at = 0.0
+        self._waiters: deque = deque()
+        self._lag_monitor: Optional[asyncio.Task] = None
+
+    @property
+    def adaptive(self):
+        return self.min_limit != self.max_limit
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def start(self, lag_check_interval=0.5):
+        """Start background measuring of event loop lag (if needed)."""
+
+        if self.adaptive and self._lag_monitor is None:
+            self._lag_monitor = asyncio.ensure_future(
+                self._monitor_lag(lag_check_interval)
+            )
+
+    def stop(self):
+        if self._lag_monitor is not None:
+            self._lag_monitor.cancel()
+            self._lag_monitor = None
+
+    async def _monitor_lag(self, interval):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(interval)
+            self.lag = max(0.0, loop.time() - started_at - interval)
+
+    async def acquire(self):
+        if not self._waiters and self.in_flight < self.limit:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, latency: Optional[float] = None):
+        """
+        Release acquired slot. If latency of the handling (in seconds) is
+        provided, it is used for adjusting the limit.
+        """
+
+        self.in_flight -= 1
+
+        if latency is not None and self.adaptive:
+            self._adjust(latency)
+
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _adjust(self, latency: float):
+        if self._baseline_latency is None or latency < self._baseline_latency:
+            self._baseline_latency = latency
+        else:
+            # Let baseline slowly follow latency up, so it's not stuck forever
+            self._baseline_latency += (latency - self._baseline_latency) * 0.01
+
+        now = time.monotonic()
+
+        congested = (
+            latency > self._baseline_latency * self.latency_tolerance
+            or self.lag > self.lag_threshold
+        )
+
+        if congested:
+            # Decrease no more than once per observed latency
+            if now - self._decreased_at >= latency:
+                self._decreased_at = now
+                self._set_limit(self._limit * self.backoff_ratio)
+        elif self.in_flight + 1 >= self.limit:
+            self._set_limit(self._limit + 1 / self._limit)
+
+    def _set_limit(self, limit: float):
+        old_limit = self.limit
+
+        self._limit = min(max(limit, self.min_limit), self.max_limit)
+
+        if self.limit != old_limit:
+            logging.debug("Concurrency limit changed to %d", self.limit)
+
+
+class RateLimiter:
+    """
+    Token bucket that limits rate of actions. Rate can be decreased (e.g.
+    when remote side reports too many requests), after which it's linearly
+    restored to the maximum one over "recovery_time" seconds.
+
+    :param rate: maximum amount of actions per second (and initial one)
+    :param burst: maximum amount of actions that can be performed at once
+        after being idle
+    :param min_rate: lowest possible rate (default is tenth of the rate)
+    :param recovery_time: time (in seconds) for restoring rate from the
+        lowest possible one to the maximum
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        min_rate: Optional[float] = None,
+        recovery_time: float = 10.0,
+    ):
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Bad rate or burst for limiter: {rate}, {burst}")
+
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 10
+        self.burst = burst
+        self.recovery_time = recovery_time
+
+        self.rate = rate
+
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def _update(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+        if self.rate < self.max_rate:
+            self.rate = min(
+                self.max_rate,
+                self.rate
+                + elapsed * (self.max_rate - self.min_rate) / self.recovery_time,
+            )
+
+    @property
+    def available(self):
+        """True if action can be performed right now."""
+        self._update()
+        return self._tokens >= 1
+
+    def get_delay(self):
+        """Return time (in seconds) until action can be performed."""
+        self._update()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def try_acquire(self):
+        """Return True if action can be performed right now and count it."""
+
+        self._update()
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+
+        return True
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep(self.get_delay())
+
+    def decrease(self, ratio: float = 0.5):
+        """Decrease rate and pause until the next action is allowed."""
+
+        self._update()
+
+        self.rate = max(self.min_rate, self.rate * ratio)
+        self._tokens = min(self._tokens, 0.0)
+
+        logging.debug("Rate limit decreased to %.2f per second", self.rate)
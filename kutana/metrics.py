@@ -0,0 +1,255 @@
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+
+    formatted = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values)
+    )
+
+    return f"{{{formatted}}}"
+
+
+class Metric:
+    """
+    Base class for metrics. Values are stored for every combination of
+    labels' values. If "callback" is provided, values are taken from it
+    when metrics are collected: it should return a number (if metric has
+    no labels) or a dict with tuples of labels' values as keys.
+    """
+
+    type_name = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable] = None,
+    ):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.callback = callback
+
+        self.values: Dict[Tuple, float] = {}
+
+    def collect(self):
+        """Return list of pairs (labels' values, value)."""
+
+        if self.callback is None:
+            return list(self.values.items())
+
+        values = self.callback()
+
+        if isinstance(values, dict):
+            return list(values.items())
+
+        return [((), values)]
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+        for label_values, value in self.collect():
+            lines.append(
+                f"{self.name}{_format_labels(self.labels, label_values)} "
+                f"{_format_value(value)}"
+            )
+
+        return lines
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value, *label_values):
+        self.values[label_values] = value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets))
+
+        # Counts for every bucket (and +Inf), sum and count of values
+        self.values: Dict[Tuple, list] = {}  # type: ignore
+
+    def observe(self, value, *label_values):
+        state = self.values.get(label_values)
+
+        if state is None:
+            state = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+        labels = (*self.labels, "le")
+
+        for label_values, (counts, total, count) in self.collect():
+            cumulative = 0
+
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(labels, (*label_values, _format_value(bound)))} "
+                    f"{cumulative}"
+                )
+
+            formatted_labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{formatted_labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{formatted_labels} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registry of metrics that can render them in Prometheus text format
+    and serve them over HTTP.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._app_runner: Optional[web.AppRunner] = None
+
+    def __getitem__(self, name) -> Metric:
+        return self._metrics[name]
+
+    def __contains__(self, name):
+        return name in self._metrics
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric "{metric.name}" is already registered')
+
+        self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(self, name, description, labels=(), callback=None) -> Counter:
+        return self.register(Counter(name, description, labels, callback))  # type: ignore
+
+    def gauge(self, name, description, labels=(), callback=None) -> Gauge:
+        return self.register(Gauge(name, description, labels, callback))  # type: ignore
+
+    def histogram(
+        self, name, description, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, description, labels, buckets))  # type: ignore
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+    async def _handle_request(self, request):
+        return web.Response(
+            text=self.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"},
+        )
+
+    async def start_server(self, host="127.0.0.1", port=9090, path="/metrics"):
+        """Start serving metrics in Prometheus text format."""
+
+        app = web.Application()
+        app.add_routes([web.get(path, self._handle_request)])
+
+        self._app_runner = web.AppRunner(app)
+        await self._app_runner.setup()
+
+        site = web.TCPSite(self._app_runner, host, port)
+        await site.start()
+
+    async def stop_server(self):
+        if self._app_runner is not None:
+            await self._app_runner.cleanup()
+            self._app_runner = None
+
+
+class KutanaMetrics(MetricsRegistry):
+    """Registry with metrics that are collected by kutana itself."""
+
+    def __init__(self):
+        super().__init__()
+
+        # Values are collected from the queue of updates by application
+        self.updates = self.counter(
+            "kutana_updates_total",
+            "Updates received from backends (including dropped ones).",
+            ("backend",),
+        )
+
+        self.handler_duration = self.histogram(
+            "kutana_handler_duration_seconds",
+            "Duration of handlers' calls.",
+            ("plugin", "handler"),
+        )
+
+        self.handler_exceptions = self.counter(
+            "kutana_handler_exceptions_total",
+            "Exceptions raised by handlers.",
+            ("plugin", "handler"),
+        )
+
+        self.request_duration = self.histogram(
+            "kutana_request_duration_seconds",
+            "Duration of requests to backends' APIs.",
+            ("backend", "method"),
+        )
+
+        self.request_queue_wait = self.histogram(
+            "kutana_request_queue_wait_seconds",
+            "Time requests waited in backends' queues before being sent.",
+            ("backend", "priority"),
+        )
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import NamedTuple, Optional, Tuple
+
+from .handler import get_handler_info
+
+UNKNOWN_HANDLER = ("", "")
+
+
+class BlockedCall(NamedTuple):
+    """Information about the call that blocked event loop."""
+
+    # How long loop was blocked when stack was captured (in seconds)
+    duration: float
+
+    # Plugin's and handler's names (empty if handler is unknown)
+    handler: Tuple[str, str]
+
+    # Formatted stack of the loop's thread
+    stack: str
+
+
+class LoopMonitor:
+    """
+    Measures event loop's lag and detects calls that block it.
+
+    Lag is measured by the task that sleeps for "interval" seconds and
+    checks how late it was woken up. Percentiles of the lag are computed
+    over the last "window" measurements.
+
+    Background thread checks if the task stopped waking up for longer
+    than "blocking_threshold" seconds. In this case stack of the loop's
+    thread is captured (once per blocking) and attributed to the
+    innermost handler of the plugin found in it. Captured calls are
+    logged and stored in "blocked_calls" (the latest ones), and their
+    amounts are counted in "blocked_counts" by (plugin, handler).
+
+    :param interval: time (in seconds) between lag measurements
+    :param blocking_threshold: time (in seconds) after which loop is
+        treated as blocked
+    :param window: amount of measurements used for percentiles
+    :param max_blocked_calls: amount of stored blocked calls
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        blocking_threshold: float = 0.5,
+        window: int = 1024,
+        max_blocked_calls: int = 32,
+    ):
+        self.interval = interval
+        self.blocking_threshold = blocking_threshold
+
+        self.lag = 0.0
+        self.lags: deque = deque(maxlen=window)
+
+        self.blocked_calls: deque = deque(maxlen=max_blocked_calls)
+        self.blocked_counts: Counter = Counter()
+
+        self._heartbeat = 0.0
+        self._reported_heartbeat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+
+        self._measurer: Optional[asyncio.Task] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._measurer is not None:
+            return
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+
+        self._measurer = asyncio.ensure_future(self._measure_lag())
+
+        self._watcher = threading.Thread(
+            target=self._watch, name="kutana-loop-monitor", daemon=True
+        )
+        self._watcher.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._measurer is not None:
+            self._measurer.cancel()
+            self._measurer = None
+
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    async def _measure_lag(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(self.interval)
+
+            self.lag = max(0.0, loop.time() - started_at - self.interval)
+            self.lags.append(self.lag)
+
+            self._heartbeat = time.monotonic()
+
+    def get_percentiles(self, quantiles=(0.5, 0.9, 0.99, 1.0)):
+        """Return dict with lag's percentiles for provided quantiles."""
+
+        if not self.lags:
+            return {quantile: 0.0 for quantile in quantiles}
+
+        lags = sorted(self.lags)
+
+        return {
+            quantile: lags[min(len(lags) - 1, int(quantile * len(lags)))]
+            for quantile in quantiles
+        }
+
+    def _watch(self):
+        check_interval = min(self.interval, self.blocking_threshold) / 2
+
+        while not self._stopped.wait(check_interval):
+            heartbeat = self._heartbeat
+
+            # Loop is expected to wake measuring task every "interval"
+            blocked_for = time.monotonic() - heartbeat - self.interval
+
+            if blocked_for < self.blocking_threshold:
+                continue
+
+            if heartbeat == self._reported_heartbeat:
+                continue
+
+            self._reported_heartbeat = heartbeat
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+
+            if frame is not None:
+                self._report(frame, blocked_for)
+
+    def _report(self, frame, blocked_for):
+        handler = UNKNOWN_HANDLER
+
+        current = frame
+        while current is not None:
+            info = get_handler_info(current.f_code)
+
+            if info is not None:
+                handler = info
+                break
+
+            current = current.f_back
+
+        stack = "".join(traceback.format_stack(frame))
+
+        self.blocked_calls.append(BlockedCall(blocked_for, handler, stack))
+        self.blocked_counts[handler] += 1
+
+        logging.warning(
+            'Event loop is blocked for %.3fs (plugin "%s", handler "%s")\n%s',
+            blocked_for,
+            handler[0],
+            handler[1],
+            stack,
+        )
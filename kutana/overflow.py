@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import pickle
+from collections import Counter
+from typing import List, Optional
+
+from .lanes import get_update_kind
+from .update import Message
+
+
+class OverflowPolicy:
+    """
+    Policy that decides what to do with updates when queue is full
+    (instead of waiting for the free space). Counts of the affected
+    updates are stored in "counts" with keys like ("dropped", kind).
+    """
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def _count(self, action, update):
+        self.counts[(action, get_update_kind(update))] += 1
+
+    def should_handle(self, queue):
+        return queue.full()
+
+    def handle(self, queue, item):
+        """
+        Return True if item was handled by policy and should not be put
+        into the queue. Otherwise queue will wait for the free space.
+        """
+
+        raise NotImplementedError
+
+    def after_get(self, queue):
+        pass
+
+    def close(self):
+        pass
+
+
+class DropOldestPolicy(OverflowPolicy):
+    """Drop oldest update in the queue to free space for the new one."""
+
+    def handle(self, queue, item):
+        dropped = queue.remove_oldest()
+
+        if dropped is None:
+            return False
+
+        logging.debug("Queue is full, dropped update %s", dropped[0])
+        self._count("dropped", dropped[0])
+
+        return False
+
+
+class DropKindsPolicy(OverflowPolicy):
+    """
+    Drop new update if it's kind is one of specified, or drop the oldest
+    update of one of specified kinds from the queue. If there is nothing
+    to drop, queue will wait for the free space.
+    """
+
+    def __init__(self, kinds: List[str]):
+        super().__init__()
+        self.kinds = set(kinds)
+
+    def _is_droppable(self, item):
+        return get_update_kind(item[0]) in self.kinds
+
+    def handle(self, queue, item):
+        if self._is_droppable(item):
+            self._count("dropped", item[0])
+            return True
+
+        dropped = queue.remove_oldest(self._is_droppable)
+
+        if dropped is not None:
+            self._count("dropped", dropped[0])
+
+        return False
+
+
+class ReplyBusyPolicy(OverflowPolicy):
+    """
+    Drop new update and reply to it with specified text (only for
+    messages, other updates are just dropped).
+    """
+
+    def __init__(self, text="I'm busy right now, please try again later"):
+        super().__init__()
+        self.text = text
+
+    async def _reply(self, update, backend):
+        try:
+            await backend.send_message(update.recipient_id, self.text)
+        except Exception:
+            logging.exception("Error while replying to the dropped update")
+
+    def handle(self, queue, item):
+        update, backend = item
+
+        if isinstance(update, Message):
+            asyncio.ensure_future(self._reply(update, backend))
+            self._count("replied", update)
+        else:
+            self._count("dropped", update)
+
+        return True
+
+
+class SpillPolicy(OverflowPolicy):
+    """
+    Write new updates to the file on disk while queue is full (or while
+    there are updates in the file) and put them back into the queue in
+    order when the space is available. File is truncated on creation of
+    the policy.
+
+    :param path: path to the file
+    :param backends: list of application's backends (updates are stored
+        with index of their backend)
+    """
+
+    def __init__(self, path: str, backends: List):
+        super().__init__()
+
+        self.path = path
+        self.backends = backends
+        self.pending = 0
+
+        self._writer = open(path, "wb")
+        self._reader = open(path, "rb")
+
+    def should_handle(self, queue):
+        return self.pending > 0 or queue.full()
+
+    def handle(self, queue, item):
+        update, backend = item
+
+        pickle.dump(
+            (self.backends.index(backend), backend.dump_update(update)),
+            self._writer,
+        )
+        self._writer.flush()
+
+        self.pending += 1
+        self._count("spilled", update)
+
+        # Queue could have free space if it's items were removed
+        self.after_get(queue)
+
+        return True
+
+    def after_get(self, queue):
+        if not self.pending or queue.full():
+            return
+
+        backend_index, data = pickle.load(self._reader)
+        backend = self.backends[backend_index]
+
+        self.pending -= 1
+        queue.put_nowait((backend.load_update(data), backend))
+
+        if not self.pending:
+            self._writer.seek(0)
+            self._writer.truncate()
+            self._reader.seek(0)
+
+    def close(self):
+        self._writer.close()
+        self._reader.close()
+
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def make_overflow_policy(config: Optional[dict], backends: List):
+    """Return overflow policy for provided configuration (or None)."""
+
+    if not config:
+        return None
+
+    kwargs = {**config}
+    kind = kwargs.pop("kind")
+
+    if kind == "drop_oldest":
+        return DropOldestPolicy(**kwargs)
+
+    if kind == "drop_kinds":
+        return DropKindsPolicy(**kwargs)
+
+    if kind == "reply_busy":
+        return ReplyBusyPolicy(**kwargs)
+
+    if kind == "spill":
+        return SpillPolicy(backends=backends, **kwargs)
+
+    raise ValueError(f'Unknown overflow policy kind: "{kind}"')
@@ -4,10 +4,17 @@ from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
 
 from .backends.vkontakte import VkontaktePluginExtension
 from .context import Context
-from .handler import SKIPPED, HandledResultSymbol
-from .router import AttachmentsRouter, CommandsRouter, ListRouter, Router
+from .handler import SKIPPED, HandledResultSymbol, wrap_handler
+from .router import (
+    AttachmentsRouter,
+    CommandsRouter,
+    ListRouter,
+    MatchRouter,
+    Router,
+)
 from .storage import Document
-from .update import Message
+from .tracing import start_span
+from .update import Message, RecipientKind
 
 HandlerType = Callable[[Message, Context], Awaitable[Optional[HandledResultSymbol]]]
 
@@ -24,6 +31,8 @@ class Plugin:
         self.app: Any
 
         self._hooks = []
+        self._deferred_hooks = []
+        self._classifiers = []
         self._routers: List[Router] = []
 
         # Set some attributes to this instance
@@ -35,6 +44,15 @@ class Plugin:
         # Setup extensions
         self.vk = VkontaktePluginExtension(self)
 
+    def _add_router(self, router: Router):
+        self._routers.append(router)
+
+        # Handlers registered after application was started are used too
+        app = getattr(self, "app", None)
+
+        if app is not None:
+            app._update_routers()
+
     def on_start(self):
         """
         Return decorator for registering coroutines that will be called
@@ -47,27 +65,41 @@ class Plugin:
 
         return decorator
 
-    def on_completion(self):
+    def on_completion(self, deferred: bool = False):
         """
         Return decorator for registering coroutines that will be called
         after update was processed (without exception).
+
+        If "deferred" is True, coroutine is called in the background (see
+        "deferred_hooks_*" in :class:`kutana.kutana.Kutana`), so it doesn't
+        delay handling of the update, but it can be dropped if there are
+        too many deferred calls waiting.
         """
 
         def decorator(coro):
-            self._hooks.append(("completion", coro))
+            if deferred:
+                self._deferred_hooks.append(("completion", coro))
+            else:
+                self._hooks.append(("completion", coro))
             return coro
 
         return decorator
 
-    def on_exception(self):
+    def on_exception(self, deferred: bool = False):
         """
         Return decorator for registering coroutine that will be called when
         exception was raised while processing an update. It will be passed
         the update's context and raised exception as arguments.
+
+        See :class:`kutana.plugin.Plugin.on_completion` for details
+        about 'deferred'.
         """
 
         def decorator(coro):
-            self._hooks.append(("exception", coro))
+            if deferred:
+                self._deferred_hooks.append(("exception", coro))
+            else:
+                self._hooks.append(("exception", coro))
             return coro
 
         return decorator
@@ -84,10 +116,29 @@ class Plugin:
 
         return decorator
 
+    def classify_updates(self):
+        """
+        Return decorator for registering function that chooses lane for
+        acquired updates in application's queue (see "update_lanes" in
+        :class:`kutana.kutana.Kutana`). Function is passed the update and
+        the backend and should return name of the lane or None (then other
+        classifiers and configured lanes are checked). Function is called
+        for every update, so it should be quick and not async.
+        """
+
+        def decorator(func):
+            self._classifiers.append(func)
+            return func
+
+        return decorator
+
     def on_commands(
         self,
         commands: List[str],
         priority: int = 0,
+        timeout: Optional[float] = None,
+        backends: Optional[List[str]] = None,
+        recipient_kinds: Optional[List[RecipientKind]] = None,
     ):
         """
         Return decorator for registering handler that will be called
@@ -105,14 +156,30 @@ class Plugin:
 
         If handler returns anything but :class:`kutana.handler.SKIPPED`,
         other handlers are not executed further.
+
+        If handler works longer than "timeout" seconds (or application's
+        "handler_timeout" if "timeout" is not specified), it's cancelled
+        and :class:`kutana.exceptions.HandlerTimeoutException` is raised.
+
+        If "backends" (identities of backends) or "recipient_kinds" are
+        specified, handler is attempted only for updates from specified
+        backends and only for messages with specified kinds of recipient.
+        Unlike decorators from :mod:`kutana.decorators`, these filters are
+        applied when routers are compiled, so other updates never reach
+        the handler.
         """
 
         def decorator(coro: HandlerType):
-            router = CommandsRouter(priority=priority)
+            router = CommandsRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            handler = wrap_handler(coro, timeout, self.name)
             for command in commands:
-                router.add_handler(command, coro)
+                router.add_handler(command, handler)
 
-            self._routers.append(router)
+            self._add_router(router)
 
             return coro
 
@@ -122,6 +189,9 @@ class Plugin:
         self,
         patterns: List[Union[str, re.Pattern]],
         priority: int = 0,
+        timeout: Optional[float] = None,
+        backends: Optional[List[str]] = None,
+        recipient_kinds: Optional[List[RecipientKind]] = None,
     ):
         """
         Return decorator for registering handler that will be called
@@ -136,30 +206,20 @@ class Plugin:
 
         If handler returns anything but :class:`kutana.handler.SKIPPED`,
         other handlers are not executed further.
+
+        See :class:`kutana.plugin.Plugin.on_commands` for details
+        about 'timeout' and filters.
         """
 
         def decorator(func):
-            router = ListRouter(priority=priority)
-
-            @functools.wraps(func)
-            async def _wrapper(update, ctx):
-                if not isinstance(update, Message):
-                    return SKIPPED
-
-                for pattern in patterns:
-                    match = re.match(pattern, update.text)
-                    if match:
-                        break
-                else:
-                    return SKIPPED
-
-                ctx.match = match
+            router = MatchRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            router.add_handler(patterns, wrap_handler(func, timeout, self.name))
 
-                return await func(update, ctx)
-
-            router.add_handler(_wrapper)
-
-            self._routers.append(router)
+            self._add_router(router)
 
             return func
 
@@ -169,6 +229,9 @@ class Plugin:
         self,
         kinds: List[str],
         priority: int = 0,
+        timeout: Optional[float] = None,
+        backends: Optional[List[str]] = None,
+        recipient_kinds: Optional[List[RecipientKind]] = None,
     ):
         """
         Return decorator for registering handler that will be called
@@ -176,15 +239,20 @@ class Plugin:
         attachment with one of specified types.
 
         See :class:`kutana.plugin.Plugin.on_commands` for details
-        about 'priority' and return values.
+        about 'priority', 'timeout', filters and return values.
         """
 
         def decorator(coro: HandlerType):
-            router = AttachmentsRouter(priority=priority)
+            router = AttachmentsRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            handler = wrap_handler(coro, timeout, self.name)
             for kind in kinds:
-                router.add_handler(kind, coro)
+                router.add_handler(kind, handler)
 
-            self._routers.append(router)
+            self._add_router(router)
 
             return coro
 
@@ -193,6 +261,9 @@ class Plugin:
     def on_messages(
         self,
         priority: int = -1,
+        timeout: Optional[float] = None,
+        backends: Optional[List[str]] = None,
+        recipient_kinds: Optional[List[RecipientKind]] = None,
     ):
         """
         Return decorator for registering handler that will be called
@@ -201,21 +272,26 @@ class Plugin:
         appropriate value.
 
         See :class:`kutana.plugin.Plugin.on_commands` for details
-        about 'priority' and return values.
+        about 'priority', 'timeout', filters and return values.
         """
 
         def decorator(coro: HandlerType):
-            router = ListRouter(priority=priority)
+            router = ListRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            handler = wrap_handler(coro, timeout, self.name)
 
             @functools.wraps(coro)
             async def _wrapper(update, context):
                 if not isinstance(update, Message):
                     return SKIPPED
-                return await coro(update, context)
+                return await handler(update, context)
 
-            router.add_handler(_wrapper)
+            router.add_handler(_wrapper, update_types=(Message,))
 
-            self._routers.append(router)
+            self._add_router(router)
 
             return coro
 
@@ -224,20 +300,27 @@ class Plugin:
     def on_updates(
         self,
         priority: int = 0,
+        timeout: Optional[float] = None,
+        backends: Optional[List[str]] = None,
+        recipient_kinds: Optional[List[RecipientKind]] = None,
     ):
         """
         Return decorator for registering handler that will be always
         called (for messages and not messages).
 
         See :class:`kutana.plugin.Plugin.on_commands` for details
-        about 'priority' and return values.
+        about 'priority', 'timeout', filters and return values.
         """
 
         def decorator(coro: HandlerType):
-            router = ListRouter(priority=priority)
-            router.add_handler(coro)
+            router = ListRouter(
+                priority=priority,
+                backends=backends,
+                recipient_kinds=recipient_kinds,
+            )
+            router.add_handler(wrap_handler(coro, timeout, self.name))
 
-            self._routers.append(router)
+            self._add_router(router)
 
             return coro
 
@@ -297,7 +380,11 @@ class Plugin:
                 context.storage = self.app.storages[storage]
 
                 if not getattr(context, "sender", None):
-                    context.sender = await context.storage.get(context.sender_unique_id)
+                    with start_span(context.trace, "storage.get", storage=storage):
+                        context.sender = await context.storage.get(
+                            context.sender_unique_id
+                        )
+
                     if not context.sender:
                         context.sender = Document(
                             _storage=context.storage,
@@ -308,9 +395,11 @@ class Plugin:
                     return SKIPPED
 
                 if not getattr(context, "recipient", None):
-                    context.recipient = await context.storage.get(
-                        context.recipient_unique_id
-                    )
+                    with start_span(context.trace, "storage.get", storage=storage):
+                        context.recipient = await context.storage.get(
+                            context.recipient_unique_id
+                        )
+
                     if not context.recipient:
                         context.recipient = Document(
                             _storage=context.storage,
@@ -1,21 +1,112 @@
 import re
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from itertools import groupby
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+try:
+    from re import _parser as sre_parse  # type: ignore
+except ImportError:  # pragma: no cover
+    import sre_parse  # type: ignore
 
 from .context import Context
 from .handler import PROCESSED, SKIPPED
-from .update import Message
+from .update import Message, RecipientKind
+
+
+class RoutingCache:
+    """
+    Bounded LRU cache for decisions that routers made for messages with
+    the same text from the backend with the same identity. Amounts of
+    hits and misses (per message) are stored in "hits" and "misses".
+
+    :param maxsize: maximum amount of cached texts
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._decisions: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._decisions)
+
+    def get(self, identity, text) -> dict:
+        """
+        Return dict with decisions of routers for the text (routers store
+        their decisions there by themselves).
+        """
+
+        key = (identity, text)
+        decisions = self._decisions.get(key)
+
+        if decisions is None:
+            self.misses += 1
+
+            decisions = self._decisions[key] = {}
+
+            if len(self._decisions) > self.maxsize:
+                self._decisions.popitem(last=False)
+        else:
+            self.hits += 1
+
+            self._decisions.move_to_end(key)
+
+        return decisions
 
 
 class Router:
-    def __init__(self, priority: Optional[int] = 0):
+    # Types of updates this router can handle
+    update_types: Tuple[type, ...] = (object,)
+
+    # Identities of backends which updates this router can handle (any if None)
+    backends: Optional[Set[str]] = None
+
+    def __init__(
+        self,
+        priority: Optional[int] = 0,
+        backends: Optional[List[str]] = None,
+        recipient_kinds: Optional[List[RecipientKind]] = None,
+    ):
         self.priority = priority
 
+        if backends is not None:
+            self.backends = set(backends)
+
+        self.recipient_kinds = (
+            set(recipient_kinds) if recipient_kinds is not None else None
+        )
+
+    def accepts(self, identity: str, recipient_kind: Optional[RecipientKind]):
+        """
+        Return True if router can handle updates from backend with
+        specified identity and with specified kind of recipient (None
+        for updates that are not messages).
+        """
+
+        return (self.backends is None or identity in self.backends) and (
+            self.recipient_kinds is None or recipient_kind in self.recipient_kinds
+        )
+
     def add_handler(self, handler):
         raise NotImplementedError
 
     async def handle(self, update, context):
         raise NotImplementedError
 
+    def compile(self, update_type: type) -> List[Callable]:
+        """
+        Return list of callables that handle updates of specified type
+        the same way as this router does (first callable that returns
+        anything but SKIPPED finishes handling).
+        """
+
+        if not issubclass(update_type, self.update_types):
+            return []
+
+        return [self.handle]
+
     @staticmethod
     def _assert_can_merge(router, source):
         if type(source) is not type(router):
@@ -34,12 +125,14 @@ class Router:
 
 
 class ListRouter(Router):
-    def __init__(self, priority: Optional[int] = 0):
-        super().__init__(priority)
+    def __init__(self, priority: Optional[int] = 0, **kwargs):
+        super().__init__(priority, **kwargs)
         self._handlers = []
+        self._handlers_update_types = []
 
-    def add_handler(self, handler):
+    def add_handler(self, handler, update_types: Tuple[type, ...] = (object,)):
         self._handlers.append(handler)
+        self._handlers_update_types.append(update_types)
 
     async def handle(self, update, context):
         for handler in self._handlers:
@@ -51,6 +144,17 @@ class ListRouter(Router):
 
         return SKIPPED
 
+    def compile(self, update_type):
+        compiled = []
+
+        for handler, update_types in zip(self._handlers, self._handlers_update_types):
+            if isinstance(handler, Router):
+                compiled.extend(handler.compile(update_type))
+            elif issubclass(update_type, update_types):
+                compiled.append(handler)
+
+        return compiled
+
     @classmethod
     def merge(cls, source_routers: List["ListRouter"]):
         router = cls(priority=None)
@@ -60,15 +164,148 @@ class ListRouter(Router):
         ):
             cls._assert_can_merge(router, source)
 
-            for handler in source._handlers:
-                router.add_handler(handler)
+            for handler, update_types in zip(
+                source._handlers, source._handlers_update_types
+            ):
+                router.add_handler(handler, update_types)
+
+        return router
+
+
+def _get_literal_prefix(pattern: re.Pattern) -> str:
+    """
+    Return literal text that every string matched by the pattern (from
+    the start of the string) starts with. Empty string if unknown.
+    """
+
+    if pattern.flags & re.IGNORECASE or not isinstance(pattern.pattern, str):
+        return ""
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:  # pragma: no cover
+        return ""
+
+    prefix = []
+
+    for op, value in parsed:
+        if op is sre_parse.AT and value in (
+            sre_parse.AT_BEGINNING,
+            sre_parse.AT_BEGINNING_STRING,
+        ):
+            continue
+
+        if op is not sre_parse.LITERAL:
+            break
+
+        prefix.append(chr(value))
+
+    return "".join(prefix)
+
+
+class MatchRouter(Router):
+    """
+    Router for handlers that are called when message's text matches
+    any of their patterns. Patterns are prefiltered with a trie of
+    their literal prefixes, so only handlers that can match the text
+    have their patterns checked (in order of addition).
+    """
+
+    update_types = (Message,)
+
+    def __init__(self, priority: Optional[int] = 0, **kwargs):
+        super().__init__(priority, **kwargs)
+        self._handlers: List[Tuple[List[re.Pattern], Callable]] = []
+        self._prefixes_trie: Optional[dict] = None
+
+    def add_handler(self, patterns: List[Union[str, re.Pattern]], handler):
+        self._handlers.append(([re.compile(pattern) for pattern in patterns], handler))
+        self._prefixes_trie = None
+
+    def _get_prefixes_trie(self):
+        if self._prefixes_trie is None:
+            trie: dict = {}
+
+            for index, (patterns, _) in enumerate(self._handlers):
+                for pattern in patterns:
+                    node = trie
+                    for char in _get_literal_prefix(pattern):
+                        node = node.setdefault(char, {})
+
+                    indices = node.setdefault(None, [])
+                    if not indices or indices[-1] != index:
+                        indices.append(index)
+
+            self._prefixes_trie = trie
+
+        return self._prefixes_trie
+
+    def _get_candidates(self, text):
+        """Return sorted indices of handlers that can match the text."""
+
+        node = self._get_prefixes_trie()
+        found = [node[None]] if None in node else []
+
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+
+        if len(found) < 2:
+            return found[0] if found else ()
+
+        return sorted(set().union(*found))
+
+    def _iter_matches(self, text):
+        for index in self._get_candidates(text):
+            for pattern in self._handlers[index][0]:
+                match = pattern.match(text)
+                if match:
+                    yield index, match
+                    break
+
+    async def handle(self, update, context):
+        if not isinstance(update, Message):
+            return SKIPPED
+
+        decisions = context.routing_decisions
+
+        if decisions is None:
+            matches = self._iter_matches(update.text)
+        else:
+            matches = decisions.get(self)
+
+            if matches is None:
+                matches = decisions[self] = tuple(self._iter_matches(update.text))
+
+        for index, match in matches:
+            context.match = match
+
+            if await self._handlers[index][1](update, context) != SKIPPED:
+                return PROCESSED
+
+        return SKIPPED
+
+    @classmethod
+    def merge(cls, source_routers: List["MatchRouter"]):
+        router = cls(priority=None)
+
+        for source in sorted(
+            source_routers, reverse=True, key=lambda item: item.priority or 0
+        ):
+            cls._assert_can_merge(router, source)
+
+            for patterns, handler in source._handlers:
+                router.add_handler(patterns, handler)
 
         return router
 
 
 class MapRouter(Router):
-    def __init__(self, priority: Optional[int] = 0):
-        super().__init__(priority)
+    def __init__(self, priority: Optional[int] = 0, **kwargs):
+        super().__init__(priority, **kwargs)
         self._handlers: Dict[str, List] = {}
 
     def extract_keys(self, context):
@@ -91,6 +328,28 @@ class MapRouter(Router):
 
         return SKIPPED
 
+    def compile(self, update_type):
+        if not issubclass(update_type, self.update_types):
+            return []
+
+        bound_handlers = {
+            key: tuple(
+                handler.handle if isinstance(handler, Router) else handler
+                for handler in handlers
+            )
+            for key, handlers in self._handlers.items()
+        }
+
+        async def handle(update, context):
+            for key in self.extract_keys(context):
+                for handler in bound_handlers.get(key, ()):
+                    if await handler(update, context) != SKIPPED:
+                        return PROCESSED
+
+            return SKIPPED
+
+        return [handle]
+
     @staticmethod
     def _merge_routers(target: "MapRouter", source: "MapRouter"):
         for key, handlers in source._handlers.items():
@@ -111,26 +370,106 @@ class MapRouter(Router):
 
 
 class CommandsRouter(MapRouter):
+    update_types = (Message,)
+
+    def __init__(self, priority: Optional[int] = 0, **kwargs):
+        super().__init__(priority, **kwargs)
+        self._commands_trie: Optional[dict] = None
+        self._patterns: Dict[Tuple[Optional[str], str], re.Pattern] = {}
+
     def add_handler(self, key, handler):
+        self._commands_trie = None
         return super().add_handler(key.lower(), handler)
 
+    def _get_commands_trie(self):
+        if self._commands_trie is None:
+            trie: dict = {}
+
+            for command in self._handlers:
+                node = trie
+                for char in command:
+                    node = node.setdefault(char, {})
+                node[None] = command
+
+            self._commands_trie = trie
+
+        return self._commands_trie
+
+    def _find_command(self, text, position):
+        """Return the longest command at the position of the text."""
+
+        node = self._get_commands_trie()
+        command = node.get(None)
+
+        for char in text[position:]:
+            for lowered_char in char.lower():
+                node = node.get(lowered_char)
+                if node is None:
+                    return command
+
+            command = node.get(None, command)
+
+        return command
+
+    def _get_pattern(self, prefix, command):
+        key = (prefix, command)
+
+        if key not in self._patterns:
+            self._patterns[key] = re.compile(
+                r"\s*({prefix})?\s*({command})(.*)".format(
+                    prefix="(?!)" if prefix is None else re.escape(prefix),
+                    command=re.escape(command),
+                ),
+                re.IGNORECASE,
+            )
+
+        return self._patterns[key]
+
+    @staticmethod
+    def _skip_spaces(text, position):
+        while position < len(text) and text[position].isspace():
+            position += 1
+        return position
+
+    def _match(self, text, prefixes):
+        start = self._skip_spaces(text, 0)
+
+        for prefix in (*prefixes, None):
+            if prefix is None:
+                position = start
+            elif text[start : start + len(prefix)].lower() == prefix.lower():
+                position = self._skip_spaces(text, start + len(prefix))
+            else:
+                continue
+
+            command = self._find_command(text, position)
+
+            if command is not None:
+                break
+        else:
+            return None
+
+        # Match is built with the pattern for found prefix and command only
+        return self._get_pattern(prefix, command).match(text)
+
     def extract_keys(self, context: Context):
         if not isinstance(context.update, Message):
             return ()
 
-        match = re.match(
-            r"\s*({prefix})?\s*({command})(.*)".format(
-                prefix="|".join(
-                    re.escape(prefix) for prefix in context.app.config["prefixes"]
-                ),
-                command="|".join(
-                    re.escape(command)
-                    for command in sorted(self._handlers, key=len, reverse=True)
-                ),
-            ),
-            context.update.text,
-            re.IGNORECASE,
-        )
+        text = context.update.text
+        prefixes = tuple(context.app.config["prefixes"])
+
+        decisions = context.routing_decisions
+
+        if decisions is None:
+            match = self._match(text, prefixes)
+        else:
+            decision = decisions.get(self)
+
+            if decision is None or decision[0] != prefixes:
+                decision = decisions[self] = (prefixes, self._match(text, prefixes))
+
+            match = decision[1]
 
         if match is None:
             return ()
@@ -144,8 +483,85 @@ class CommandsRouter(MapRouter):
 
 
 class AttachmentsRouter(MapRouter):
+    update_types = (Message,)
+
     def extract_keys(self, context: Context):
         if not isinstance(context.update, Message):
             return ()
 
         return tuple(attachment.kind for attachment in context.update.attachments)
+
+
+class CompiledRouter(Router):
+    """
+    Router that handles updates the same way as provided routers merged
+    by their priorities, but using flat lists of handlers compiled for
+    every identity of backend, type of update and kind of recipient
+    (see :meth:`Router.compile` and :meth:`Router.accepts`). Lists are
+    compiled when they are needed for the first time.
+
+    If routing cache is provided, decisions of routers for message's
+    text are taken from it and put into context's "routing_decisions"
+    (see :class:`RoutingCache`).
+    """
+
+    def __init__(
+        self,
+        routers: List[Router],
+        routing_cache: Optional[RoutingCache] = None,
+    ):
+        super().__init__(priority=None)
+
+        self.routing_cache: Optional[RoutingCache] = routing_cache
+
+        self._routers = sorted(routers, reverse=True, key=lambda item: item.priority)
+        self._plans: Dict[tuple, Tuple[Callable, ...]] = {}
+
+    def _compile_plan(self, identity, update_type, recipient_kind):
+        root_router = ListRouter()
+
+        accepted_routers = (
+            router
+            for router in self._routers
+            if router.accepts(identity, recipient_kind)
+        )
+
+        for _, outer_group in groupby(accepted_routers, key=lambda item: item.priority):
+            for cls, inner_group in groupby(outer_group, key=type):
+                root_router.add_handler(cls.merge(inner_group))
+
+        return tuple(root_router.compile(update_type))
+
+    def get_handlers(
+        self,
+        identity: str,
+        update_type: type,
+        recipient_kind: Optional[RecipientKind] = None,
+    ):
+        key = (identity, update_type, recipient_kind)
+
+        handlers = self._plans.get(key)
+
+        if handlers is None:
+            handlers = self._plans[key] = self._compile_plan(*key)
+
+        return handlers
+
+    async def handle(self, update, context):
+        if isinstance(update, Message):
+            identity = context.backend.get_identity()
+
+            handlers = self.get_handlers(identity, Message, update.recipient_kind)
+
+            if self.routing_cache is not None:
+                context.routing_decisions = self.routing_cache.get(
+                    identity, update.text
+                )
+        else:
+            handlers = self.get_handlers(context.backend.get_identity(), dict)
+
+        for handler in handlers:
+            if await handler(update, context) != SKIPPED:
+                return PROCESSED
+
+        return SKIPPED
@@ -0,0 +1,509 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import ContextVar
+from random import getrandbits, random
+from typing import List, Optional
+
+from aiohttp import web
+
+from .helpers import create_httpx_async_client
+
+# Span that is active in the current task (if update is traced)
+_current_span: ContextVar = ContextVar("kutana_current_span", default=None)
+
+_NO_SPAN = nullcontext()
+
+
+def get_current_span() -> Optional["Span"]:
+    """Return span that is active in the current task or None."""
+
+    return _current_span.get()
+
+
+def start_span(trace: Optional["Trace"], name, **attributes):
+    """
+    Return new span of the trace (see :meth:`Trace.span`) or context
+    manager that does nothing if trace is None.
+    """
+
+    if trace is None:
+        return _NO_SPAN
+
+    return trace.span(name, **attributes)
+
+
+class Span:
+    """
+    Stage of the update's handling. Times are values of
+    :func:`time.perf_counter`. Span can be used as a context manager,
+    which makes it active in the current task until it's ended.
+    """
+
+    __slots__ = (
+        "trace",
+        "name",
+        "span_id",
+        "parent_id",
+        "start_time",
+        "end_time",
+        "attributes",
+        "_token",
+    )
+
+    def __init__(self, trace, name, parent_id=None, start_time=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.end_time: Optional[float] = None
+        self.attributes = attributes or {}
+        self._token = None
+
+    @property
+    def duration(self):
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def end(self, end_time=None):
+        if self.end_time is None:
+            self.end_time = time.perf_counter() if end_time is None else end_time
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+
+        self.end()
+        _current_span.reset(self._token)
+
+
+class Trace:
+    """
+    Spans of one update's handling. The root span ("update") starts when
+    update is put into the queue and ends when it's handled.
+    """
+
+    __slots__ = ("trace_id", "spans", "root", "_wall_time", "_perf_time")
+
+    def __init__(self, start_time=None, **attributes):
+        self.trace_id = f"{getrandbits(128):032x}"
+        self.spans: List[Span] = []
+
+        # Used for converting spans' times to the wall clock
+        self._wall_time = time.time()
+        self._perf_time = time.perf_counter()
+
+        self.root = Span(self, "update", start_time=start_time, attributes=attributes)
+        self.spans.append(self.root)
+
+    def span(self, name, parent=None, start_time=None, **attributes) -> Span:
+        """
+        Create span with provided name and attributes. Parent of the span
+        is the active span (if it belongs to this trace) or the root span
+        if parent is not specified.
+        """
+
+        if parent is None:
+            parent = _current_span.get()
+
+            if parent is None or parent.trace is not self:
+                parent = self.root
+
+        span = Span(self, name, parent.span_id, start_time, attributes)
+        self.spans.append(span)
+
+        return span
+
+    def add_span(self, name, start_time, end_time, parent=None, **attributes) -> Span:
+        """Add span for the stage that was measured somewhere else."""
+
+        span = self.span(name, parent, start_time, **attributes)
+        span.end(end_time)
+        return span
+
+    def to_wall_time(self, perf_time: float) -> float:
+        """Convert value of :func:`time.perf_counter` to unix time."""
+
+        return self._wall_time + (perf_time - self._perf_time)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "spans": [
+                {
+                    "name": span.name,
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "start": self.to_wall_time(span.start_time),
+                    "duration": span.duration,
+                    "attributes": span.attributes,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class TraceExporter:
+    """Base class for exporters of finished traces."""
+
+    def start(self):
+        pass
+
+    def export(self, trace: Trace):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+
+class LogExporter(TraceExporter):
+    """Log every trace as one line with durations of it's spans."""
+
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def export(self, trace):
+        logging.log(
+            self.level,
+            "Trace %s: %s",
+            trace.trace_id,
+            ", ".join(
+                f"{span.name}={span.duration * 1000:.2f}ms"
+                for span in trace.spans
+                if span.duration is not None
+            ),
+        )
+
+
+class JsonLinesExporter(TraceExporter):
+    """
+    Append every trace to the file as JSON object on it's own line (see
+    :meth:`Trace.to_dict`). Traces are buffered and written by the
+    background thread every "interval" seconds (or when the batch is
+    full), so event loop is never blocked by the file. If there are more
+    than "max_buffer_size" traces waiting, the oldest ones are dropped.
+
+    :param path: path to the file
+    :param interval: time (in seconds) between writing batches
+    :param batch_size: amount of traces that triggers writing at once
+    :param max_buffer_size: maximum amount of traces waiting for writing
+    """
+
+    def __init__(self, path: str, interval=1.0, batch_size=256, max_buffer_size=8192):
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.dropped_count = 0
+
+        self._buffer: deque = deque(maxlen=max_buffer_size)
+        self._file = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._write_periodically())
+
+    def export(self, trace):
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped_count += 1
+
+        self._buffer.append(trace.to_dict())
+
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _write_lines(self, traces):
+        self._file.write(
+            "".join(json.dumps(trace, default=str) + "\n" for trace in traces)
+        )
+        self._file.flush()
+
+    async def _write(self):
+        if not self._buffer:
+            return
+
+        traces = list(self._buffer)
+        self._buffer.clear()
+
+        try:
+            await asyncio.get_event_loop().run_in_executor(
+                self._executor, self._write_lines, traces
+            )
+        except Exception:
+            logging.exception("Error while writing %d trace(s)", len(traces))
+
+    async def _write_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+
+            await self._write()
+
+    async def stop(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+        if self._file is not None:
+            await self._write()
+            self._executor.shutdown(wait=True)
+            self._file.close()
+            self._file = None
+
+
+def _make_otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _make_otlp_attributes(attributes):
+    return [
+        {"key": key, "value": _make_otlp_value(value)}
+        for key, value in attributes.items()
+    ]
+
+
+class OtlpExporter(TraceExporter):
+    """
+    Send spans to OpenTelemetry collector using OTLP/HTTP with JSON
+    encoding. Spans are buffered and sent in batches every "interval"
+    seconds (or when the batch is full). If there are more than
+    "max_buffer_size" spans waiting, the oldest ones are dropped.
+
+    :param url: collector's endpoint for traces
+    :param service_name: value of the "service.name" resource attribute
+    :param interval: time (in seconds) between sending batches
+    :param batch_size: maximum amount of spans in one batch
+    :param max_buffer_size: maximum amount of spans waiting for sending
+    """
+
+    def __init__(
+        self,
+        url="http://127.0.0.1:4318/v1/traces",
+        service_name="kutana",
+        interval=5.0,
+        batch_size=512,
+        max_buffer_size=8192,
+    ):
+        self.url = url
+        self.service_name = service_name
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.dropped_count = 0
+
+        self._buffer: deque = deque(maxlen=max_buffer_size)
+        self._client = None
+        self._sender: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._client = create_httpx_async_client()
+        self._wakeup = asyncio.Event()
+        self._sender = asyncio.ensure_future(self._send_periodically())
+
+    def export(self, trace):
+        for span in trace.spans:
+            if span.end_time is None:
+                continue
+
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped_count += 1
+
+            self._buffer.append(
+                {
+                    "traceId": trace.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(
+                        int(trace.to_wall_time(span.start_time) * 1e9)
+                    ),
+                    "endTimeUnixNano": str(
+                        int(trace.to_wall_time(span.end_time) * 1e9)
+                    ),
+                    "attributes": _make_otlp_attributes(span.attributes),
+                    "status": {"code": 2 if "error" in span.attributes else 0},
+                }
+            )
+
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def make_payload(self, spans):
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _make_otlp_attributes(
+                            {"service.name": self.service_name}
+                        )
+                    },
+                    "scopeSpans": [{"scope": {"name": "kutana"}, "spans": spans}],
+                }
+            ]
+        }
+
+    async def _send(self):
+        while self._buffer:
+            spans = []
+
+            while self._buffer and len(spans) < self.batch_size:
+                spans.append(self._buffer.popleft())
+
+            try:
+                response = await self._client.post(
+                    self.url, json=self.make_payload(spans), timeout=10
+                )
+                response.raise_for_status()
+            except Exception:
+                logging.exception("Error while sending %d span(s)", len(spans))
+
+    async def _send_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+
+            await self._send()
+
+    async def stop(self):
+        if self._sender is not None:
+            self._sender.cancel()
+            self._sender = None
+
+        if self._client is not None:
+            await self._send()
+            await self._client.aclose()
+            self._client = None
+
+
+class LocalCollector:
+    """
+    Minimal stand-in for OpenTelemetry collector that accepts spans from
+    :class:`OtlpExporter` and stores them in memory (e.g. for tests or
+    local debugging without running a real collector).
+    """
+
+    def __init__(self, path="/v1/traces"):
+        self.path = path
+        self.spans: List[dict] = []
+
+        self._app_runner: Optional[web.AppRunner] = None
+
+    async def _handle_request(self, request):
+        data = await request.json()
+
+        for resource_spans in data.get("resourceSpans", ()):
+            for scope_spans in resource_spans.get("scopeSpans", ()):
+                self.spans.extend(scope_spans.get("spans", ()))
+
+        return web.json_response({})
+
+    async def start(self, host="127.0.0.1", port=4318):
+        app = web.Application()
+        app.add_routes([web.post(self.path, self._handle_request)])
+
+        self._app_runner = web.AppRunner(app)
+        await self._app_runner.setup()
+
+        site = web.TCPSite(self._app_runner, host, port)
+        await site.start()
+
+    async def stop(self):
+        if self._app_runner is not None:
+            await self._app_runner.cleanup()
+            self._app_runner = None
+
+
+class Tracer:
+    """
+    Starts traces for sampled updates and exports them when they are
+    finished. Stages of the update's handling (queue, setup of context,
+    routing, handlers, storages' and backends' requests) are recorded
+    as spans of it's trace (see :attr:`kutana.context.Context.trace`).
+
+    :param exporter: exporter of finished traces
+    :param sample_rate: share of updates that are traced (from 0 to 1)
+    """
+
+    def __init__(self, exporter: TraceExporter, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start(self):
+        self.exporter.start()
+
+    async def stop(self):
+        await self.exporter.stop()
+
+    def start_trace(self, start_time=None, **attributes) -> Optional[Trace]:
+        """Return new trace or None if it was not sampled."""
+
+        if self.sample_rate < 1 and random() >= self.sample_rate:
+            return None
+
+        return Trace(start_time, **attributes)
+
+    def finish_trace(self, trace: Trace):
+        trace.root.end()
+
+        try:
+            self.exporter.export(trace)
+        except Exception:
+            logging.exception("Error while exporting trace")
+
+
+def make_trace_exporter(config) -> Optional[TraceExporter]:
+    """
+    Return exporter for provided configuration (dict with "kind" and
+    options for the exporter), exporter itself or None.
+    """
+
+    if not config:
+        return None
+
+    if isinstance(config, TraceExporter):
+        return config
+
+    kwargs = {**config}
+    kind = kwargs.pop("kind")
+
+    if kind == "log":
+        return LogExporter(**kwargs)
+
+    if kind == "jsonl":
+        return JsonLinesExporter(**kwargs)
+
+    if kind == "otlp":
+        return OtlpExporter(**kwargs)
+
+    raise ValueError(f'Unknown trace exporter kind: "{kind}"')
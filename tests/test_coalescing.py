@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+from kutana.backends.telegram import Telegram
+from kutana.backends.vkontakte import RequestPriority, VkontakteLongpoll
+from kutana.coalescing import RequestsCoalescer
+
+
+async def test_in_flight_requests():
+    coalescer = RequestsCoalescer(["users.get"])
+
+    calls = []
+
+    async def perform(method, kwargs):
+        calls.append((method, kwargs))
+        await asyncio.sleep(0.01)
+        return {"method": method}
+
+    results = await asyncio.gather(
+        coalescer.call("users.get", {"user_ids": 1, "fields": "sex"}, perform),
+        coalescer.call("users.get", {"fields": "sex", "user_ids": 1}, perform),
+        coalescer.call("users.get", {"user_ids": 2}, perform),
+        coalescer.call("groups.get", {}, perform),
+        coalescer.call("groups.get", {}, perform),
+    )
+
+    assert len(calls) == 4
+    assert results[0] is results[1]
+    assert coalescer.counts == {"in_flight": 1}
+
+    # Requests from different groups are not coalesced
+    await asyncio.gather(
+        coalescer.call("users.get", {}, perform, group=1),
+        coalescer.call("users.get", {}, perform, group=2),
+        coalescer.call("users.get", {}, perform, group=2),
+    )
+
+    assert len(calls) == 6
+    assert coalescer.counts == {"in_flight": 2}
+
+    calls.clear()
+
+    # Results are not cached without ttl
+    await coalescer.call("users.get", {"user_ids": 2}, perform)
+
+    assert len(calls) == 1
+
+
+async def test_cached_results():
+    coalescer = RequestsCoalescer(["users.get"], ttl=0.05, maxsize=1)
+
+    calls = []
+
+    async def perform(method, kwargs):
+        calls.append(kwargs)
+
+        if kwargs.get("fail"):
+            raise ValueError
+
+        return len(calls)
+
+    assert await coalescer.call("users.get", {}, perform) == 1
+    assert await coalescer.call("users.get", {}, perform) == 1
+    assert coalescer.counts == {"cache": 1}
+
+    # Exceptions are shared but not cached
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await coalescer.call("users.get", {"fail": True}, perform)
+
+    assert len(calls) == 3
+
+    await asyncio.sleep(0.06)
+
+    assert await coalescer.call("users.get", {}, perform) == 4
+
+    # Unserializable arguments are never coalesced
+    await coalescer.call("users.get", {"file": object()}, perform)
+    await coalescer.call("users.get", {"file": object()}, perform)
+
+    assert len(calls) == 6
+
+
+async def test_cancelled_caller():
+    coalescer = RequestsCoalescer(["users.get"])
+
+    async def perform(method, kwargs):
+        await asyncio.sleep(0.01)
+        return 1
+
+    first = asyncio.ensure_future(coalescer.call("users.get", {}, perform))
+    second = asyncio.ensure_future(coalescer.call("users.get", {}, perform))
+    await asyncio.sleep(0)
+
+    first.cancel()
+
+    assert await second == 1
+
+
+async def test_vkontakte_coalescing():
+    backend = VkontakteLongpoll(
+        "token", coalesced_methods=["messages.getConversationMembers"]
+    )
+    backend._start_requests_queue_handler()
+
+    codes = []
+
+    async def _direct_request(method, kwargs, token=None):
+        codes.append(kwargs["code"])
+        return [{"items": []}] * kwargs["code"].count("API.")
+
+    backend._direct_request = _direct_request
+
+    kwargs = {"peer_id": 2000000001, "fields": ""}
+
+    try:
+        await asyncio.gather(
+            backend.request("messages.getConversationMembers", kwargs),
+            backend.request("messages.getConversationMembers", dict(kwargs)),
+            backend.request(
+                "messages.getConversationMembers",
+                kwargs,
+                priority=RequestPriority.NORMAL,
+            ),
+            backend.request(
+                "messages.getConversationMembers",
+                kwargs,
+                priority=RequestPriority.HIGH,
+            ),
+        )
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    # Request with higher priority is sent separately
+    call = 'API.messages.getConversationMembers({"peer_id":2000000001,"fields":""}),'
+
+    assert codes == [f"return [{call}{call}];"]
+    assert backend.coalescer.counts == {"in_flight": 2}
+
+
+async def test_telegram_coalescing():
+    backend = Telegram("token", coalesced_methods=["getChatAdministrators"])
+
+    calls = []
+
+    async def _perform_request(method, kwargs):
+        calls.append(method)
+        await asyncio.sleep(0)
+        return []
+
+    backend._perform_request = _perform_request
+
+    await asyncio.gather(
+        *[backend.request("getChatAdministrators", {"chat_id": 1}) for _ in range(3)],
+        backend.request("sendMessage", {"chat_id": 1}),
+        backend.request("sendMessage", {"chat_id": 1}),
+    )
+
+    assert sorted(calls) == ["getChatAdministrators", "sendMessage", "sendMessage"]
+    assert backend.coalescer.counts == {"in_flight": 2}
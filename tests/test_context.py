@@ -69,3 +69,52 @@ def test_custom_attributes():
     context.attribute2 = "value2"
     assert context.attribute1 == "value1"
     assert context.attribute2 == "value2"
+
+
+def test_unset_attributes():
+    context = Context(None, None, None)
+
+    assert not hasattr(context, "sender_id")
+    assert not hasattr(context, "attribute")
+    assert getattr(context, "match", None) is None
+
+    context.match = "match"
+    context.attribute = "value"
+
+    assert context.match == "match"
+    assert context.__dict__ == {"attribute": "value"}
+
+
+async def test_unique_ids_are_memoized():
+    get_identity = Mock(return_value="b")
+    context = Context(None, None, AsyncMock(get_identity=get_identity))
+    context.sender_id = "someone"
+
+    assert context.sender_unique_id == "b:s:someone"
+    assert context.sender_unique_id == "b:s:someone"
+    assert get_identity.call_count == 1
+
+
+async def test_unique_ids_follow_sources():
+    context = Context(None, None, AsyncMock(get_identity=Mock(return_value="b")))
+    context.sender_id = "someone"
+    context.recipient_id = "michaelkrukov"
+
+    assert context.sender_unique_id == "b:s:someone"
+    assert context.recipient_unique_id == "b:r:michaelkrukov"
+
+    context.sender_id = "someone else"
+
+    assert context.sender_unique_id == "b:s:someone else"
+
+    context.update = Message(
+        "someone", "anyone", RecipientKind.PRIVATE_CHAT, "", [], 0, {}
+    )
+
+    assert context.sender_unique_id == "b:s:someone"
+    assert context.recipient_unique_id == "b:r:anyone"
+
+    context.backend = AsyncMock(get_identity=Mock(return_value="c"))
+
+    assert context.sender_unique_id == "c:s:someone"
+    assert context.recipient_unique_id == "c:r:anyone"
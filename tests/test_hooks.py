@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from kutana.hooks import DeferredHooksExecutor
+
+
+async def test_deferred_hooks_executor():
+    calls = []
+
+    async def hook(value):
+        calls.append(value)
+
+    async def failing_hook():
+        raise ValueError
+
+    executor = DeferredHooksExecutor(workers_count=2)
+    executor.start()
+
+    executor.submit("completion", hook, 1)
+    executor.submit("completion", failing_hook)
+    executor.submit("completion", hook, value=2)
+
+    assert executor.depth == 3
+
+    await executor.join()
+
+    assert executor.depth == 0
+    assert sorted(calls) == [1, 2]
+
+    executor.stop()
+
+
+@pytest.mark.parametrize(
+    "overflow,expected_calls",
+    [("drop_oldest", [2, 3]), ("drop_new", [1, 2])],
+)
+async def test_deferred_hooks_executor_overflow(overflow, expected_calls):
+    calls = []
+
+    async def hook(value):
+        calls.append(value)
+
+    executor = DeferredHooksExecutor(workers_count=1, maxsize=2, overflow=overflow)
+
+    for value in (1, 2, 3):
+        executor.submit("completion", hook, value)
+
+    assert executor.depth == 2
+    assert executor.dropped_count == 1
+
+    executor.start()
+    await asyncio.wait_for(executor.join(), 1)
+    executor.stop()
+
+    assert calls == expected_calls
+
+
+def test_deferred_hooks_executor_bad_arguments():
+    with pytest.raises(ValueError):
+        DeferredHooksExecutor(workers_count=0)
+
+    with pytest.raises(ValueError):
+        DeferredHooksExecutor(overflow="bruh")
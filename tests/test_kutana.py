@@ -0,0 +1,468 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from kutana import Kutana, Message, RecipientKind
+from kutana.backends.debug import Debug
+from kutana.plugin import Plugin
+
+
+class _SplittingDebug(Debug):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limits_parts = []
+
+    def split_rate_limits(self, parts):
+        self.rate_limits_parts.append(parts)
+
+
+def _make_sleepy_plugin(handled):
+    pl = Plugin("plugin")
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        await asyncio.sleep(0.05 / int(upd.text))
+        handled.append((upd.recipient_id, int(upd.text)))
+
+    return pl
+
+
+async def test_concurrent_dispatch():
+    handled = []
+
+    await Debug.handle_updates(
+        [_make_sleepy_plugin(handled)],
+        [
+            ("1", 1, 9001, []),
+            ("2", 1, 9001, []),
+            ("3", 1, 9002, []),
+        ],
+    )  # type: ignore
+
+    assert handled == [(9002, 3), (9001, 2), (9001, 1)]
+
+
+async def test_ordered_dispatch():
+    handled = []
+
+    app, _ = await Debug.handle_updates(
+        [_make_sleepy_plugin(handled)],
+        [
+            ("1", 1, 9001, []),
+            ("2", 1, 9001, []),
+            ("3", 1, 9002, []),
+        ],
+        config={"dispatch_mode": "ordered"},
+    )  # type: ignore
+
+    assert handled == [(9002, 3), (9001, 1), (9001, 2)]
+    assert app._lanes == {}
+
+
+async def test_ordered_dispatch_without_recipient():
+    handled = []
+
+    app, _ = await Debug.handle_updates(
+        [_make_sleepy_plugin(handled)],
+        [
+            ("1", 1, None, []),
+            ("2", 2, None, []),
+            ("3", None, None, []),
+            ("4", None, None, []),
+        ],
+        config={"dispatch_mode": "ordered"},
+    )  # type: ignore
+
+    # Messages are attributed by sender, or not attributed at all
+    assert handled == [(None, 4), (None, 3), (None, 2), (None, 1)]
+    assert app._lanes == {}
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+async def test_pool_dispatch(batch_size):
+    handled = []
+
+    await Debug.handle_updates(
+        [_make_sleepy_plugin(handled)],
+        [
+            ("1", 1, 9001, []),
+            ("2", 1, 9001, []),
+            ("3", 1, 9002, []),
+        ],
+        config={"dispatch_mode": "pool", "pool_batch_size": batch_size},
+    )  # type: ignore
+
+    assert sorted(handled) == [(9001, 1), (9001, 2), (9002, 3)]
+
+
+async def test_update_lanes():
+    pl = Plugin("plugin")
+
+    @pl.classify_updates()
+    def _(upd, backend):
+        return "urgent" if upd.text == "urgent" else None
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        pass
+
+    app, _ = await Debug.handle_updates(
+        [pl],
+        [
+            ("urgent", 1, 9001, []),
+            ("other", 1, 9001, []),
+            ("urgent", 1, 9001, []),
+        ],
+        config={
+            "update_lanes": [
+                {"name": "urgent", "weight": 2, "kinds": ["message_event"]},
+                {"name": "other", "weight": 1, "kinds": ["message"]},
+            ],
+        },
+    )  # type: ignore
+
+    assert app.updates_queue.lanes["urgent"].dequeued_count == 2
+    assert app.updates_queue.lanes["other"].dequeued_count == 1
+
+
+async def test_update_lanes_ordered():
+    handled = []
+
+    pl = Plugin("plugin")
+
+    @pl.classify_updates()
+    def _(upd, backend):
+        return "urgent" if upd.text.startswith("urgent") else None
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        handled.append(upd.text)
+
+    await Debug.handle_updates(
+        [pl],
+        [
+            ("other 1", 1, 9001, []),
+            ("other 2", 1, 9001, []),
+            ("urgent 3", 1, 9001, []),
+            ("urgent 4", 1, 9002, []),
+        ],
+        config={
+            "dispatch_mode": "ordered",
+            "update_lanes": [
+                {"name": "urgent", "weight": 4, "kinds": ["message_event"]},
+                {"name": "other", "weight": 1},
+            ],
+        },
+    )  # type: ignore
+
+    assert [text for text in handled if text != "urgent 4"] == [
+        "other 1",
+        "other 2",
+        "urgent 3",
+    ]
+
+
+async def test_handlers_added_after_start():
+    handled = []
+
+    pl = Plugin("plugin")
+
+    @pl.on_start()
+    async def _():
+        @pl.on_messages()
+        async def _(upd, ctx):
+            handled.append(upd.text)
+
+    vk_pl = Plugin("vk")
+
+    @vk_pl.on_start()
+    async def _():
+        @vk_pl.vk.on_payloads(["button"])
+        async def _(upd, ctx):
+            handled.append(ctx.payload)
+
+    await Debug.handle_updates(
+        [pl, vk_pl],
+        [
+            ("hey", 1, 9001, [], {"object": {"message": {}}}),
+            ("", 1, 9001, [], {"object": {"message": {"payload": '"button"'}}}),
+        ],
+        identity="vk",
+    )  # type: ignore
+
+    assert handled == ["hey", "button"]
+
+
+async def test_drain_waits_for_handlers():
+    handled = []
+
+    pl = Plugin("plugin")
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        started.set()
+        await asyncio.sleep(0.05)
+        handled.append(upd.text)
+
+    app = Kutana()
+    app.add_backend(Debug([("1", 1, 9001, []), ("2", 1, 9002, [])]))
+    app.add_plugin(pl)
+    app.config["concurrency_limit_max"] = 1
+
+    started = asyncio.Event()
+    future = asyncio.ensure_future(app._run())
+
+    await started.wait()
+    await app._drain()
+
+    # Already acquired updates are handled too
+    assert handled == ["1", "2"]
+    assert future.cancelled()
+
+
+async def test_drain_handles_spilled_updates(tmp_path):
+    handled = []
+
+    pl = Plugin("plugin")
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        started.set()
+        await asyncio.sleep(0.01)
+        handled.append(upd.text)
+
+    app = Kutana()
+    app.add_backend(Debug([(str(index), 1, 9001, []) for index in range(5)]))
+    app.add_plugin(pl)
+    app.config["concurrency_limit_max"] = 1
+    app.config["overflow_policy"] = {
+        "kind": "spill",
+        "path": str(tmp_path / "spill.bin"),
+    }
+
+    started = asyncio.Event()
+    future = asyncio.ensure_future(app._run())
+
+    await started.wait()
+    await app._drain()
+
+    assert handled == ["0", "1", "2", "3", "4"]
+    assert app.updates_queue.overflow.counts[("spilled", "message")] > 0
+    assert app._get_queued_updates_count() == 0
+    assert future.cancelled()
+
+    app.updates_queue.overflow.close()
+
+
+async def test_drain_timeout():
+    handled = []
+
+    pl = Plugin("plugin")
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        started.set()
+        await asyncio.sleep(10)
+        handled.append(upd.text)
+
+    app = Kutana()
+    app.add_backend(Debug([("1", 1, 9001, []), ("2", 1, 9001, [])]))
+    app.add_plugin(pl)
+    app.config["drain_timeout"] = 0.01
+    app.config["concurrency_limit_max"] = 1
+
+    started = asyncio.Event()
+    future = asyncio.ensure_future(app._run())
+
+    await started.wait()
+    await app._drain()
+
+    assert handled == []
+    assert len(app._handling_tasks) == 1
+
+    for task in app._handling_tasks:
+        task.cancel()
+
+    future.cancel()
+
+    # Updates left in the queue are reported
+    app._drop_queued_updates()
+
+    assert app.unhandled_counts == {"message": 1}
+
+
+async def test_routers_are_prepared_on_start():
+    app = Kutana()
+
+    pl = Plugin("plugin")
+    app.add_plugin(pl)
+
+    @pl.on_commands(["hey"])
+    async def _(upd, ctx):
+        pass
+
+    assert app._root_router is None
+
+    await app._init()
+
+    handlers = app._root_router.get_handlers("debug", Message, RecipientKind.GROUP_CHAT)
+    assert len(handlers) == 1
+    assert len(app._root_router.get_handlers("debug", dict)) == 0
+
+    with pytest.raises(RuntimeError):
+        app.add_plugin(Plugin("late"))
+
+
+async def test_unknown_dispatch_mode():
+    app = Kutana()
+    app.config["dispatch_mode"] = "bruh"
+
+    with pytest.raises(ValueError):
+        await app._run()
+
+
+async def test_worker_handles_received_updates():
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+
+    backend = _SplittingDebug([])
+    handled = []
+
+    pl = Plugin("plugin")
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        handled.append(upd.text)
+        if len(handled) == 2:
+            future.cancel()
+
+    app = Kutana()
+    app.add_backend(backend)
+    app.add_plugin(pl)
+
+    future = asyncio.ensure_future(app._run_worker(receiver, 2))
+
+    sender.send((0, backend._make_update("hey", 1, 9001, [])))
+    sender.send((0, backend._make_update("bye", 1, 9001, [])))
+
+    try:
+        await asyncio.wait_for(future, 5)
+    except asyncio.CancelledError:
+        pass
+
+    assert handled == ["hey", "bye"]
+    assert backend.rate_limits_parts == [3]
+
+
+async def test_acquirer_shards_updates_by_recipient():
+    connections = [multiprocessing.Pipe(duplex=False) for _ in range(3)]
+
+    app = Kutana()
+    app.add_backend(
+        _SplittingDebug(
+            [
+                ("1", 1, 9001, []),
+                ("2", 2, 9002, []),
+                ("3", 3, 9001, []),
+                ("4", 4, 9002, []),
+            ]
+        )
+    )
+
+    future = asyncio.ensure_future(
+        app._run_acquirer([sender for _, sender in connections])
+    )
+
+    received = {}
+
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+
+        for index, (receiver, _) in enumerate(connections):
+            while receiver.poll():
+                _, update = receiver.recv()
+                received[update.text] = index
+
+        if len(received) == 4:
+            break
+
+    future.cancel()
+
+    assert len(received) == 4
+    assert received["1"] == received["3"]
+    assert received["2"] == received["4"]
+
+    # Acquirer shares rate limits with workers
+    assert app._backends[0].rate_limits_parts == [4]
+
+
+def _run_application_with_workers(app, workers_count):
+    # Never reuse event loop of the test's process (and create the new one
+    # only after workers are started, like when application is run normally)
+    asyncio.set_event_loop_policy(None)
+    app.run_with_workers(workers_count)
+
+
+def test_spill_with_workers(tmp_path):
+    handled_path = tmp_path / "handled.txt"
+    spilled_path = tmp_path / "spilled.txt"
+    updates_count = 20
+
+    class _Backend(Debug):
+        async def on_start(self, app):
+            self.app = app
+
+        async def acquire_updates(self, queue):
+            await super().acquire_updates(queue)
+
+            while (
+                not handled_path.exists()
+                or len(handled_path.read_text().split()) < updates_count
+            ):
+                await asyncio.sleep(0.05)
+
+            self.app.stop()
+
+    pl = Plugin("plugin")
+
+    @pl.on_messages()
+    async def _(upd, ctx):
+        await asyncio.sleep(0.05)
+
+        with open(handled_path, "a") as fh:
+            fh.write(f"{upd.text}\n")
+
+    @pl.on_shutdown()
+    async def _():
+        with open(spilled_path, "a") as fh:
+            fh.write(f"{sum(app._updates_queue.overflow.counts.values())}\n")
+
+    app = Kutana(concurrent_handlers_count=1)
+    app.config["overflow_policy"] = {
+        "kind": "spill",
+        "path": str(tmp_path / "spill.bin"),
+    }
+    app.add_backend(
+        _Backend([(str(index), 1, 9001 + index, []) for index in range(updates_count)])
+    )
+    app.add_plugin(pl)
+
+    process = multiprocessing.get_context("fork").Process(
+        target=_run_application_with_workers, args=(app, 2)
+    )
+    process.start()
+    process.join(30)
+
+    if process.is_alive():
+        process.terminate()
+
+    assert process.exitcode == 0
+
+    handled = sorted(map(int, handled_path.read_text().split()))
+    assert handled == list(range(updates_count))
+
+    # Updates were spilled by workers too, and every file is removed
+    spilled = list(map(int, spilled_path.read_text().split()))
+    assert len(spilled) == 2
+    assert sum(spilled) > 0
+    assert not list(tmp_path.glob("spill.bin*"))
@@ -0,0 +1,167 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from kutana import Message, RecipientKind
+from kutana.lanes import UpdatesLane, UpdatesQueue, get_update_kind
+
+
+def _make_backend(identity="vk"):
+    return Mock(get_identity=Mock(return_value=identity))
+
+
+def test_get_update_kind():
+    message = Message(1, 1, RecipientKind.PRIVATE_CHAT, "", [], 0, {})
+
+    assert get_update_kind(message) == "message"
+    assert get_update_kind({"type": "message_event"}) == "message_event"
+    assert get_update_kind({"update_id": 1, "callback_query": {}}) == "callback_query"
+    assert get_update_kind(None) is None
+
+
+def test_bad_lanes():
+    with pytest.raises(ValueError):
+        UpdatesQueue([])
+
+    with pytest.raises(ValueError):
+        UpdatesLane("lane", weight=0)
+
+
+async def test_weighted_fair_dequeuing():
+    backend = _make_backend()
+
+    queue = UpdatesQueue(
+        [
+            UpdatesLane("urgent", weight=3, kinds=["message_event"]),
+            UpdatesLane("other"),
+        ]
+    )
+
+    for _ in range(8):
+        await queue.put(({"type": "message_edit"}, backend))
+        await queue.put(({"type": "message_event"}, backend))
+
+    assert queue.qsize() == 16
+    assert queue.lanes["urgent"].depth == 8
+    assert queue.lanes["other"].depth == 8
+
+    kinds = [get_update_kind(queue.get_nowait()[0]) for _ in range(8)]
+
+    assert kinds.count("message_event") == 6
+    assert kinds.count("message_edit") == 2
+
+    while not queue.empty():
+        await queue.get()
+
+    assert queue.lanes["urgent"].dequeued_count == 8
+    assert queue.lanes["other"].dequeued_count == 8
+    assert queue.lanes["other"].wait_time_max >= queue.lanes["other"].wait_time_average
+
+
+async def test_lanes_by_backend_and_classifiers():
+    queue = UpdatesQueue(
+        [
+            UpdatesLane("vk", backends=["vk"]),
+            UpdatesLane("special"),
+            UpdatesLane("other"),
+        ],
+        classifiers=[
+            lambda update, backend: "special" if update.get("special") else None,
+            lambda update, backend: "unknown",
+        ],
+    )
+
+    await queue.put(({"type": "a"}, _make_backend("vk")))
+    await queue.put(({"type": "a"}, _make_backend("tg")))
+    await queue.put(({"type": "a", "special": True}, _make_backend("vk")))
+
+    assert queue.lanes["vk"].depth == 1
+    assert queue.lanes["special"].depth == 2
+    assert queue.lanes["other"].depth == 0
+
+
+async def test_blocks_when_full():
+    queue = UpdatesQueue([UpdatesLane("lane")], maxsize=1)
+
+    await queue.put(({}, _make_backend()))
+
+    putter = asyncio.ensure_future(queue.put(({}, _make_backend())))
+    await asyncio.sleep(0)
+    assert not putter.done()
+
+    await queue.get()
+    await asyncio.sleep(0)
+    assert putter.done()
+
+
+async def test_same_key_in_one_lane():
+    backend = _make_backend()
+
+    queue = UpdatesQueue(
+        [
+            UpdatesLane("urgent", weight=3, kinds=["message_event"]),
+            UpdatesLane("other"),
+        ],
+        get_key=lambda update, backend: update.get("chat"),
+    )
+
+    await queue.put(({"type": "message_edit", "chat": 1, "index": 0}, backend))
+    await queue.put(({"type": "message_event", "chat": 1, "index": 1}, backend))
+    await queue.put(({"type": "message_event", "chat": 2, "index": 2}, backend))
+    await queue.put(({"type": "message_event", "index": 3}, backend))
+
+    assert queue.lanes["urgent"].depth == 2
+    assert queue.lanes["other"].depth == 2
+
+    indexes = [queue.get_nowait()[0]["index"] for _ in range(4)]
+
+    assert indexes.index(0) < indexes.index(1)
+
+    # Lane is chosen again when there are no queued updates with the key
+    await queue.put(({"type": "message_event", "chat": 1}, backend))
+
+    assert queue.lanes["urgent"].depth == 1
+
+
+async def test_put_nowait():
+    backend = _make_backend()
+    queue = UpdatesQueue([UpdatesLane("lane")], maxsize=1)
+
+    getter = asyncio.ensure_future(queue.get())
+    await asyncio.sleep(0)
+
+    queue.put_nowait(({}, backend))
+
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait(({}, backend))
+
+    assert await asyncio.wait_for(getter, 1) == ({}, backend)
+    assert queue.received_counts == {}
+
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+
+
+async def test_broken_classifier():
+    def classify(update, backend):
+        raise ValueError
+
+    queue = UpdatesQueue(
+        [UpdatesLane("special"), UpdatesLane("other", kinds=["message_edit"])],
+        classifiers=[classify, lambda update, backend: "special"],
+    )
+
+    await queue.put(({"type": "message_edit"}, _make_backend()))
+
+    # Other classifiers and configured lanes are still used
+    assert queue.lanes["special"].depth == 1
+
+    queue = UpdatesQueue(
+        [UpdatesLane("special", kinds=["message_new"]), UpdatesLane("other")],
+        classifiers=[classify],
+    )
+
+    await queue.put(({"type": "message_edit"}, _make_backend()))
+
+    assert queue.lanes["other"].depth == 1
@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import pytest
+
+from kutana.limiter import ConcurrencyLimiter, RateLimiter
+
+
+def test_bad_limits():
+    with pytest.raises(ValueError):
+        ConcurrencyLimiter(0, 10)
+
+    with pytest.raises(ValueError):
+        ConcurrencyLimiter(10, 5)
+
+
+async def test_fixed_limit():
+    limiter = ConcurrencyLimiter(2, 2)
+
+    await limiter.acquire()
+    await limiter.acquire()
+
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    limiter.release(100)
+    await asyncio.sleep(0)
+    assert waiter.done()
+
+    assert limiter.limit == 2
+    assert limiter.in_flight == 2
+
+
+async def test_cancelled_waiter():
+    limiter = ConcurrencyLimiter(1, 1)
+
+    await limiter.acquire()
+
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.sleep(0)
+
+    limiter.release()
+
+    assert limiter.in_flight == 0
+    await asyncio.wait_for(limiter.acquire(), 1)
+
+
+async def test_decrease_on_grown_latency():
+    limiter = ConcurrencyLimiter(5, 10)
+
+    for latency in (0.01, 0.01, 1, 1, 1):
+        await limiter.acquire()
+        limiter.release(latency)
+
+    assert limiter.limit == 9
+
+    for _ in range(100):
+        limiter._decreased_at = 0
+        await limiter.acquire()
+        limiter.release(1)
+
+    assert limiter.limit == 5
+
+
+async def test_decrease_on_lag():
+    limiter = ConcurrencyLimiter(5, 10)
+    limiter.lag = 1
+
+    await limiter.acquire()
+    limiter.release(0.01)
+
+    assert limiter.limit == 9
+
+
+async def test_increase_when_utilized():
+    limiter = ConcurrencyLimiter(1, 3)
+    limiter._set_limit(1)
+
+    for _ in range(10):
+        limit = limiter.limit
+
+        for _ in range(limit):
+            await limiter.acquire()
+
+        for _ in range(limit):
+            limiter.release(0.01)
+
+    assert limiter.limit == 3
+
+
+async def test_no_increase_when_not_utilized():
+    limiter = ConcurrencyLimiter(1, 3)
+    limiter._set_limit(2)
+
+    for _ in range(10):
+        await limiter.acquire()
+        limiter.release(0.01)
+
+    assert limiter.limit == 2
+
+
+async def test_lag_monitor():
+    limiter = ConcurrencyLimiter(1, 3)
+    limiter.start(lag_check_interval=0.01)
+
+    await asyncio.sleep(0.02)
+    assert limiter._lag_monitor is not None
+
+    limiter.stop()
+    assert limiter._lag_monitor is None
+
+
+def test_bad_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
+
+    with pytest.raises(ValueError):
+        RateLimiter(10, burst=0)
+
+
+async def test_rate_limit():
+    limiter = RateLimiter(20, burst=2)
+
+    started_at = time.monotonic()
+
+    await limiter.acquire()
+    await limiter.acquire()
+    assert time.monotonic() - started_at < 0.04
+    assert not limiter.available
+
+    await limiter.acquire()
+    assert time.monotonic() - started_at >= 0.04
+
+
+async def test_rate_decrease_and_recovery():
+    limiter = RateLimiter(20, min_rate=5, recovery_time=0.1)
+
+    limiter.decrease()
+    assert limiter.rate == 10
+    assert not limiter.available
+
+    limiter.decrease()
+    limiter.decrease()
+    assert limiter.rate == 5
+
+    await asyncio.sleep(0.25)
+
+    assert limiter.available
+    assert limiter.rate == 20
@@ -0,0 +1,127 @@
+import socket
+
+import aiohttp
+
+from kutana.backends.debug import Debug
+from kutana.metrics import MetricsRegistry
+from kutana.plugin import Plugin
+
+
+def test_render():
+    registry = MetricsRegistry()
+
+    counter = registry.counter("requests_total", "Requests.", ("method",))
+    counter.inc("get")
+    counter.inc("get")
+    counter.inc('with "quotes"', amount=3)
+
+    registry.gauge("depth", "Depth.", callback=lambda: 5)
+
+    histogram = registry.histogram("duration", "Duration.", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert registry.render() == "\n".join(
+        [
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{method="get"} 2',
+            'requests_total{method="with \\"quotes\\""} 3',
+            "# HELP depth Depth.",
+            "# TYPE depth gauge",
+            "depth 5",
+            "# HELP duration Duration.",
+            "# TYPE duration histogram",
+            'duration_bucket{le="0.1"} 1',
+            'duration_bucket{le="1.0"} 2',
+            'duration_bucket{le="+Inf"} 3',
+            "duration_sum 5.55",
+            "duration_count 3",
+            "",
+        ]
+    )
+
+
+async def test_serve():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.").inc()
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    await registry.start_server(port=port)
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                assert response.status == 200
+                assert "requests_total 1" in await response.text()
+    finally:
+        await registry.stop_server()
+
+
+async def test_application_metrics():
+    pl = Plugin("plugin")
+
+    @pl.on_commands(["hey"])
+    async def hey(upd, ctx):
+        await ctx.reply("hey")
+
+    @pl.on_commands(["fail"])
+    async def fail(upd, ctx):
+        raise RuntimeError("Oops")
+
+    app, _ = await Debug.handle_updates(
+        [pl],
+        [
+            ("/hey", 1, 9001, []),
+            ("/fail", 1, 9001, []),
+            ("/hey", 1, 9001, []),
+        ],
+        identity="debug",
+        config={"metrics_enabled": True},
+    )  # type: ignore
+
+    handler_name = "test_application_metrics.<locals>.hey"
+
+    assert app.metrics.updates.collect() == [(("debug",), 3)]
+    assert app.metrics.handler_duration.values[("plugin", handler_name)][2] == 2
+    assert app.metrics.handler_exceptions.values == {
+        ("plugin", "test_application_metrics.<locals>.fail"): 1
+    }
+
+    rendered = app.metrics.render()
+
+    assert "kutana_concurrency_limit 512" in rendered
+    assert "kutana_queue_depth 0" in rendered
+
+
+async def test_anonymous_handlers_metrics():
+    pl = Plugin("plugin")
+
+    @pl.on_commands(["hey"])
+    async def _(upd, ctx):
+        await ctx.reply("hey")
+
+    hey_line = _.__code__.co_firstlineno
+
+    @pl.on_commands(["bye"])
+    async def _(upd, ctx):
+        await ctx.reply("bye")
+
+    bye_line = _.__code__.co_firstlineno
+
+    app, _ = await Debug.handle_updates(
+        [pl],
+        [("/hey", 1, 9001, []), ("/bye", 1, 9001, [])],
+        config={"metrics_enabled": True},
+    )
+
+    prefix = "test_anonymous_handlers_metrics.<locals>._"
+
+    assert set(app.metrics.handler_duration.values) == {
+        ("plugin", f"{prefix}:{hey_line}"),
+        ("plugin", f"{prefix}:{bye_line}"),
+    }
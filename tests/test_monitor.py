@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from kutana.backends.debug import Debug
+from kutana.monitor import LoopMonitor
+from kutana.plugin import Plugin
+
+
+async def test_lag_percentiles():
+    monitor = LoopMonitor(interval=0.01, blocking_threshold=10)
+
+    assert monitor.get_percentiles() == {0.5: 0.0, 0.9: 0.0, 0.99: 0.0, 1.0: 0.0}
+
+    monitor.start()
+
+    try:
+        await asyncio.sleep(0.05)
+        time.sleep(0.1)
+        await asyncio.sleep(0.05)
+    finally:
+        monitor.stop()
+
+    percentiles = monitor.get_percentiles()
+
+    assert percentiles[1.0] >= 0.08
+    assert percentiles[0.5] < 0.08
+    assert not monitor.blocked_calls
+
+
+async def test_blocking_calls():
+    pl = Plugin("plugin")
+
+    @pl.on_commands(["block"])
+    async def block(upd, ctx):
+        time.sleep(0.3)
+
+    @pl.on_commands(["hey"])
+    async def hey(upd, ctx):
+        await ctx.reply("hey")
+
+    app, _ = await Debug.handle_updates(
+        [pl],
+        [("/hey", 1, 9001, []), ("/block", 1, 9001, [])],
+        config={
+            "metrics_enabled": True,
+            "loop_monitor_enabled": True,
+            "loop_monitor_interval": 0.01,
+            "loop_blocking_threshold": 0.1,
+        },
+    )
+
+    handler = ("plugin", "test_blocking_calls.<locals>.block")
+
+    assert app.loop_monitor.blocked_counts == {handler: 1}
+
+    blocked_call = app.loop_monitor.blocked_calls[0]
+
+    assert blocked_call.handler == handler
+    assert blocked_call.duration >= 0.1
+    assert "time.sleep(0.3)" in blocked_call.stack
+
+    assert (
+        'kutana_loop_blocked_total{plugin="plugin",'
+        'handler="test_blocking_calls.<locals>.block"} 1'
+    ) in app.metrics.render()
@@ -0,0 +1,119 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from kutana import Message, RecipientKind
+from kutana.backends.debug import Debug
+from kutana.lanes import UpdatesLane, UpdatesQueue
+from kutana.overflow import (
+    DropKindsPolicy,
+    DropOldestPolicy,
+    ReplyBusyPolicy,
+    SpillPolicy,
+    make_overflow_policy,
+)
+
+
+def _make_queue(overflow, maxsize=2):
+    return UpdatesQueue([UpdatesLane("default")], maxsize=maxsize, overflow=overflow)
+
+
+def _make_backend():
+    return Mock(get_identity=Mock(return_value="vk"), send_message=AsyncMock())
+
+
+def _make_message(text):
+    return Message(1, 9001, RecipientKind.PRIVATE_CHAT, text, [], 0, {})
+
+
+def test_make_overflow_policy():
+    assert make_overflow_policy(None, []) is None
+    assert isinstance(
+        make_overflow_policy({"kind": "drop_oldest"}, []), DropOldestPolicy
+    )
+
+    with pytest.raises(ValueError):
+        make_overflow_policy({"kind": "bruh"}, [])
+
+
+async def test_drop_oldest():
+    backend = _make_backend()
+    policy = DropOldestPolicy()
+    queue = _make_queue(policy)
+
+    for index in range(4):
+        await queue.put(({"type": "message_edit", "index": index}, backend))
+
+    assert [queue.get_nowait()[0]["index"] for _ in range(2)] == [2, 3]
+    assert policy.counts[("dropped", "message_edit")] == 2
+
+
+async def test_drop_kinds():
+    backend = _make_backend()
+    policy = DropKindsPolicy(kinds=["message_edit"])
+    queue = _make_queue(policy)
+
+    await queue.put(({"type": "message_edit"}, backend))
+    await queue.put(({"type": "message_new"}, backend))
+    await queue.put(({"type": "message_edit"}, backend))
+    await queue.put(({"type": "message_new"}, backend))
+
+    assert [queue.get_nowait()[0]["type"] for _ in range(2)] == [
+        "message_new",
+        "message_new",
+    ]
+    assert policy.counts[("dropped", "message_edit")] == 2
+
+    await queue.put(({"type": "message_new"}, backend))
+    await queue.put(({"type": "message_new"}, backend))
+
+    putter = asyncio.ensure_future(queue.put(({"type": "message_new"}, backend)))
+    await asyncio.sleep(0)
+    assert not putter.done()
+    putter.cancel()
+
+
+async def test_reply_busy():
+    backend = _make_backend()
+    policy = ReplyBusyPolicy(text="busy")
+    queue = _make_queue(policy, maxsize=1)
+
+    await queue.put((_make_message("1"), backend))
+    await queue.put((_make_message("2"), backend))
+    await queue.put(({"type": "message_edit"}, backend))
+    await asyncio.sleep(0)
+
+    assert queue.qsize() == 1
+    backend.send_message.assert_awaited_once_with(9001, "busy")
+    assert policy.counts[("replied", "message")] == 1
+    assert policy.counts[("dropped", "message_edit")] == 1
+
+    # Dropped updates are still counted as received
+    assert queue.received_counts == {"vk": 3}
+
+
+async def test_spill(tmp_path):
+    backend = Debug([])
+    policy = SpillPolicy(str(tmp_path / "spill.bin"), [backend])
+    queue = _make_queue(policy)
+
+    for index in range(5):
+        await queue.put((_make_message(str(index)), backend))
+
+    assert queue.qsize() == 2
+    assert policy.pending == 3
+    assert policy.counts[("spilled", "message")] == 3
+
+    texts = []
+    while not queue.empty():
+        texts.append((await queue.get())[0].text)
+
+    assert texts == ["0", "1", "2", "3", "4"]
+    assert policy.pending == 0
+
+    await queue.put((_make_message("5"), backend))
+    assert queue.get_nowait()[0].text == "5"
+
+    policy.close()
+    assert not (tmp_path / "spill.bin").exists()
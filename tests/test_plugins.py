@@ -1,8 +1,11 @@
+import asyncio
+
 import pytest
 
+from kutana import HandlerTimeoutException
 from kutana.backends.debug import Debug
 from kutana.plugin import Plugin
-from kutana.update import Attachment, AttachmentKind
+from kutana.update import Attachment, AttachmentKind, RecipientKind
 
 
 def test_attributes():
@@ -132,6 +135,76 @@ async def test_on_attachments():
     ]
 
 
+async def test_filters():
+    pl = Plugin("plugin")
+
+    @pl.on_commands(["hey"], backends=["tg"])
+    async def _(upd, ctx):
+        await ctx.reply("tg")
+
+    @pl.on_messages(priority=1, recipient_kinds=[RecipientKind.GROUP_CHAT])
+    async def _(upd, ctx):
+        await ctx.reply("group chat")
+
+    @pl.on_commands(["hey"], backends=["vk"])
+    async def _(upd, ctx):
+        await ctx.reply("vk")
+
+    @pl.on_match([r"oh hey"], recipient_kinds=[RecipientKind.PRIVATE_CHAT])
+    async def _(upd, ctx):
+        await ctx.reply("private chat")
+
+    _, backend = await Debug.handle_updates(
+        [pl],
+        [
+            ("/hey", 1, 9001, []),
+            ("oh hey", 1, 9001, []),
+        ],
+        identity="vk",
+    )  # type: ignore
+
+    assert backend.messages == [
+        (9001, "vk", None, {}),
+        (9001, "private chat", None, {}),
+    ]
+
+
+async def test_routing_cache():
+    pl = Plugin("plugin")
+
+    @pl.on_commands(["top"])
+    async def _(upd, ctx):
+        await ctx.reply(f"top {ctx.body}")
+
+    @pl.on_match([r"bal(ance)?"])
+    async def _(upd, ctx):
+        await ctx.reply(f"balance {ctx.match.group(1)}")
+
+    app, backend = await Debug.handle_updates(
+        [pl],
+        [
+            ("/top", 1, 9001, []),
+            ("/top", 1, 9001, []),
+            ("/top 10", 1, 9001, []),
+            ("balance", 1, 9001, []),
+            ("balance", 1, 9001, []),
+        ],
+        config={"routing_cache_size": 16},
+    )  # type: ignore
+
+    assert backend.messages == [
+        (9001, "top ", None, {}),
+        (9001, "top ", None, {}),
+        (9001, "top 10", None, {}),
+        (9001, "balance ance", None, {}),
+        (9001, "balance ance", None, {}),
+    ]
+
+    assert len(app.routing_cache) == 3
+    assert app.routing_cache.hits == 2
+    assert app.routing_cache.misses == 3
+
+
 async def test_event_hooks():
     pl = Plugin("plugin")
 
@@ -177,3 +250,87 @@ async def test_event_hooks():
     assert called_on_exception
     assert called_on_shutdown
     assert backend.messages == []
+
+
+async def test_deferred_and_concurrent_hooks():
+    pl = Plugin("plugin")
+
+    first_called = asyncio.Event()
+    second_called = asyncio.Event()
+    deferred_calls = []
+
+    @pl.on_completion()
+    async def _(ctx):
+        first_called.set()
+        await asyncio.wait_for(second_called.wait(), 1)
+
+    @pl.on_completion()
+    async def _(ctx):
+        second_called.set()
+        await asyncio.wait_for(first_called.wait(), 1)
+
+    @pl.on_completion(deferred=True)
+    async def _(ctx):
+        await asyncio.sleep(0.01)
+        deferred_calls.append(ctx.update.text)
+
+    @pl.on_exception(deferred=True)
+    async def _(ctx, exc):
+        deferred_calls.append(str(exc))
+
+    @pl.on_commands(["fail"])
+    async def _(upd, ctx):
+        raise RuntimeError("Oops")
+
+    app, _ = await Debug.handle_updates(
+        [pl],
+        [
+            ("/hey", 1, 9001, []),
+            ("/fail", 1, 9001, []),
+        ],
+        config={"concurrent_hooks": True},
+    )  # type: ignore
+
+    assert first_called.is_set()
+    assert second_called.is_set()
+    assert sorted(deferred_calls) == ["/hey", "Oops"]
+    assert app.hooks_executor.depth == 0
+
+
+async def test_handler_timeout():
+    pl = Plugin("plugin")
+
+    exceptions = []
+
+    @pl.on_exception()
+    async def _(ctx, exc):
+        exceptions.append(exc)
+
+    @pl.on_commands(["slow"], timeout=0.01)
+    async def _(upd, ctx):
+        await asyncio.sleep(10)
+
+    @pl.on_commands(["fast"], timeout=1)
+    async def _(upd, ctx):
+        await ctx.reply("fast")
+
+    @pl.on_commands(["default"])
+    async def _(upd, ctx):
+        await asyncio.sleep(10)
+
+    _, backend = await Debug.handle_updates(
+        [pl],
+        [
+            ("/slow", 1, 9001, []),
+            ("/fast", 1, 9001, []),
+            ("/default", 1, 9001, []),
+        ],
+        config={"handler_timeout": 0.02},
+    )  # type: ignore
+
+    assert backend.messages == [(9001, "fast", None, {})]
+
+    assert len(exceptions) == 2
+    assert all(isinstance(exc, HandlerTimeoutException) for exc in exceptions)
+    assert sorted(exc.timeout for exc in exceptions) == [0.01, 0.02]
+    assert "asyncio.sleep(10)" in exceptions[0].stack
@@ -1,3 +1,4 @@
+from kutana import Message, RecipientKind
 from kutana.backends.debug import Debug
 from kutana.plugin import Plugin
 
@@ -52,6 +53,45 @@ async def test_vk_on_payloads():
     ]
 
 
+async def test_vk_on_payloads_shapes():
+    pl1 = Plugin("plugin1")
+    pl2 = Plugin("plugin2")
+
+    @pl1.vk.on_payloads([{"command": "buy"}])
+    async def _(upd, ctx):
+        await ctx.reply("buy")
+
+    @pl2.vk.on_payloads([{"command": "buy", "item": {"id": 1}}])
+    async def _(upd, ctx):
+        await ctx.reply("buy item")
+
+    @pl2.vk.on_payloads([{"page": 2}, ["list"]])
+    async def _(upd, ctx):
+        await ctx.reply("other")
+
+    def _make_update(payload):
+        return ("", 1, 9001, [], {"object": {"message": {"payload": payload}}})
+
+    _, backend = await Debug.handle_updates(
+        [pl1, pl2],
+        [
+            _make_update('{"command": "buy", "item": {"id": 1}, "extra": 1}'),
+            _make_update('{"command": "buy", "item": {"id": 2}}'),
+            _make_update('{"item": {"id": 1}}'),
+            _make_update('{"command": "sell", "page": 2}'),
+            _make_update('["list"]'),
+        ],
+        identity="vk",
+    )  # type: ignore
+
+    assert [message[1] for message in backend.messages] == [
+        "buy item",
+        "buy",
+        "other",
+        "other",
+    ]
+
+
 async def test_vk_on_chat_actions():
     pl = Plugin("plugin")
 
@@ -100,3 +140,35 @@ async def test_vk_on_chat_actions():
     assert backend.messages == [
         (9001, "hey", None, {}),
     ]
+
+
+async def test_vk_extensions_filters():
+    pl = Plugin("plugin")
+
+    @pl.vk.on_payloads(["button"], recipient_kinds=[RecipientKind.GROUP_CHAT])
+    async def _(upd, ctx):
+        await ctx.reply("group")
+
+    @pl.vk.on_callbacks(["button"], backends=["vk2"])
+    async def _(upd, ctx):
+        await ctx.reply("vk2")
+
+    @pl.vk.on_payloads(["button"])
+    async def _(upd, ctx):
+        await ctx.reply("any")
+
+    app, backend = await Debug.handle_updates(
+        [pl],
+        [("", 1, 9001, [], {"object": {"message": {"payload": '"button"'}}})],
+        identity="vk",
+    )  # type: ignore
+
+    assert backend.messages == [(9001, "any", None, {})]
+
+    # Filtered handlers are not even compiled into plans
+    get_handlers = app._root_router.get_handlers
+
+    assert len(get_handlers("vk", Message, RecipientKind.PRIVATE_CHAT)) == 1
+    assert len(get_handlers("vk", Message, RecipientKind.GROUP_CHAT)) == 1
+    assert len(get_handlers("vk", dict)) == 0
+    assert len(get_handlers("vk2", dict)) == 1
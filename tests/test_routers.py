@@ -1,10 +1,19 @@
+import re
 from unittest.mock import MagicMock
 
 import pytest
 
 from kutana.handler import PROCESSED, SKIPPED
-from kutana.router import CommandsRouter, ListRouter, MapRouter
-from kutana.update import Message
+from kutana.router import (
+    CommandsRouter,
+    CompiledRouter,
+    ListRouter,
+    MapRouter,
+    MatchRouter,
+    RoutingCache,
+    _get_literal_prefix,
+)
+from kutana.update import Message, RecipientKind
 
 
 def test_merge_ok():
@@ -55,6 +64,7 @@ async def test_commands_router():
 
     def _get_context(message):
         return MagicMock(
+            routing_decisions=None,
             app=MagicMock(config={"prefixes": ["/"]}),
             update=MagicMock(spec=Message, text=message),
         )
@@ -74,3 +84,153 @@ async def test_commands_router():
 
     assert await r.handle("upd", _get_context("/skipped")) == SKIPPED
     assert await r.handle("upd", _get_context("/processed")) == PROCESSED
+
+
+async def test_compiled_router():
+    calls = []
+
+    def _make_handler(name, result):
+        async def _handler(upd, ctx):
+            calls.append(name)
+            return result
+
+        return _handler
+
+    r1 = ListRouter()
+    r1.add_handler(_make_handler("messages", SKIPPED), update_types=(Message,))
+    r1.add_handler(_make_handler("updates", SKIPPED))
+
+    r2 = CommandsRouter()
+    r2.add_handler("cmd", _make_handler("command", PROCESSED))
+
+    r3 = ListRouter()
+    r3.add_handler(_make_handler("last", PROCESSED))
+
+    r4 = ListRouter(priority=-1, backends=["tg"])
+    r4.add_handler(_make_handler("tg", PROCESSED))
+
+    r5 = ListRouter(priority=-1, recipient_kinds=[RecipientKind.GROUP_CHAT])
+    r5.add_handler(_make_handler("group", PROCESSED))
+
+    compiled = CompiledRouter([r1, r2, r3, r4, r5])
+
+    assert len(compiled.get_handlers("vk", Message, RecipientKind.PRIVATE_CHAT)) == 4
+    assert len(compiled.get_handlers("vk", Message, RecipientKind.GROUP_CHAT)) == 5
+    assert len(compiled.get_handlers("tg", Message, RecipientKind.GROUP_CHAT)) == 6
+    assert len(compiled.get_handlers("vk", dict)) == 2
+    assert len(compiled.get_handlers("tg", dict)) == 3
+
+    context = MagicMock(update={}, routing_decisions=None)
+    context.backend.get_identity.return_value = "vk"
+
+    assert await compiled.handle({"type": "raw"}, context) == PROCESSED
+    assert calls == ["updates", "last"]
+
+    calls.clear()
+
+    message = MagicMock(
+        spec=Message, text="/cmd", recipient_kind=RecipientKind.PRIVATE_CHAT
+    )
+    context = MagicMock(
+        app=MagicMock(config={"prefixes": ["/"]}),
+        update=message,
+        routing_decisions=None,
+    )
+    context.backend.get_identity.return_value = "vk"
+
+    assert await compiled.handle(message, context) == PROCESSED
+    assert calls == ["messages", "updates", "command"]
+
+
+def test_commands_router_extract_keys():
+    r = CommandsRouter()
+    r.add_handler("echo", None)
+    r.add_handler("Echoes", None)
+
+    def _extract(message, prefixes=("/",)):
+        context = MagicMock(
+            routing_decisions=None,
+            app=MagicMock(config={"prefixes": list(prefixes)}),
+            update=MagicMock(spec=Message, text=message),
+        )
+        return tuple(r.extract_keys(context)), context
+
+    keys, context = _extract("  / ECHOES hello there ")
+    assert keys == ("echoes",)
+    assert context.prefix == "/"
+    assert context.command == "ECHOES"
+    assert context.body == "hello there"
+    assert context.match.group(3) == " hello there "
+
+    keys, context = _extract("echo")
+    assert keys == ("echo",)
+    assert context.prefix is None
+    assert context.body == ""
+
+    assert _extract("!echo")[0] == ()
+    assert _extract("!echo", prefixes=("/", "!"))[0] == ("echo",)
+    assert _extract("/ech")[0] == ()
+
+    r.add_handler("ech", None)
+    assert _extract("/ech")[0] == ("ech",)
+
+
+def test_get_literal_prefix():
+    assert _get_literal_prefix(re.compile(r"^hello (\w+)$")) == "hello "
+    assert _get_literal_prefix(re.compile(r"\Aab*c")) == "a"
+    assert _get_literal_prefix(re.compile(r"a|b")) == ""
+    assert _get_literal_prefix(re.compile(r"(?i)abc")) == ""
+    assert _get_literal_prefix(re.compile(r"abc", re.IGNORECASE)) == ""
+    assert _get_literal_prefix(re.compile(r"\.x?")) == "."
+
+
+async def test_match_router():
+    calls = []
+
+    def _make_handler(name, result):
+        async def _handler(upd, ctx):
+            calls.append((name, ctx.match.group(0)))
+            return result
+
+        return _handler
+
+    r = MatchRouter()
+    r.add_handler([r"hello", r"hi"], _make_handler("greeting", SKIPPED))
+    r.add_handler([r"(?i)HI THERE"], _make_handler("shout", SKIPPED))
+    r.add_handler([re.compile(r"h\w+")], _make_handler("any", PROCESSED))
+    r.add_handler([r"hi there"], _make_handler("unreachable", PROCESSED))
+
+    assert list(r._get_candidates("bye")) == [1]
+    assert list(r._get_candidates("hi there")) == [0, 1, 2, 3]
+
+    message = MagicMock(spec=Message, text="hi there")
+    assert await r.handle(message, MagicMock(routing_decisions=None)) == PROCESSED
+    assert calls == [("greeting", "hi"), ("shout", "hi there"), ("any", "hi")]
+
+    calls.clear()
+
+    message = MagicMock(spec=Message, text="bye")
+    assert await r.handle(message, MagicMock(routing_decisions=None)) == SKIPPED
+    assert calls == []
+
+
+def test_routing_cache():
+    cache = RoutingCache(maxsize=2)
+    r1, r2 = ListRouter(), ListRouter()
+
+    decisions = cache.get("vk", "/top")
+    decisions[r1] = "decision1"
+    decisions[r2] = "decision2"
+
+    cache.get("tg", "/top")[r1] = "decision3"
+
+    assert cache.get("vk", "/top") == {r1: "decision1", r2: "decision2"}
+    assert cache.get("tg", "/top") == {r1: "decision3"}
+
+    cache.get("vk", "/balance")
+
+    assert len(cache) == 2
+    assert cache.get("tg", "/top") == {r1: "decision3"}
+    assert cache.get("vk", "/top") == {}
+
+    assert (cache.hits, cache.misses) == (3, 4)
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import socket
+
+from kutana import Kutana
+from kutana.backends.debug import Debug
+from kutana.backends.vkontakte import VkontakteLongpoll
+from kutana.plugin import Plugin
+from kutana.tracing import (
+    JsonLinesExporter,
+    LocalCollector,
+    OtlpExporter,
+    Trace,
+    TraceExporter,
+)
+
+
+class CollectingExporter(TraceExporter):
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+def _get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def test_application_traces():
+    pl = Plugin("plugin")
+
+    @pl.on_commands(["hey"])
+    @pl.with_storage()
+    async def hey(upd, ctx):
+        await ctx.reply("hey")
+
+    exporter = CollectingExporter()
+
+    await Debug.handle_updates(
+        [pl],
+        [("/hey", 1, 9001, []), ("/hey", 1, 9001, [])],
+        identity="debug",
+        config={"tracing_exporter": exporter},
+    )
+
+    assert len(exporter.traces) == 2
+
+    spans = {span.name: span for span in exporter.traces[0].spans}
+
+    assert set(spans) == {
+        "update",
+        "queue",
+        "setup_context",
+        "routing",
+        "handler",
+        "storage.get",
+        "hooks",
+    }
+    assert spans["update"].attributes == {"backend": "debug", "kind": "message"}
+    assert spans["routing"].parent_id == spans["update"].span_id
+    assert spans["handler"].parent_id == spans["routing"].span_id
+    assert spans["handler"].attributes["plugin"] == "plugin"
+    assert spans["handler"].attributes["handler"].endswith(".hey")
+    assert spans["storage.get"].parent_id == spans["handler"].span_id
+    assert all(span.duration is not None for span in spans.values())
+    assert spans["update"].start_time <= spans["queue"].start_time
+
+
+async def test_application_traces_sampling():
+    pl = Plugin("plugin")
+
+    @pl.on_commands(["hey"])
+    async def hey(upd, ctx):
+        await ctx.reply("hey")
+
+    exporter = CollectingExporter()
+
+    _, debug = await Debug.handle_updates(
+        [pl],
+        [("/hey", 1, 9001, [])] * 3,
+        config={"tracing_exporter": exporter, "tracing_sample_rate": 0},
+    )
+
+    assert len(debug.messages) == 3
+    assert exporter.traces == []
+
+
+async def test_vkontakte_request_spans():
+    backend = VkontakteLongpoll("nicetoken")
+    backend._start_requests_queue_handler()
+
+    async def _direct_request(method, kwargs, token=None):
+        return [1] * kwargs["code"].count("API.")
+
+    backend._direct_request = _direct_request
+
+    trace = Trace()
+
+    try:
+        with trace.span("handler"):
+            assert await backend.request("users.get", {}) == 1
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    spans = {span.name: span for span in trace.spans}
+
+    assert spans["request"].parent_id == spans["handler"].span_id
+    assert spans["request"].attributes == {"backend": "vk", "method": "users.get"}
+    assert spans["batch_wait"].parent_id == spans["request"].span_id
+    assert spans["execute"].parent_id == spans["request"].span_id
+    assert spans["execute"].attributes == {"chunk_size": 1}
+    assert not backend.requests_spans
+
+
+async def test_jsonl_exporter(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+
+    exporter = JsonLinesExporter(path, interval=10, batch_size=2)
+    exporter.start()
+
+    trace = Trace(backend="vk")
+    trace.add_span("queue", trace.root.start_time, trace.root.start_time + 1)
+    trace.root.end()
+
+    exporter.export(trace)
+    exporter.export(trace)
+
+    # Full batch is written at once, and the rest is written on stop
+    for _ in range(50):
+        await asyncio.sleep(0.01)
+
+        with open(path) as file:
+            if file.read():
+                break
+
+    exporter.export(trace)
+
+    with open(path) as file:
+        assert len(file.readlines()) == 2
+
+    await exporter.stop()
+
+    with open(path) as file:
+        lines = file.readlines()
+
+    assert len(lines) == 3
+
+    data = json.loads(lines[0])
+
+    assert data["trace_id"] == trace.trace_id
+    assert [span["name"] for span in data["spans"]] == ["update", "queue"]
+    assert data["spans"][0]["attributes"] == {"backend": "vk"}
+    assert data["spans"][1]["duration"] == 1
+
+
+async def test_jsonl_exporter_in_worker(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+
+    app = Kutana()
+    app.config["tracing_exporter"] = {"kind": "jsonl", "path": path}
+    app._worker_index = 1
+
+    await app._init()
+
+    try:
+        assert app.tracer.exporter.path == f"{path}.worker1"
+    finally:
+        await app.tracer.stop()
+        app._limiter.stop()
+
+
+async def test_otlp_exporter():
+    port = _get_free_port()
+
+    collector = LocalCollector()
+    await collector.start(port=port)
+
+    exporter = OtlpExporter(f"http://127.0.0.1:{port}/v1/traces", batch_size=2)
+    exporter.start()
+
+    try:
+        trace = Trace(backend="vk")
+
+        with trace.span("handler", attempt=1):
+            pass
+
+        trace.root.end()
+
+        exporter.export(trace)
+
+        for _ in range(100):
+            if len(collector.spans) == 2:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await exporter.stop()
+        await collector.stop()
+
+    update_span, handler_span = collector.spans
+
+    assert update_span["traceId"] == trace.trace_id
+    assert update_span["parentSpanId"] == ""
+    assert update_span["attributes"] == [
+        {"key": "backend", "value": {"stringValue": "vk"}}
+    ]
+    assert handler_span["parentSpanId"] == update_span["spanId"]
+    assert handler_span["attributes"] == [
+        {"key": "attempt", "value": {"intValue": "1"}}
+    ]
+    assert int(handler_span["endTimeUnixNano"]) >= int(
+        handler_span["startTimeUnixNano"]
+    )
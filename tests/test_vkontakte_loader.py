@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from kutana.backends.vkontakte import VkontakteLongpoll
+from kutana.backends.vkontakte.loader import BatchLoader
+from kutana.exceptions import RequestException
+
+
+async def test_batch_loader():
+    calls = []
+
+    async def request(method, kwargs):
+        calls.append((method, kwargs))
+        return [{"id": int(user_id)} for user_id in kwargs["user_ids"].split(",")[1:]]
+
+    loader = BatchLoader(request, "users.get", "user_ids", {"fields": "sex"})
+
+    results = await asyncio.gather(
+        loader.load(1), loader.load(2), loader.load("2"), loader.load(3)
+    )
+
+    assert calls == [("users.get", {"fields": "sex", "user_ids": "1,2,3"})]
+    assert results == [None, {"id": 2}, {"id": 2}, {"id": 3}]
+    assert results[1] is results[2]
+
+    assert await loader.load_many([4, 5]) == [None, {"id": 5}]
+    assert len(calls) == 2
+
+
+async def test_batch_loader_limits():
+    batches = []
+
+    async def request(method, kwargs):
+        batches.append(kwargs["user_ids"])
+        return [{"id": int(user_id)} for user_id in kwargs["user_ids"].split(",")]
+
+    loader = BatchLoader(request, "users.get", "user_ids", max_batch_size=2, delay=1)
+
+    results = await asyncio.wait_for(loader.load_many([1, 2, 3, 4]), 0.5)
+
+    assert batches == ["1,2", "3,4"]
+    assert [result["id"] for result in results] == [1, 2, 3, 4]
+
+
+async def test_batch_loader_errors():
+    async def request(method, kwargs):
+        raise RequestException(None, method, kwargs, {"error": {"error_code": 100}})
+
+    loader = BatchLoader(request, "users.get", "user_ids")
+
+    results = await asyncio.gather(
+        loader.load(1), loader.load(2), return_exceptions=True
+    )
+
+    assert all(isinstance(result, RequestException) for result in results)
+
+
+async def test_batch_loader_unexpected_response():
+    async def request(method, kwargs):
+        return [{"id": 1}]
+
+    loader = BatchLoader(request, "groups.getById", "group_ids", items_key="groups")
+
+    results = await asyncio.wait_for(
+        asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True), 1
+    )
+
+    assert all(isinstance(result, TypeError) for result in results)
+
+
+async def test_vkontakte_loader():
+    backend = VkontakteLongpoll("token")
+    backend._start_requests_queue_handler()
+
+    codes = []
+
+    async def _direct_request(method, kwargs, token=None):
+        codes.append(kwargs["code"])
+        return [{"groups": [{"id": 1}, {"id": 2}], "profiles": []}]
+
+    backend._direct_request = _direct_request
+
+    async def get_group(group_id):
+        return await backend.loader("groups.getById", "group_ids").load(group_id)
+
+    try:
+        results = await asyncio.gather(get_group(1), get_group(2))
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert codes == ['return [API.groups.getById({"group_ids":"1,2"}),];']
+    assert results == [{"id": 1}, {"id": 2}]
+
+    assert backend.loader("groups.getById", "group_ids") is backend.loader(
+        "groups.getById", "group_ids"
+    )
+    assert backend.loader("users.get", "user_ids") is not backend.loader(
+        "users.get", "user_ids", {"fields": "sex"}
+    )
+    assert backend.loader("users.get", "user_ids") is not backend.loader(
+        "users.get", "user_ids", items_key="items"
+    )
+    assert backend.loader("groups.getById", "group_ids").items_key == "groups"
+
+
+async def test_vkontakte_loader_cancelled_caller():
+    async def request(method, kwargs):
+        await asyncio.sleep(0.01)
+        return [{"id": 1}]
+
+    loader = BatchLoader(request, "users.get", "user_ids")
+
+    first = asyncio.ensure_future(loader.load(1))
+    second = asyncio.ensure_future(loader.load(1))
+    await asyncio.sleep(0)
+
+    first.cancel()
+
+    assert await second == {"id": 1}
+
+    with pytest.raises(asyncio.CancelledError):
+        await first
@@ -3,9 +3,11 @@ import json
 import logging
 
 import httpx
+import pytest
 
 from kutana import Kutana, Plugin
 from kutana.backends.vkontakte import VkontakteLongpoll
+from kutana.exceptions import RequestException
 from kutana.update import Attachment, AttachmentKind
 
 # Load updates for simulating requests to telegram
@@ -113,3 +115,181 @@ async def test_vkontakte_longpoll():
         {},
     ) in client.requests
     assert ("https://api.vk.com/method/execute", None) in client.requests
+
+
+async def test_vkontakte_drain():
+    backend = VkontakteLongpoll("nicetoken")
+    backend._start_requests_queue_handler()
+
+    chunks = []
+
+    async def _direct_request(method, kwargs, token=None):
+        chunks.append(kwargs["code"].count("API."))
+        return [1] * chunks[-1]
+
+    backend._direct_request = _direct_request
+
+    futures = []
+
+    for _ in range(30):
+        future = asyncio.get_event_loop().create_future()
+        backend.requests_queue.append(("users.get", {}, future))
+        futures.append(future)
+
+    await backend.on_drain(None)
+
+    assert chunks == [25, 5]
+    assert all(future.result() == 1 for future in futures)
+    assert backend.requests_queue_handler.cancelled()
+
+
+async def test_vkontakte_lone_request():
+    backend = VkontakteLongpoll("nicetoken", requests_per_second=1)
+    backend._start_requests_queue_handler()
+
+    async def _direct_request(method, kwargs, token=None):
+        return [1] * kwargs["code"].count("API.")
+
+    backend._direct_request = _direct_request
+
+    try:
+        # Request is sent at once while rate limit allows it
+        assert await asyncio.wait_for(backend.request("users.get", {}), 0.5) == 1
+    finally:
+        backend.requests_queue_handler.cancel()
+
+
+async def test_vkontakte_execute_errors():
+    backend = VkontakteLongpoll("nicetoken", requests_per_second=100)
+    backend._start_requests_queue_handler()
+
+    codes = []
+
+    async def _direct_request(method, kwargs, token=None):
+        codes.append(kwargs["code"])
+
+        if len(codes) > 1:
+            return [2]
+
+        raise RequestException(
+            backend,
+            method,
+            kwargs,
+            {
+                "response": [1, False, False],
+                "execute_errors": [
+                    {"method": "users.get", "error_code": 6},
+                    {"method": "groups.get", "error_code": 100},
+                ],
+            },
+        )
+
+    backend._direct_request = _direct_request
+
+    requests = [
+        asyncio.ensure_future(backend.request("messages.send", {})),
+        asyncio.ensure_future(backend.request("users.get", {})),
+        asyncio.ensure_future(backend.request("groups.get", {})),
+    ]
+
+    try:
+        results = await asyncio.gather(*requests, return_exceptions=True)
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    # Only failed because of rate limit call is retried
+    assert codes[1] == "return [API.users.get({}),];"
+
+    assert results[0] == 1
+    assert results[1] == 2
+    assert isinstance(results[2], RequestException)
+    assert results[2].response == {"method": "groups.get", "error_code": 100}
+
+    assert backend.tokens_pool.tokens[0].limiter.rate < 100
+    assert not backend.requests_attempts
+
+
+async def test_vkontakte_execute_errors_by_method():
+    backend = VkontakteLongpoll("nicetoken", requests_per_second=100)
+    backend._start_requests_queue_handler()
+
+    codes = []
+
+    async def _direct_request(method, kwargs, token=None):
+        codes.append(kwargs["code"])
+
+        if len(codes) > 1:
+            return [1]
+
+        # Failed call of "users.get" returned "null" instead of "false"
+        raise RequestException(
+            backend,
+            method,
+            kwargs,
+            {
+                "response": [None, False],
+                "execute_errors": [
+                    {"method": "users.get", "error_code": 6},
+                    {"method": "groups.get", "error_code": 100},
+                ],
+            },
+        )
+
+    backend._direct_request = _direct_request
+
+    requests = [
+        asyncio.ensure_future(backend.request("users.get", {})),
+        asyncio.ensure_future(backend.request("groups.get", {})),
+    ]
+
+    try:
+        results = await asyncio.gather(*requests, return_exceptions=True)
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert codes[1] == "return [API.users.get({}),];"
+
+    assert results[0] == 1
+    assert results[1].response == {"method": "groups.get", "error_code": 100}
+
+
+async def test_vkontakte_execute_too_many_requests():
+    backend = VkontakteLongpoll(
+        "nicetoken", requests_per_second=100, requests_retries=2
+    )
+    backend._start_requests_queue_handler()
+
+    calls = []
+
+    async def _direct_request(method, kwargs, token=None):
+        calls.append(kwargs["code"])
+        raise RequestException(backend, method, kwargs, {"error": {"error_code": 6}})
+
+    backend._direct_request = _direct_request
+
+    try:
+        with pytest.raises(RequestException):
+            await backend.request("users.get", {})
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert len(calls) == 3
+    assert not backend.requests_attempts
+
+
+async def test_vkontakte_execute_network_error():
+    backend = VkontakteLongpoll("nicetoken")
+    backend._start_requests_queue_handler()
+
+    async def _direct_request(method, kwargs, token=None):
+        raise httpx.ConnectError("Oops")
+
+    backend._direct_request = _direct_request
+
+    try:
+        with pytest.raises(RequestException) as exc_info:
+            await asyncio.wait_for(backend.request("users.get", {}), 1)
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert isinstance(exc_info.value.exception, httpx.ConnectError)
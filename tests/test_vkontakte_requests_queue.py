@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from kutana.backends.vkontakte import RequestPriority, VkontakteLongpoll
+from kutana.backends.vkontakte.requests_queue import RequestsQueue
+from kutana.metrics import KutanaMetrics
+
+
+def test_priorities_order():
+    queue = RequestsQueue()
+
+    queue.append("low", RequestPriority.LOW)
+    queue.append("normal 1")
+    queue.append("high", RequestPriority.HIGH)
+    queue.append("normal 2", RequestPriority.NORMAL)
+
+    assert len(queue) == 4
+    assert queue.depths() == {
+        RequestPriority.HIGH: 1,
+        RequestPriority.NORMAL: 2,
+        RequestPriority.LOW: 1,
+    }
+
+    assert queue.popleft() == "high"
+    assert queue.last_priority == RequestPriority.HIGH
+    assert queue.last_wait_time >= 0
+
+    queue.extend_first(["retry 1", "retry 2"])
+
+    assert [queue.popleft() for _ in range(5)] == [
+        "retry 1",
+        "retry 2",
+        "normal 1",
+        "normal 2",
+        "low",
+    ]
+    assert queue.last_priority == RequestPriority.LOW
+    assert not queue
+
+    with pytest.raises(IndexError):
+        queue.popleft()
+
+
+def test_bad_priority():
+    queue = RequestsQueue()
+
+    with pytest.raises(ValueError):
+        queue.append("item", 10)
+
+    assert not queue
+
+
+async def test_waiting_for_items():
+    queue = RequestsQueue()
+
+    waiter = asyncio.ensure_future(queue.wait_not_empty())
+    await asyncio.sleep(0)
+
+    assert not waiter.done()
+
+    queue.extend_first(["retry"])
+
+    await asyncio.wait_for(waiter, 1)
+
+    assert queue.popleft() == "retry"
+    assert queue.last_priority is None
+
+    waiter = asyncio.ensure_future(queue.wait_not_empty())
+    await asyncio.sleep(0)
+
+    assert not waiter.done()
+    waiter.cancel()
+
+
+async def test_vkontakte_requests_priorities():
+    backend = VkontakteLongpoll("nicetoken")
+    backend._start_requests_queue_handler()
+    backend.metrics = KutanaMetrics()
+
+    codes = []
+
+    async def _direct_request(method, kwargs, token=None):
+        codes.append(kwargs["code"])
+        return [1] * kwargs["code"].count("API.")
+
+    backend._direct_request = _direct_request
+
+    # Rate limit is exhausted, so requests wait for the next chunk
+    await backend.tokens_pool.tokens[0].limiter.acquire()
+
+    requests = [
+        backend.request("users.get", {}, priority=RequestPriority.LOW),
+        backend.request("messages.send", {}),
+        backend.request("messages.sendMessageEventAnswer", {}),
+    ]
+
+    try:
+        assert await asyncio.wait_for(asyncio.gather(*requests), 1) == [1, 1, 1]
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert codes == [
+        "return [API.messages.sendMessageEventAnswer({}),"
+        "API.messages.send({}),API.users.get({}),];"
+    ]
+
+    rendered = backend.metrics.render()
+
+    for priority in ("high", "normal", "low"):
+        assert (
+            "kutana_request_queue_wait_seconds_count"
+            f'{{backend="vk",priority="{priority}"}} 1'
+        ) in rendered
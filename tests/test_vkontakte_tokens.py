@@ -0,0 +1,265 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from kutana.backends.vkontakte import VkontakteLongpoll
+from kutana.backends.vkontakte.tokens import NoTokensException, TokensPool
+from kutana.exceptions import RequestException
+
+
+def test_tokens_rotation():
+    pool = TokensPool(["token1", "token2"], 1)
+
+    assert pool.try_acquire().value == "token1"
+    assert pool.try_acquire().value == "token2"
+    assert pool.try_acquire() is None
+
+    assert [token.requests_count for token in pool.tokens] == [1, 1]
+
+
+def test_tokens_rotation_skips_unavailable():
+    pool = TokensPool(["token1", "token2", "token3"], 10)
+
+    assert pool.try_acquire().value == "token1"
+
+    pool.report_error(pool.tokens[0], 5)
+
+    # Order is kept when tokens are removed from rotation
+    assert pool.try_acquire().value == "token2"
+    assert pool.try_acquire().value == "token3"
+
+
+def test_tokens_health():
+    pool = TokensPool(["token1", "token2", "token3"], 10, pause=60)
+
+    token1, token2, token3 = pool.tokens
+
+    assert pool.report_error(token1, 5)
+    assert pool.report_error(token2, 29, "wall.search")
+    assert pool.report_error(token3, 6)
+    assert not pool.report_error(token3, 100)
+
+    assert token1.disabled
+    assert not token2.disabled
+    assert not token2.is_available("wall.search")
+    assert token2.is_available("users.get")
+    assert pool.active_tokens == [token2, token3]
+    assert token3.limiter.rate < 10
+    assert token3.errors_count == 2
+    assert token3.last_error_code == 100
+
+
+async def test_no_tokens():
+    pool = TokensPool(["token1"], 10)
+
+    pool.report_error(pool.tokens[0], 27)
+
+    with pytest.raises(NoTokensException):
+        await pool.acquire()
+
+
+async def test_paused_method():
+    pool = TokensPool(["token1"], 10)
+
+    pool.report_error(pool.tokens[0], 29, "wall.search")
+
+    with pytest.raises(NoTokensException):
+        await pool.acquire("wall.search")
+
+    assert await pool.acquire("users.get") is pool.tokens[0]
+
+
+def test_bad_tokens():
+    with pytest.raises(ValueError):
+        VkontakteLongpoll([])
+
+    with pytest.raises(ValueError):
+        VkontakteLongpoll(["token", ""])
+
+    with pytest.raises(ValueError):
+        VkontakteLongpoll("token", user_methods=["wall.search"])
+
+
+async def test_vkontakte_tokens_pool():
+    backend = VkontakteLongpoll(["token1", "token2"], requests_per_second=1)
+    backend._start_requests_queue_handler()
+
+    tokens = []
+
+    async def _direct_request(method, kwargs, token=None):
+        tokens.append(token)
+
+        if token == "token1":
+            raise RequestException(
+                backend, method, kwargs, {"error": {"error_code": 5}}
+            )
+
+        return [1] * kwargs["code"].count("API.")
+
+    backend._direct_request = _direct_request
+
+    try:
+        # Request is retried with another token at once
+        assert await asyncio.wait_for(backend.request("users.get", {}), 0.5) == 1
+        assert await asyncio.wait_for(backend.request("users.get", {}), 1.5) == 1
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert tokens == ["token1", "token2", "token2"]
+    assert backend.tokens_pool.tokens[0].disabled
+    assert not backend.requests_attempts
+
+
+async def test_vkontakte_no_tokens():
+    backend = VkontakteLongpoll("token")
+    backend._start_requests_queue_handler()
+
+    async def _direct_request(method, kwargs, token=None):
+        raise RequestException(backend, method, kwargs, {"error": {"error_code": 5}})
+
+    backend._direct_request = _direct_request
+
+    try:
+        with pytest.raises(RequestException) as exc_info:
+            await asyncio.wait_for(backend.request("users.get", {}), 1)
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert isinstance(exc_info.value.exception, NoTokensException)
+
+
+async def test_vkontakte_user_tokens():
+    backend = VkontakteLongpoll(
+        "token",
+        user_tokens=["user1", "user2"],
+        user_methods=["wall.search"],
+    )
+    backend._start_requests_queue_handler()
+
+    requests = []
+
+    async def _direct_request(method, kwargs, token=None):
+        requests.append((method, token))
+
+        if token == "user1":
+            raise RequestException(
+                backend, method, kwargs, {"error": {"error_code": 29}}
+            )
+
+        if method == "execute":
+            return [1]
+
+        return kwargs["query"]
+
+    backend._direct_request = _direct_request
+
+    try:
+        assert await backend.request("wall.search", {"query": "hey"}) == "hey"
+        assert await backend.request("users.get", {}) == 1
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert requests == [
+        ("wall.search", "user1"),
+        ("wall.search", "user2"),
+        ("execute", "token"),
+    ]
+    user1, user2 = backend.user_tokens_pool.tokens
+
+    assert not user1.is_available("wall.search")
+    assert user1.is_available("wall.get")
+    assert user2.is_available("wall.search")
+
+
+async def test_vkontakte_paused_methods():
+    backend = VkontakteLongpoll(["token1", "token2"])
+    backend._start_requests_queue_handler()
+
+    token1, token2 = backend.tokens_pool.tokens
+
+    backend.tokens_pool.report_error(token1, 29, "wall.get")
+    backend.tokens_pool.report_error(token2, 29, "wall.search")
+
+    codes = []
+
+    async def _direct_request(method, kwargs, token=None):
+        codes.append((token, kwargs["code"]))
+        return [1] * kwargs["code"].count("API.")
+
+    backend._direct_request = _direct_request
+
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                backend.request("wall.get", {}),
+                backend.request("users.get", {}),
+                backend.request("wall.search", {}),
+            ),
+            1,
+        )
+
+        # Methods paused for every token are failed at once
+        backend.tokens_pool.report_error(token2, 29, "wall.get")
+
+        with pytest.raises(RequestException) as exc_info:
+            await asyncio.wait_for(backend.request("wall.get", {}), 1)
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    assert results == [1, 1, 1]
+    assert codes == [
+        ("token1", "return [API.users.get({}),API.wall.search({}),];"),
+        ("token2", "return [API.wall.get({}),];"),
+    ]
+    assert isinstance(exc_info.value.exception, NoTokensException)
+
+
+async def test_vkontakte_token_not_in_exceptions():
+    backend = VkontakteLongpoll(
+        "secret1", user_tokens=["secret2"], user_methods=["wall.search"]
+    )
+    backend._start_requests_queue_handler()
+
+    response = Mock(json=Mock(return_value={"error": {"error_code": 100}}))
+    backend.client.post = AsyncMock(return_value=response)
+
+    try:
+        with pytest.raises(RequestException) as group_exc_info:
+            await asyncio.wait_for(backend.request("users.get", {}), 1)
+
+        with pytest.raises(RequestException) as user_exc_info:
+            await asyncio.wait_for(backend.request("wall.search", {}), 1)
+    finally:
+        backend.requests_queue_handler.cancel()
+
+    for exc_info in (group_exc_info, user_exc_info):
+        exception = exc_info.value
+
+        while exception is not None:
+            assert "secret" not in repr(exception.kwargs)
+            exception = exception.exception
+
+    # Token is still sent with the request
+    urls = [call.args[0] for call in backend.client.post.call_args_list]
+
+    assert "access_token=secret1" in urls[0]
+    assert "access_token=secret2" in urls[1]
+    assert all(
+        "access_token" not in call.kwargs["data"]
+        for call in backend.client.post.call_args_list
+    )
+
+
+async def test_vkontakte_api_token():
+    backend = VkontakteLongpoll(["token1", "token2"])
+
+    assert backend.api_token == "token1"
+
+    backend._start_requests_queue_handler()
+    backend.requests_queue_handler.cancel()
+
+    backend.tokens_pool.report_error(backend.tokens_pool.tokens[0], 5)
+
+    # Disabled token is not used for longpoll and other direct requests
+    assert backend.api_token == "token2"